@@ -0,0 +1,171 @@
+import contextlib
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import pandas as pd
+from benchmarks.fakes import assets_db, offline
+from benchmarks.fixtures import synthetic_prices, synthetic_actions, market_returns, market_seed, scale_fixture
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# (tickers, years) grids; "quick" is meant for every change, "full" before a release
+SCALES = {
+    "quick": [(10, 1), (100, 5)],
+    "full": [(10, 1), (10, 20), (100, 5), (100, 20), (1000, 1), (1000, 20)],
+}
+
+
+def _pnl_case(prices, actions, m_data):
+    from portfolio.helpers import get_pnl
+    parsed = {t: pd.Series({pd.to_datetime(d): q for d, q in a.items()}, dtype=float) for t, a in actions.items()}
+    closes = {t: prices[t].dropna() for t in actions}
+
+    def run():
+        for t in parsed:
+            get_pnl(parsed[t], closes[t])
+    return run
+
+
+def _portfolio_case(prices, actions, m_data):
+    from portfolio import Portfolio
+    db = assets_db(list(actions))
+
+    def run():
+        Portfolio(actions, 1_000_000, db, m_data=m_data).get_info()
+    return run
+
+
+def _market_data_case(prices, actions, m_data):
+    from market_data import MarketDataManager
+    seed = market_seed(m_data["market_returns"], m_data["rfr"])
+
+    def run():
+        # Cold process: seed JSON -> binary snapshot -> memory map -> get_data
+        with tempfile.TemporaryDirectory(prefix="bench_market_") as tmp:
+            seed_file = os.path.join(tmp, "market_data.json")
+            with open(seed_file, "w") as f:
+                json.dump(seed, f)
+            MarketDataManager(os.path.join(tmp, "market_data.bin"), seed_file, blob=None).get_data()
+    return run
+
+
+def _compare_case(prices, actions, m_data):
+    import main
+    tickers = list(prices.columns)
+
+    def run():
+        # The endpoint's own path on a cache miss: compare entries and the correlation
+        # engine start empty, closes come from the (warm) price store
+        main._compare_cache.l1.clear()
+        main._corr_engine = None
+        main.compare_response(tickers, "json", None)
+    return run
+
+
+# name -> builder(prices, actions, m_data) returning the zero-argument callable to time
+CASES = {
+    "get_pnl": _pnl_case,
+    "portfolio.get_info": _portfolio_case,
+    "market_data.get_data": _market_data_case,
+    "compare": _compare_case,
+}
+
+
+def measure(fn, repeat=3, warmup=1):
+    """
+    Time `fn` and record its peak traced memory.
+
+    Timing runs go without tracemalloc (it slows allocation-heavy code
+    several-fold); one extra traced run gives the peak.
+
+    Returns:
+        dict with 'min', 'median' (seconds) and 'peakMB'
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(warmup):
+            fn()
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {"min": min(times), "median": statistics.median(times), "peakMB": peak / 2**20}
+
+
+def run(cases=None, scales=None, fixture=None, repeat=3):
+    """
+    Run every case at every (tickers, years) scale, fully offline.
+
+    Parameters:
+        cases: list of CASES names (defaults to all)
+        scales: list of (tickers, years) pairs (defaults to SCALES["quick"])
+        fixture: optional recorded price DataFrame (see fixtures.record_fixture);
+            synthetic prices are generated when omitted
+        repeat: timed runs per case
+
+    Returns:
+        dict of "case[tickers=N,years=Y]" -> measure() result plus 'upstreamCalls'
+    """
+    results = {}
+    for n_tickers, years in scales or SCALES["quick"]:
+        if fixture is None:
+            prices = synthetic_prices(n_tickers, years)
+        else:
+            prices = scale_fixture(fixture, n_tickers, years)
+        actions = synthetic_actions(prices)
+        m_data = {"market_returns": market_returns(prices), "rfr": 0.04,
+                  "last_update": datetime.now().strftime("%Y-%m-%d")}
+        # ^GSPC is served as well, so compare gets its market series
+        served = prices.assign(**{"^GSPC": 100 * (1 + m_data["market_returns"]).cumprod()})
+        for name in cases or list(CASES):
+            with offline(served) as upstream:
+                result = measure(CASES[name](prices, actions, m_data), repeat=repeat)
+                result["upstreamCalls"] = upstream.calls
+            key = f"{name}[tickers={n_tickers},years={years}]"
+            results[key] = result
+            print(f"[INFO] {key}: median {result['median'] * 1e3:.1f} ms, "
+                  f"min {result['min'] * 1e3:.1f} ms, peak {result['peakMB']:.1f} MB")
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Flag results slower or hungrier than the baseline by more than `tolerance`.
+
+    Returns:
+        list of (key, metric, baseline value, current value) regressions
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        for metric in ("median", "peakMB"):
+            if result[metric] > base[metric] * (1 + tolerance):
+                regressions.append((key, metric, base[metric], result[metric]))
+    return regressions
+
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    """Merge `results` into the stored baseline (other scales are kept)."""
+    baseline = load_baseline(path)
+    baseline.update(results)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
@@ -0,0 +1,80 @@
+"""
+Offline benchmarks for the functions compute paths.
+
+    python -m benchmarks                       # quick scales, compare to baseline.json
+    python -m benchmarks --scale full          # 10-1000 tickers, 1-20 years
+    python -m benchmarks --save                # record the current numbers as the baseline
+    python -m benchmarks --record fixture.npz --tickers AAPL MSFT ...   # needs network
+    python -m benchmarks --fixture fixture.npz # run on recorded prices
+    python -m benchmarks --startup             # cold import cost per endpoint
+    python -m benchmarks.load --help           # concurrent load test of the HTTP functions
+
+Exits with status 1 when a case regresses past --tolerance, and with status 2
+when there is no baseline to compare against (cases missing from it are listed).
+
+The baseline is machine-specific, so it is only recorded on the reference
+machine: an otherwise idle 1 vCPU / 2 GB Linux box (the Cloud Functions
+default instance size) with requirements.txt installed. On it, run
+
+    python -m benchmarks --repeat 5 --save
+    python -m benchmarks --scale full --repeat 5 --save
+
+and commit benchmarks/baseline.json. Re-record it the same way when a change
+is meant to move the numbers.
+"""
+import argparse
+import sys
+from benchmarks import CASES, SCALES, BASELINE_FILE, run, compare, load_baseline, save_baseline
+from benchmarks.fixtures import load_fixture, record_fixture
+from benchmarks.startup import measure_startup
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--case", action="append", choices=list(CASES), help="case to run (repeatable)")
+    parser.add_argument("--scale", choices=list(SCALES), default="quick")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fixture", help="recorded .npz prices to run on instead of synthetic ones")
+    parser.add_argument("--record", help="download real prices for --tickers into this .npz and exit")
+    parser.add_argument("--tickers", nargs="*", default=[])
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--startup", action="store_true", help="measure cold import cost per endpoint and exit")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        measure_startup(repeat=args.repeat)
+        return 0
+
+    if args.record:
+        prices = record_fixture(args.record, args.tickers, args.years)
+        print(f"[INFO] Recorded {prices.shape[1]} tickers x {prices.shape[0]} days to {args.record}")
+        return 0
+
+    fixture = load_fixture(args.fixture) if args.fixture else None
+    results = run(args.case, SCALES[args.scale], fixture, args.repeat)
+
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f"[INFO] Baseline written to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"[WARNING] No baseline at {args.baseline}, nothing was checked for regressions "
+              f"(record one on the reference machine with --save, see python -m benchmarks --help)")
+        return 2
+    unchecked = [key for key in results if key not in baseline]
+    if unchecked:
+        print(f"[WARNING] Not in the baseline, not checked: {', '.join(unchecked)}")
+    regressions = compare(results, baseline, args.tolerance)
+    for key, metric, base, current in regressions:
+        print(f"[REGRESSION] {key} {metric}: {base:.4g} -> {current:.4g}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
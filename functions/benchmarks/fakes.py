@@ -0,0 +1,318 @@
+import contextlib
+import operator
+import random
+import tempfile
+import threading
+import time
+import pandas as pd
+import price_store
+from gateway import Gateway, set_gateway
+from price_store import PriceStore
+
+
+class FakeDocument:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+def _apply(doc, data, paths=True):
+    """
+    Write fields into a copy of a document dict, resolving the
+    Increment/DELETE_FIELD sentinels and (for updates) dotted field paths.
+    Nested maps on the way are copied, so documents handed out earlier never change.
+    """
+    from google.cloud.firestore_v1 import transforms
+    doc = dict(doc)
+    for key, value in data.items():
+        *parents, field = key.split(".") if paths else (key,)
+        target = doc
+        for part in parents:
+            target[part] = dict(target.get(part) or {})
+            target = target[part]
+        if value is transforms.DELETE_FIELD:
+            target.pop(field, None)
+        elif isinstance(value, transforms.Increment):
+            target[field] = target.get(field, 0) + value.value
+        else:
+            target[field] = value
+    return doc
+
+
+class FakeDocumentReference:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path[-1]
+
+    def get(self, transaction=None):
+        self._db.reads += 1
+        return FakeDocument(self.id, self._db.docs.get(self.path))
+
+    def set(self, data, merge=False):
+        self._db.writes += 1
+        existing = (self._db.docs.get(self.path) or {}) if merge else {}
+        self._db.docs[self.path] = _apply(existing, data, paths=False)
+
+    def update(self, data):
+        self._db.writes += 1
+        self._db.docs[self.path] = _apply(self._db.docs.get(self.path) or {}, data)
+
+    def delete(self):
+        self._db.writes += 1
+        self._db.docs.pop(self.path, None)
+
+    def collection(self, name):
+        return FakeCollection(self._db, self.path + (name,))
+
+
+_OPERATORS = {"==": operator.eq, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+class FakeCollection:
+    """A collection, and a query over it once where/order_by/select/limit are chained on."""
+
+    def __init__(self, db, path, filters=(), order=None, fields=None, limit=None):
+        self._db = db
+        self.path = path
+        self._filters = filters
+        self._order = order
+        self._fields = fields
+        self._limit = limit
+
+    def _query(self, **changes):
+        options = dict(filters=self._filters, order=self._order, fields=self._fields, limit=self._limit)
+        options.update(changes)
+        return FakeCollection(self._db, self.path, **options)
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self._db, self.path + (doc_id,))
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._query(filters=self._filters + ((field, _OPERATORS[op], value),))
+
+    def order_by(self, field):
+        return self._query(order=field)
+
+    def select(self, fields):
+        return self._query(fields=set(fields))
+
+    def limit(self, n):
+        return self._query(limit=n)
+
+    def stream(self):
+        docs = [self.document(p[-1]).get() for p in list(self._db.docs) if p[:-1] == self.path]
+        docs = [d for d in docs if d.exists and all(
+            field in d._data and op(d._data[field], value) for field, op, value in self._filters)]
+        if self._order is not None:
+            docs.sort(key=lambda d: d._data[self._order])
+        if self._fields is not None:
+            docs = [FakeDocument(d.id, {k: v for k, v in d._data.items() if k in self._fields}) for d in docs]
+        yield from docs[:self._limit]
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, ref, data):
+        self._ops.append((ref.set, data))
+
+    def update(self, ref, data):
+        self._ops.append((ref.update, data))
+
+    def delete(self, ref):
+        self._ops.append((lambda _: ref.delete(), None))
+
+    def commit(self):
+        for op, data in self._ops:
+            op(data)
+        self._ops = []
+
+
+class FakeTransaction:
+    """
+    Runs under firestore.transactional: writes are buffered and applied on
+    commit, and transactions on the same FakeFirestore run one at a time
+    (a pessimistic stand-in for Firestore's optimistic retries).
+    """
+
+    _read_only = False
+    _max_attempts = 1
+
+    def __init__(self, db):
+        self._db = db
+        self._id = None
+        self._ops = []
+
+    def _clean_up(self):
+        self._ops = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._db.lock.acquire()
+        self._id = id(self)
+
+    def _commit(self):
+        try:
+            for op, data in self._ops:
+                op(data)
+        finally:
+            self._clean_up()
+            self._db.lock.release()
+
+    def _rollback(self):
+        if self._id is not None:
+            self._clean_up()
+            self._db.lock.release()
+
+    def set(self, ref, data, merge=False):
+        self._ops.append((lambda d: ref.set(d, merge=merge), data))
+
+    def create(self, ref, data):
+        self._ops.append((ref.set, data))
+
+    def update(self, ref, data):
+        self._ops.append((ref.update, data))
+
+
+class FakeFirestore:
+    """
+    In-memory stand-in for the parts of the Firestore client the functions use:
+    db.collection(...).document(...), get/set/update/delete, simple queries
+    (where/order_by/select/limit), db.get_all, db.batch and db.transaction.
+    Reads and writes are counted so a benchmark can report them.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, (name,))
+
+    def get_all(self, refs, field_paths=None):
+        fields = None if field_paths is None else {f.strip("`") for f in field_paths}
+        for ref in refs:
+            doc = ref.get()
+            if fields is not None and doc.exists:
+                doc = FakeDocument(doc.id, {k: v for k, v in doc.to_dict().items() if k in fields})
+            yield doc
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+
+def assets_db(tickers):
+    """FakeFirestore pre-filled with an `assets` document per ticker."""
+    db = FakeFirestore()
+    for i, ticker in enumerate(tickers):
+        db.collection("assets").document(ticker).set({
+            "name": ticker,
+            "asset-class": "Equity" if i % 5 else "ETF",
+            "sector": ["Technology", "Healthcare", "Energy", "Financials"][i % 4],
+            "yield": 0.01 * (i % 4),
+            "cagr": 0.05 + 0.01 * (i % 7),
+        })
+    return db
+
+
+class _FakeTicker:
+    def __init__(self, source, ticker):
+        self._source = source
+        self._ticker = ticker
+
+    def history(self, start=None, end=None, interval="1d", period=None):
+        self._source.calls += 1
+        self._source._wait()
+        return pd.DataFrame({"Close": self._source.closes(self._ticker, start, end)})
+
+    @property
+    def fast_info(self):
+        self._source.calls += 1
+        self._source._wait()
+        close = self._source.closes(self._ticker, None, None)
+        if close.empty:
+            return {"lastPrice": 4.0, "previousClose": 4.0, "yearHigh": 4.0, "yearLow": 4.0}
+        year = close.iloc[-252:]
+        return {"lastPrice": float(close.iloc[-1]), "previousClose": float(close.iloc[-2]),
+                "yearHigh": float(year.max()), "yearLow": float(year.min())}
+
+
+class FakeYFinance:
+    """
+    Serves yf.download and yf.Ticker from a fixed (synthetic or recorded)
+    price frame; counts upstream calls.
+
+    Each call can be delayed by `latency` seconds plus up to `jitter` more,
+    to stand in for the round trip to Yahoo.
+    """
+
+    def __init__(self, prices, latency=0.0, jitter=0.0, seed=0):
+        self.prices = prices
+        self.calls = 0
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def _wait(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.jitter * self._random.random())
+
+    def closes(self, ticker, start, end):
+        if ticker not in self.prices:
+            return pd.Series(dtype=float)
+        close = self.prices[ticker].dropna()
+        if start is not None:
+            close = close[close.index >= pd.Timestamp(start)]
+        if end is not None:
+            close = close[close.index < pd.Timestamp(end)]
+        return close
+
+    def download(self, tickers, start=None, interval="1d", period=None, **kwargs):
+        self.calls += 1
+        self._wait()
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        if period is not None and period.endswith("y"):
+            start = self.prices.index[-1] - pd.DateOffset(years=int(period[:-1]))
+        close = pd.DataFrame({t: self.closes(t, start, None) for t in tickers if t in self.prices})
+        if close.empty:
+            return pd.DataFrame()
+        return pd.concat({"Close": close, "High": close * 1.01, "Low": close * 0.99}, axis=1)
+
+    def Ticker(self, symbol):
+        return _FakeTicker(self, symbol)
+
+
+@contextlib.contextmanager
+def offline(prices):
+    """
+    Route the market data gateway to `prices` and give the price store a fresh temp directory.
+
+    Yields the FakeYFinance so callers can read its call count.
+    """
+    fake = FakeYFinance(prices)
+    saved = price_store._store
+    with tempfile.TemporaryDirectory(prefix="bench_store_") as store_dir:
+        previous = set_gateway(Gateway(client=fake, rate=1e9, burst=10**9, batch_window=0))
+        price_store._store = PriceStore(store_dir)
+        try:
+            yield fake
+        finally:
+            set_gateway(previous)
+            price_store._store = saved
@@ -0,0 +1,118 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+FIXTURE_END = "2026-01-02"
+
+
+def synthetic_prices(n_tickers, years, seed=0, end=FIXTURE_END):
+    """
+    Geometric-random-walk daily closes on a business-day calendar.
+
+    Roughly 1 in 5 tickers starts late (as listings do), so the aligned frame
+    has leading NaNs like a real yf.download of a mixed basket.
+
+    Parameters:
+        n_tickers: number of columns
+        years: length of the history
+        seed: random seed, the same seed always gives the same frame
+
+    Returns:
+        pd.DataFrame of closes indexed by date, columns T0000, T0001, ...
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=end, periods=int(round(years * 252)))
+    drift = rng.normal(0.0003, 0.0002, n_tickers)
+    vol = rng.uniform(0.008, 0.03, n_tickers)
+    steps = rng.standard_normal((len(index), n_tickers)) * vol + drift
+    closes = 100 * np.exp(np.cumsum(steps, axis=0))
+
+    late = rng.random(n_tickers) < 0.2
+    starts = np.where(late, rng.integers(0, max(1, len(index) // 2), n_tickers), 0)
+    closes[np.arange(len(index))[:, None] < starts[None, :]] = np.nan
+    return pd.DataFrame(closes, index=index, columns=[f"T{i:04d}" for i in range(n_tickers)])
+
+
+def synthetic_actions(prices, trades_per_ticker=8, seed=0):
+    """
+    Random buy/sell history per ticker, in the {ticker: {iso date: shares}} shape Firestore stores.
+
+    Trades fall on listed days only and never sell more than is held.
+    """
+    rng = np.random.default_rng(seed)
+    actions = {}
+    for ticker in prices.columns:
+        listed = prices.index[prices[ticker].notna()]
+        if len(listed) == 0:
+            continue
+        days = np.sort(rng.choice(len(listed), min(trades_per_ticker, len(listed)), replace=False))
+        held, trades = 0.0, {}
+        for k, day in enumerate(days):
+            qty = float(rng.integers(1, 20)) if k == 0 or held == 0 or rng.random() < 0.6 else -float(rng.integers(1, held + 1))
+            held += qty
+            stamp = listed[day] + pd.Timedelta(hours=int(rng.integers(10, 16)))
+            trades[stamp.isoformat()] = qty
+        actions[ticker] = trades
+    return actions
+
+
+def market_returns(prices):
+    """Equal-weight daily returns of the fixture, used as the market series."""
+    return prices.pct_change().mean(axis=1).dropna()
+
+
+def market_seed(returns, rfr=0.04):
+    """Market data seed JSON (as market_data.json stores it) for a return series, dated today."""
+    return {
+        "market_returns": dict(zip(returns.index.strftime("%Y-%m-%d"), returns.tolist())),
+        "rfr": rfr,
+        "last_update": datetime.now().strftime("%Y-%m-%d"),
+    }
+
+
+def load_fixture(path):
+    """Load closes written by record_fixture as a DataFrame."""
+    with np.load(path, allow_pickle=False) as f:
+        index = pd.DatetimeIndex(f["dates"].astype("datetime64[ns]"))
+        return pd.DataFrame(f["closes"], index=index, columns=[str(t) for t in f["tickers"]])
+
+
+def record_fixture(path, tickers, years=20):
+    """
+    Download real daily closes once and save them for offline benchmark runs.
+
+    Parameters:
+        path: target .npz file
+        tickers: list of ticker symbols
+        years: history length
+
+    Returns:
+        the recorded pd.DataFrame
+    """
+    from price_store import fetch_many
+
+    start = pd.Timestamp.now().normalize() - pd.DateOffset(years=years)
+    fresh = fetch_many(list(tickers), start, interval="1d")
+    prices = pd.DataFrame(fresh).sort_index()
+    np.savez_compressed(
+        path,
+        dates=prices.index.values.astype("datetime64[ns]").astype(np.int64),
+        tickers=np.array(prices.columns, dtype=str),
+        closes=prices.values.astype(np.float64),
+    )
+    return prices
+
+
+def scale_fixture(prices, n_tickers, years):
+    """
+    Cut a fixture down to `n_tickers` columns and the last `years` of history.
+
+    A recorded fixture with fewer tickers than asked for is widened with
+    renamed copies of its columns so every scale can still run.
+    """
+    prices = prices[prices.index >= prices.index[-1] - pd.DateOffset(years=years)]
+    columns = list(prices.columns)
+    if n_tickers > len(columns):
+        copies = [prices.rename(columns=lambda t, k=k: f"{t}.{k}") for k in range(1, -(-n_tickers // len(columns)))]
+        prices = pd.concat([prices] + copies, axis=1)
+    return prices.iloc[:, :n_tickers]
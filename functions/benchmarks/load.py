@@ -0,0 +1,406 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib import error, parse, request as urlrequest
+import numpy as np
+import pandas as pd
+from benchmarks.fakes import FakeYFinance, assets_db
+from benchmarks.fixtures import synthetic_prices, synthetic_actions, market_returns, market_seed, load_fixture, scale_fixture
+
+ENDPOINTS = ("get_fast_data", "get_compare_info", "get_portfolio_data", "portfolio_action")
+# Share of requests per endpoint
+DEFAULT_MIX = {"get_fast_data": 5, "get_compare_info": 2, "get_portfolio_data": 2, "portfolio_action": 1}
+# Ticker popularity is Zipf-distributed: the k-th most popular ticker is requested ~1/k**ZIPF_EXPONENT as often
+ZIPF_EXPONENT = 1.1
+# Every LARGE_EVERY-th portfolio holds --large-tickers tickers, the others 3-10
+LARGE_EVERY = 5
+PERCENTILES = (50, 90, 99)
+
+
+def _zipf(n, rng):
+    """Popularity weights of n items in a random order."""
+    weights = 1.0 / np.arange(1, n + 1) ** ZIPF_EXPONENT
+    return rng.permutation(weights / weights.sum())
+
+
+def build_world(universe=200, years=5, portfolios=20, large_tickers=100, fixture=None, seed=0):
+    """
+    Prices, a seeded in-memory Firestore and ticker popularity for a load test.
+
+    Every LARGE_EVERY-th portfolio is large; the first half of the
+    portfolios keep a legacy actions map, the rest are compacted into a
+    trade log checkpoint (see trades.log), so both read paths are exercised.
+
+    Parameters:
+        universe: tickers with prices (plus ^GSPC)
+        years: price history length
+        portfolios: portfolio documents to create
+        large_tickers: tickers held by a large portfolio
+        fixture: optional recorded price DataFrame (see fixtures.record_fixture)
+        seed: random seed; the same arguments always build the same world
+
+    Returns:
+        dict with 'prices', 'db', 'tickers', 'popularity' and 'portfolios' (ids)
+    """
+    from trades.log import compact
+
+    rng = np.random.default_rng(seed)
+    if fixture is None:
+        prices = synthetic_prices(universe, years, seed=seed, end=pd.Timestamp.now().normalize())
+    else:
+        prices = scale_fixture(fixture, universe, years)
+    tickers = list(prices.columns)
+    prices = prices.assign(**{"^GSPC": 100 * (1 + market_returns(prices)).cumprod()})
+    popularity = _zipf(len(tickers), rng)
+
+    db = assets_db(tickers)
+    ids = []
+    for i in range(portfolios):
+        size = large_tickers if i % LARGE_EVERY == 0 else int(rng.integers(3, 11))
+        held = list(rng.choice(tickers, min(size, len(tickers)), replace=False, p=popularity))
+        actions = synthetic_actions(prices[held], seed=seed + i)
+        portfolio_id = f"load-{i:04d}"
+        db.collection("portfolios").document(portfolio_id).set({
+            "initialCash": 10_000_000,
+            "cash": 10_000_000,
+            "shares": {t: sum(a.values()) for t, a in actions.items()},
+            "actions": actions,
+        })
+        if i >= portfolios // 2:
+            compact(db, portfolio_id)
+        ids.append(portfolio_id)
+    db.reads = db.writes = 0
+    return {"prices": prices, "db": db, "tickers": tickers, "popularity": popularity, "portfolios": ids}
+
+
+def make_requests(world, n, mix=None, seed=0):
+    """
+    A mixed request sequence over a world from build_world.
+
+    - get_fast_data: mostly single popular tickers, some 5-20 ticker watchlists
+    - get_compare_info: a small pool of popular baskets, often with one ticker
+      swapped, so baskets overlap without always repeating
+    - get_portfolio_data: any portfolio, some downsampled, a few with risk
+    - portfolio_action: 1-3 trades in popular tickers
+
+    Returns:
+        list of (endpoint, method, query pairs, JSON body or None)
+    """
+    rng = np.random.default_rng(seed)
+    mix = mix or DEFAULT_MIX
+    names = [e for e in ENDPOINTS if mix.get(e)]
+    shares = np.array([mix[e] for e in names], dtype=float)
+    tickers, popularity = world["tickers"], world["popularity"]
+
+    def popular(k):
+        return [str(t) for t in rng.choice(tickers, min(k, len(tickers)), replace=False, p=popularity)]
+
+    baskets = [popular(int(rng.integers(3, 6))) for _ in range(max(8, n // 50))]
+    basket_weights = _zipf(len(baskets), rng)
+
+    requests = []
+    for endpoint in rng.choice(names, n, p=shares / shares.sum()):
+        if endpoint == "get_fast_data":
+            picked = popular(1) if rng.random() < 0.7 else popular(int(rng.integers(5, 21)))
+            requests.append((endpoint, "GET", [("t", t) for t in picked], None))
+        elif endpoint == "get_compare_info":
+            basket = list(baskets[rng.choice(len(baskets), p=basket_weights)])
+            if rng.random() < 0.5:
+                extra = popular(1)[0]
+                if extra not in basket:
+                    basket[int(rng.integers(len(basket)))] = extra
+            query = [("t", t) for t in basket]
+            if rng.random() < 0.5:
+                query.append(("points", "200"))
+            requests.append((endpoint, "GET", query, None))
+        elif endpoint == "get_portfolio_data":
+            query = [("t", str(rng.choice(world["portfolios"])))]
+            roll = rng.random()
+            if roll < 0.05:
+                query += [("risk", "bootstrap"), ("paths", "2000")]
+            elif roll < 0.5:
+                query.append(("points", "250"))
+            requests.append((endpoint, "GET", query, None))
+        else:
+            trades = [{"ticker": t, "shares": int(rng.integers(1, 6)) * (1 if rng.random() < 0.7 else -1)}
+                      for t in popular(int(rng.integers(1, 4)))]
+            body = {"portfolioId": str(rng.choice(world["portfolios"])), "trades": trades}
+            requests.append((endpoint, "POST", [], body))
+    return requests
+
+
+@contextlib.contextmanager
+def local_backend(world, latency=0.05, jitter=0.1, upstream_rate=None, seed=0):
+    """
+    Point main's handlers at the world: Firestore stand-in, fake upstream
+    behind a real Gateway (production rate limits unless `upstream_rate`
+    is given), a fresh price store, today's market data and a universe
+    matrix built from the world's prices. Caches start empty.
+
+    Yields the FakeYFinance, whose call count is the upstream load.
+    """
+    import covariance
+    import main
+    import market_data
+    import price_store
+    from gateway import GATEWAY_RATE, Gateway, set_gateway
+    from price_store import PriceStore
+
+    prices = world["prices"]
+    fake = FakeYFinance(prices, latency=latency, jitter=jitter, seed=seed)
+    saved = (main._db, price_store._store, market_data._manager, covariance._matrix, covariance._matrix_checked)
+    with tempfile.TemporaryDirectory(prefix="load_") as tmp:
+        seed_file = os.path.join(tmp, "market_data.json")
+        with open(seed_file, "w") as f:
+            json.dump(market_seed(market_returns(prices.drop(columns="^GSPC"))), f)
+        previous = set_gateway(Gateway(client=fake, rate=upstream_rate or GATEWAY_RATE))
+        price_store._store = PriceStore(os.path.join(tmp, "prices"))
+        market_data._manager = market_data.MarketDataManager(os.path.join(tmp, "market_data.bin"), seed_file, blob=None)
+        covariance._matrix = covariance.build(covariance.weekly_returns(prices))
+        covariance._matrix_checked = time.time()
+        main._db = world["db"]
+        for cache in (main._quote_cache, main._compare_cache, main._compare_result_cache):
+            cache.l1.clear()
+        try:
+            yield fake
+        finally:
+            set_gateway(previous)
+            main._db, price_store._store, market_data._manager, covariance._matrix, covariance._matrix_checked = saved
+
+
+class InProcessClient:
+    """Calls main's handlers directly with a Flask request context, as the functions runtime does."""
+
+    def __init__(self):
+        import main
+        from flask import Flask
+        self.main = main
+        self.app = Flask("load")
+
+    def send(self, endpoint, method, query, body):
+        from flask import request
+        with self.app.test_request_context("/?" + parse.urlencode(query), method=method, json=body):
+            response = getattr(self.main, endpoint)(request)
+        return response.status_code, response.headers.get("Server-Timing", "")
+
+
+class HttpClient:
+    """Sends requests to <url>/<endpoint>, e.g. a server started with --serve."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def send(self, endpoint, method, query, body):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urlrequest.Request(f"{self.url}/{endpoint}?{parse.urlencode(query)}", data=data, method=method,
+                                 headers={"Content-Type": "application/json"} if data else {})
+        try:
+            with urlrequest.urlopen(req, timeout=300) as response:
+                response.read()
+                return response.status, response.headers.get("Server-Timing", "")
+        except error.HTTPError as e:
+            return e.code, e.headers.get("Server-Timing", "")
+
+
+def run_load(client, requests, concurrency=8, warmup=0):
+    """
+    Replay requests with `concurrency` workers, each sending its next request
+    as soon as the previous one finished (closed loop).
+
+    Returns:
+        (list of (endpoint, seconds, status, Server-Timing header), wall seconds of the measured part)
+    """
+    def send(req):
+        started = time.perf_counter()
+        try:
+            status, timing = client.send(*req)
+        except Exception:
+            status, timing = 0, ""
+        return req[0], time.perf_counter() - started, status, timing
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, requests[:warmup]))
+        started = time.perf_counter()
+        results = list(pool.map(send, requests[warmup:]))
+    return results, time.perf_counter() - started
+
+
+def _latencies(rows, seconds):
+    ms = np.array([r[1] for r in rows]) * 1e3
+    statuses = Counter(str(r[2]) for r in rows)
+    return {
+        "requests": len(rows),
+        "errors": sum(n for status, n in statuses.items() if status == "0" or status.startswith("5")),
+        "status": dict(sorted(statuses.items())),
+        "throughput": len(rows) / seconds if seconds > 0 else 0.0,
+        "meanMs": float(ms.mean()),
+        **{f"p{q}Ms": float(np.percentile(ms, q)) for q in PERCENTILES},
+        "maxMs": float(ms.max()),
+    }
+
+
+def _spans(rows):
+    """Mean milliseconds per Server-Timing stage over the rows."""
+    totals = Counter()
+    for _, _, _, timing in rows:
+        for metric in filter(None, (m.strip() for m in timing.split(","))):
+            name, _, duration = metric.partition(";dur=")
+            totals[name] += float(duration or 0)
+    return {name: total / len(rows) for name, total in totals.items()}
+
+
+def summarize(results, seconds):
+    """
+    Latency percentiles, throughput and status counts, overall and per endpoint.
+
+    Returns:
+        dict with 'all' and 'endpoints' (endpoint -> stats including mean 'spansMs')
+    """
+    endpoints = {}
+    for endpoint in ENDPOINTS:
+        rows = [r for r in results if r[0] == endpoint]
+        if rows:
+            endpoints[endpoint] = {**_latencies(rows, seconds), "spansMs": _spans(rows)}
+    return {"all": _latencies(results, seconds) if results else {}, "endpoints": endpoints}
+
+
+def compare_reports(report, previous, tolerance=0.25):
+    """
+    Per-endpoint changes against an earlier report.
+
+    Returns:
+        list of (endpoint, metric, previous value, current value) regressions:
+        p50/p99 up or throughput down by more than `tolerance`
+    """
+    if report["config"] != previous.get("config"):
+        changed = sorted(k for k in report["config"] if report["config"][k] != previous.get("config", {}).get(k))
+        print(f"[WARNING] Runs used different settings ({', '.join(changed)}); numbers may not be comparable")
+    regressions = []
+    for endpoint, stats in report["endpoints"].items():
+        base = previous.get("endpoints", {}).get(endpoint)
+        if not base:
+            continue
+        for metric in ("p50Ms", "p99Ms", "throughput"):
+            before, after = base[metric], stats[metric]
+            change = (after - before) / before if before else 0.0
+            print(f"[INFO] {endpoint} {metric}: {before:.1f} -> {after:.1f} ({change:+.0%})")
+            worse = -change if metric == "throughput" else change
+            if worse > tolerance:
+                regressions.append((endpoint, metric, before, after))
+    return regressions
+
+
+def serve(world, port, **backend):
+    """Serve the four handlers at /<endpoint> on a local Flask server, over the world's fakes."""
+    import main
+    from flask import Flask, request
+
+    app = Flask("load")
+    for endpoint in ENDPOINTS:
+        handler = getattr(main, endpoint)
+        app.add_url_rule(f"/{endpoint}", endpoint, lambda handler=handler: handler(request),
+                         methods=["GET", "POST", "OPTIONS"])
+    with local_backend(world, **backend):
+        print(f"[INFO] Serving {', '.join(ENDPOINTS)} on http://127.0.0.1:{port}")
+        app.run(port=port, threaded=True)
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in filter(None, text.split(",")):
+        name, _, share = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name}")
+        mix[name] = float(share)
+    return mix
+
+
+def main(argv=None):
+    """
+    Load test of the HTTP functions, fully offline.
+
+        python -m benchmarks.load                              # in-process, default mix
+        python -m benchmarks.load --concurrency 32 --latency 0.2 --out run.json
+        python -m benchmarks.load --compare run.json           # exit 1 on regressions
+        python -m benchmarks.load --serve 8080                 # local server over the same fakes
+        python -m benchmarks.load --url http://127.0.0.1:8080  # drive that server
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests sent first")
+    parser.add_argument("--mix", type=_parse_mix, default=DEFAULT_MIX,
+                        help="endpoint shares, e.g. get_fast_data=5,get_compare_info=2")
+    parser.add_argument("--universe", type=int, default=200)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--portfolios", type=int, default=20)
+    parser.add_argument("--large-tickers", type=int, default=100)
+    parser.add_argument("--fixture", help="recorded .npz prices to replay instead of synthetic ones")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every upstream call")
+    parser.add_argument("--jitter", type=float, default=0.1, help="up to this many more seconds, at random")
+    parser.add_argument("--upstream-rate", type=float, help="gateway calls per second (defaults to GATEWAY_RATE)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="send requests to a running server instead of in-process")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="serve the handlers over the fakes and block")
+    parser.add_argument("--label", default="", help="free text stored in the report (commit, branch, ...)")
+    parser.add_argument("--out", help="write the report to this JSON file")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    fixture = load_fixture(args.fixture) if args.fixture else None
+    world = build_world(args.universe, args.years, args.portfolios, args.large_tickers, fixture, args.seed)
+    backend = dict(latency=args.latency, jitter=args.jitter, upstream_rate=args.upstream_rate, seed=args.seed)
+    if args.serve:
+        serve(world, args.serve, **backend)
+        return 0
+
+    requests = make_requests(world, args.warmup + args.requests, args.mix, args.seed)
+    config = {k: v for k, v in vars(args).items() if k not in ("url", "serve", "label", "out", "compare", "tolerance")}
+    config["mode"] = "http" if args.url else "in-process"
+    report = {"config": config, "label": args.label, "started": datetime.now().isoformat()}
+
+    with open(os.devnull, "w") as devnull, contextlib.ExitStack() as stack:
+        if args.url:
+            client, upstream = HttpClient(args.url), None
+        else:
+            upstream = stack.enter_context(local_backend(world, **backend))
+            client = InProcessClient()
+        with contextlib.redirect_stdout(devnull):
+            results, seconds = run_load(client, requests, args.concurrency, args.warmup)
+        if upstream is not None:
+            from gateway import get_gateway
+            report["upstream"] = {"calls": upstream.calls, "gateway": dict(get_gateway().stats)}
+            report["firestore"] = {"reads": world["db"].reads, "writes": world["db"].writes}
+
+    report.update(seconds=seconds, **summarize(results, seconds))
+
+    for endpoint, stats in report["endpoints"].items():
+        print(f"[INFO] {endpoint}: {stats['requests']} requests, {stats['throughput']:.1f}/s, "
+              f"p50 {stats['p50Ms']:.1f} ms, p90 {stats['p90Ms']:.1f} ms, p99 {stats['p99Ms']:.1f} ms, "
+              f"errors {stats['errors']}")
+    overall = report["all"]
+    print(f"[INFO] all: {overall['requests']} requests in {seconds:.1f}s ({overall['throughput']:.1f}/s), "
+          f"p50 {overall['p50Ms']:.1f} ms, p99 {overall['p99Ms']:.1f} ms")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"[INFO] Report written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        for endpoint, metric, before, after in regressions:
+            print(f"[REGRESSION] {endpoint} {metric}: {before:.4g} -> {after:.4g}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
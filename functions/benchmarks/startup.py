@@ -0,0 +1,65 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter: time `import main`, then the endpoint's own imports
+_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.warm_up(sys.argv[1], clients=False)
+print(json.dumps({"main": imported - started, "endpoint": time.perf_counter() - imported}))
+"""
+
+
+def _slowest_imports(stderr, top):
+    """Parse `python -X importtime` output into the `top` modules by cumulative time."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return [{"module": name, "ms": us / 1e3} for us, name in rows[:top]]
+
+
+def measure_startup(endpoints=None, repeat=3, top=5):
+    """
+    Cold-import cost per endpoint, each run in a fresh interpreter.
+
+    Parameters:
+        endpoints: function names (defaults to every entry of main.ENDPOINT_MODULES)
+        repeat: fresh interpreters per endpoint; the median is reported
+        top: slowest imports to list per endpoint
+
+    Returns:
+        dict of endpoint -> {'mainMs', 'endpointMs', 'totalMs', 'slowest'}
+    """
+    if endpoints is None:
+        sys.path.insert(0, FUNCTIONS_DIR)
+        from main import ENDPOINT_MODULES
+        endpoints = list(ENDPOINT_MODULES)
+
+    results = {}
+    for endpoint in endpoints:
+        runs = []
+        for _ in range(repeat):
+            proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _SCRIPT, endpoint],
+                                  cwd=FUNCTIONS_DIR, capture_output=True, text=True, check=True)
+            runs.append((json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr))
+        main_ms = statistics.median(r["main"] for r, _ in runs) * 1e3
+        endpoint_ms = statistics.median(r["endpoint"] for r, _ in runs) * 1e3
+        results[endpoint] = {
+            "mainMs": main_ms,
+            "endpointMs": endpoint_ms,
+            "totalMs": main_ms + endpoint_ms,
+            "slowest": _slowest_imports(runs[-1][1], top),
+        }
+        print(f"[INFO] startup {endpoint}: import main {main_ms:.0f} ms + endpoint modules {endpoint_ms:.0f} ms")
+    return results
@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from timing import count as _count
+
+# Background refreshes of stale TieredCache entries run on their own small pool,
+# so a refresh can itself use fetching.fetch_all without starving it
+REFRESH_WORKERS = int(os.environ.get("CACHE_REFRESH_WORKERS", 2))
+_refresher = None
+_refresher_guard = threading.Lock()
+
+
+def get_refresher():
+    """Process-wide thread pool for stale-while-revalidate refreshes."""
+    global _refresher
+    with _refresher_guard:
+        if _refresher is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _refresher = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+        return _refresher
+
+
+def sizeof(value):
+    """Approximate in-memory size of a cached value in bytes."""
+    # pandas/numpy values can only exist once those modules are loaded; don't import them here
+    pd = sys.modules.get("pandas")
+    np = sys.modules.get("numpy")
+    if pd is not None and isinstance(value, (pd.Series, pd.DataFrame)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if np is not None and isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a TTL per entry and a memory budget.
+
+    Entries past their TTL are dropped on read; when the total size exceeds
+    `max_bytes` the least recently used entries are evicted. A named cache
+    also reports its hits and misses to the request timing counters.
+    """
+
+    def __init__(self, max_bytes, ttl, name=None):
+        self.max_bytes = int(max_bytes)
+        self.ttl = ttl
+        self.name = name
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (value, expires, nbytes)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def _drop(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self.size -= nbytes
+
+    def get(self, key, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.time():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += count
+            else:
+                self._entries.move_to_end(key)
+                self.hits += count
+        if count and self.name:
+            _count(f"{self.name}.{'miss' if entry is None else 'hit'}")
+        return None if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None):
+        nbytes = sizeof(value)
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, expires, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self.size, "maxBytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+class TieredCache:
+    """
+    In-process LRUCache (L1) in front of an optional shared backend (L2).
+
+    Entries are fresh for `ttl` seconds and may then be served stale for
+    `stale_ttl` more while revalidate() refreshes them in the background.
+    L2 holds compressed, data-only entries (cache.codec) under "<name>:<key>", so every
+    instance behind the same backend shares what any of them fetched; a
+    failing backend degrades to an L1-only cache.
+
+    Background refreshes run on the refresh pool after the response
+    may already be sent, so on platforms that throttle idle CPU they finish
+    late; the entry keeps being served stale until then.
+    """
+
+    def __init__(self, name, max_bytes, ttl, stale_ttl=0, backend=None):
+        """
+        Parameters:
+            name: counter prefix and L2 key namespace
+            max_bytes: L1 memory budget
+            ttl: seconds an entry is fresh
+            stale_ttl: seconds a stale entry may still be served
+            backend: L2 backend (see cache.backends), a callable returning one
+                     (resolved on first use, so creating the cache stays cheap), or None
+        """
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._backend = backend
+        self.l1 = LRUCache(max_bytes=max_bytes, ttl=ttl + stale_ttl, name=name)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if callable(self._backend):
+            with self._lock:
+                if callable(self._backend):
+                    try:
+                        self._backend = self._backend()
+                    except Exception as e:
+                        print(f"[WARNING] {self.name}: shared cache unavailable: {e}")
+                        self._backend = None
+        return self._backend
+
+    def _l2_key(self, key):
+        return f"{self.name}:{key}"
+
+    def _read_l2(self, keys):
+        from cache.codec import loads
+        try:
+            raw = self.backend.get_many([self._l2_key(k) for k in keys])
+        except Exception as e:
+            print(f"[WARNING] {self.name}: shared cache read failed: {e}")
+            return {}
+        found = {}
+        for key in keys:
+            data = raw.get(self._l2_key(key))
+            if data is None:
+                continue
+            try:
+                found[key] = loads(data)
+            except ValueError as e:
+                # Written by an older version, or not by this cache at all: a miss
+                print(f"[WARNING] {self.name}: dropping shared cache entry {key}: {e}")
+        return found
+
+    def _write_l2(self, key, value, fresh_until):
+        from cache.codec import dumps
+        try:
+            data = dumps((value, fresh_until))
+            self.backend.set(self._l2_key(key), data, fresh_until + self.stale_ttl)
+        except Exception as e:
+            print(f"[WARNING] {self.name}: shared cache write failed: {e}")
+
+    def get_many(self, keys, allow_stale=True):
+        """
+        Look keys up in L1, then the misses in L2 (promoting what it has).
+
+        Parameters:
+            keys: iterable of keys
+            allow_stale: also return entries past `ttl` but within `stale_ttl`
+
+        Returns:
+            (found, stale): dict of key -> value, and the list of keys in
+            `found` that are stale and should be revalidated
+        """
+        now = time.time()
+        found, stale, misses = {}, [], []
+        for key in dict.fromkeys(keys):
+            entry = self.l1.get(key)
+            if entry is None:
+                misses.append(key)
+            else:
+                found[key] = entry
+        if misses and self.backend is not None:
+            promoted = self._read_l2(misses)
+            _count(f"{self.name}.l2_hit", len(promoted))
+            _count(f"{self.name}.l2_miss", len(misses) - len(promoted))
+            for key, (value, fresh_until) in promoted.items():
+                self.l1.set(key, (value, fresh_until), ttl=fresh_until + self.stale_ttl - now)
+                found[key] = (value, fresh_until)
+
+        values = {}
+        for key, (value, fresh_until) in found.items():
+            if fresh_until > now:
+                values[key] = value
+            elif allow_stale:
+                values[key] = value
+                stale.append(key)
+        if stale:
+            _count(f"{self.name}.stale", len(stale))
+        return values, stale
+
+    def get(self, key, allow_stale=True):
+        """Single-key get_many(); returns (value or None, is_stale)."""
+        values, stale = self.get_many([key], allow_stale=allow_stale)
+        return values.get(key), bool(stale)
+
+    def set(self, key, value):
+        fresh_until = time.time() + self.ttl
+        self.l1.set(key, (value, fresh_until))
+        if self.backend is not None:
+            self._write_l2(key, value, fresh_until)
+
+    def revalidate(self, keys, fetch):
+        """
+        Refresh stale keys in the background, at most one refresh per key at a time.
+
+        Parameters:
+            keys: keys to refresh
+            fetch: callable taking a list of keys, returning dict of key -> value
+                   (keys it leaves out keep their stale value)
+        """
+        with self._lock:
+            keys = [k for k in dict.fromkeys(keys) if k not in self._refreshing]
+            self._refreshing.update(keys)
+        if not keys:
+            return
+
+        def refresh():
+            try:
+                for key, value in fetch(keys).items():
+                    self.set(key, value)
+            except Exception as e:
+                print(f"[WARNING] {self.name}: background refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(keys)
+
+        get_refresher().submit(refresh)
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import threading
+import time
+
+# Shared (L2) cache backend: CACHE_BACKEND=none|memory|file|firestore|redis
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "none")
+CACHE_DIR = os.environ.get("CACHE_DIR", "/tmp/shared_cache")
+CACHE_COLLECTION = os.environ.get("CACHE_COLLECTION", "cache")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+
+def _safe_key(key):
+    """Backend-safe id for any cache key (Firestore ids can't contain '/', file names vary by OS)."""
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class MemoryBackend:
+    """
+    In-process dict with Redis-like expiry semantics.
+
+    Not shared between instances; it stands in for a real shared store in
+    tests and the benchmarks.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            found = {k: self._data.get(k) for k in keys}
+        return {k: v[0] for k, v in found.items() if v is not None and v[1] > now}
+
+    def set(self, key, data, expires_at):
+        with self._lock:
+            self._data[key] = (data, expires_at)
+
+
+class FileBackend:
+    """One file per key under `directory`; shared by every process on the same disk."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, _safe_key(key))
+
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        for key in keys:
+            try:
+                with open(self._path(key), "rb") as f:
+                    expires_at = float(f.readline())
+                    if expires_at > now:
+                        found[key] = f.read()
+            except (OSError, ValueError):
+                continue
+        return found
+
+    def set(self, key, data, expires_at):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(f"{expires_at}\n".encode())
+            f.write(data)
+        os.replace(tmp, path)
+
+
+class FirestoreBackend:
+    """
+    Documents in one Firestore collection, shared by every instance.
+
+    `expiresAt` is stored as a timestamp so a Firestore TTL policy on that
+    field can purge old entries.
+    """
+
+    def __init__(self, db, collection=CACHE_COLLECTION):
+        self.collection = db.collection(collection)
+        self.db = db
+
+    def get_many(self, keys):
+        refs = {_safe_key(k): k for k in keys}
+        docs = self.db.get_all([self.collection.document(doc_id) for doc_id in refs])
+        now = time.time()
+        found = {}
+        for doc in docs:
+            if not doc.exists:
+                continue
+            data = doc.to_dict()
+            if data["expiresAt"].timestamp() > now:
+                found[refs[doc.id]] = data["data"]
+        return found
+
+    def set(self, key, data, expires_at):
+        from datetime import datetime, timezone
+        self.collection.document(_safe_key(key)).set({
+            "data": data,
+            "expiresAt": datetime.fromtimestamp(expires_at, tz=timezone.utc),
+        })
+
+
+class RedisBackend:
+    """Any client with Redis' mget/set(px=) API (redis-py, or fakeredis in tests)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget(keys)
+        return {k: v for k, v in zip(keys, values) if v is not None}
+
+    def set(self, key, data, expires_at):
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms > 0:
+            self.client.set(key, data, px=ttl_ms)
+
+
+_backend = None
+_backend_guard = threading.Lock()
+
+
+def get_backend(db_factory=None):
+    """
+    Process-wide L2 backend chosen by CACHE_BACKEND, or None when disabled.
+
+    Parameters:
+        db_factory: callable returning the Firestore client (for 'firestore')
+    """
+    global _backend
+    with _backend_guard:
+        if _backend is None and CACHE_BACKEND != "none":
+            if CACHE_BACKEND == "memory":
+                _backend = MemoryBackend()
+            elif CACHE_BACKEND == "file":
+                _backend = FileBackend()
+            elif CACHE_BACKEND == "firestore":
+                _backend = FirestoreBackend(db_factory())
+            elif CACHE_BACKEND == "redis":
+                import redis
+                _backend = RedisBackend(redis.Redis.from_url(REDIS_URL))
+            else:
+                raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
+        return _backend
@@ -0,0 +1,94 @@
+import base64
+import json
+import sys
+import zlib
+
+# L2 entries are zlib-compressed JSON. Arrays and pandas Series are tagged objects
+# holding raw little-endian buffers, so reading an entry never runs code from the store.
+_ARRAY_KINDS = "biufUM"
+
+
+def _array(values):
+    import numpy as np
+    values = np.ascontiguousarray(values)
+    if values.dtype.kind not in _ARRAY_KINDS:
+        raise TypeError(f"Can't store {values.dtype} arrays in the shared cache")
+    values = values.astype(values.dtype.newbyteorder("<"))
+    return [values.dtype.str, list(values.shape), base64.b64encode(values.tobytes()).decode()]
+
+
+def _from_array(packed):
+    import numpy as np
+    dtype, shape, data = packed
+    dtype = np.dtype(dtype)
+    if dtype.kind not in _ARRAY_KINDS:
+        raise ValueError(f"Unexpected dtype {dtype} in a shared cache entry")
+    return np.frombuffer(base64.b64decode(data), dtype=dtype).reshape(shape).copy()
+
+
+def _pack(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bytes):
+        return {"$b": base64.b64encode(value).decode()}
+    if isinstance(value, (list, tuple)):
+        items = [_pack(v) for v in value]
+        return items if isinstance(value, list) else {"$t": items}
+    if isinstance(value, dict):
+        if not all(isinstance(k, str) for k in value):
+            raise TypeError("Shared cache dicts need string keys")
+        return {"$d": {k: _pack(v) for k, v in value.items()}}
+    # pandas/numpy values can only exist once those modules are loaded; don't import them here
+    pd = sys.modules.get("pandas")
+    np = sys.modules.get("numpy")
+    if pd is not None and isinstance(value, pd.Series):
+        index = value.index
+        if isinstance(index, pd.DatetimeIndex):
+            index = {"$dates": _array(index.tz_localize(None).values)}
+        else:
+            index = _array(np.asarray(index, dtype=str))
+        name = value.name if isinstance(value.name, str) else None
+        return {"$s": [index, _array(value.values), name]}
+    if np is not None and isinstance(value, np.ndarray):
+        return {"$a": _array(value)}
+    if np is not None and isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Can't store {type(value).__name__} in the shared cache")
+
+
+def _unpack(value):
+    if isinstance(value, list):
+        return [_unpack(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    (tag, inner), = value.items()
+    if tag == "$d":
+        return {k: _unpack(v) for k, v in inner.items()}
+    if tag == "$t":
+        return tuple(_unpack(v) for v in inner)
+    if tag == "$b":
+        return base64.b64decode(inner)
+    if tag == "$a":
+        return _from_array(inner)
+    if tag == "$s":
+        import pandas as pd
+        index, values, name = inner
+        if isinstance(index, dict):
+            index = pd.DatetimeIndex(_from_array(index["$dates"]))
+        else:
+            index = pd.Index(_from_array(index).astype(object))
+        return pd.Series(_from_array(values), index=index, name=name)
+    raise ValueError(f"Unknown tag {tag} in a shared cache entry")
+
+
+def dumps(value):
+    """Compressed, data-only encoding of a cache value (JSON types, bytes, tuples, arrays, Series)."""
+    return zlib.compress(json.dumps(_pack(value), separators=(",", ":")).encode())
+
+
+def loads(data):
+    """Inverse of dumps(); raises ValueError on anything it didn't write."""
+    try:
+        return _unpack(json.loads(zlib.decompress(data)))
+    except (zlib.error, ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Unreadable shared cache entry: {e}") from e
@@ -0,0 +1,173 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# Variances at or below this fraction of a series' mean square are treated as
+# zero (a constant series), whose correlations are undefined
+VARIANCE_EPS = 1e-10
+
+
+def _ffill(X):
+    """Forward-fill NaNs down the rows of a 2-D array (leading NaNs stay NaN)."""
+    rows = np.where(np.isnan(X), 0, np.arange(X.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return X[rows, np.arange(X.shape[1])]
+
+
+class CorrelationEngine:
+    """
+    Incremental Pearson correlation over a basket of return series.
+
+    Reproduces `pd.DataFrame(returns).ffill().dropna().corr()`: series are
+    aligned on the union of their dates, forward-filled, and only the rows
+    where every series is valid (from the latest first observation on) are
+    used. Alongside the aligned matrix the engine keeps the window sums and
+    cross products, so adding a ticker only computes its own row and column,
+    and calendar or window changes only touch the rows that moved.
+
+    A series without any valid return gets NaN correlations and leaves the
+    window of the others alone.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tickers = []
+        self.raw = {}                               # ticker -> returns Series as added
+        self.dates = np.array([], dtype=object)     # union calendar
+        self.refs = np.array([], dtype=np.int64)    # tickers observed on each date
+        self.first = {}                             # ticker -> first observed date
+        self.X = np.empty((0, 0))                   # aligned, forward-filled returns
+        self.w = 0                                  # first row of the common window
+        self.S = np.empty(0)                        # column sums over the window
+        self.C = np.empty((0, 0))                   # cross products over the window
+
+    def __contains__(self, ticker):
+        return ticker in self.raw
+
+    # -----------------------------
+    def _window_start(self):
+        if not self.first:
+            return 0
+        return int(np.searchsorted(self.dates, max(self.first.values())))
+
+    def _add_rows(self, rows, sign=1.0):
+        """Add (or with sign=-1 remove) rows of X to the window statistics."""
+        if len(rows) == 0 or not self.tickers:
+            return
+        R = self.X[rows]
+        self.S += sign * R.sum(axis=0)
+        self.C += sign * (R.T @ R)
+
+    def _extend_calendar(self, new_dates):
+        dates = np.union1d(self.dates, new_dates)
+        if len(dates) == len(self.dates):
+            return
+        old_pos = np.searchsorted(dates, self.dates)
+        X = np.full((len(dates), len(self.tickers)), np.nan)
+        X[old_pos] = self.X
+        refs = np.zeros(len(dates), dtype=np.int64)
+        refs[old_pos] = self.refs
+        self.X = _ffill(X)
+        self.dates, self.refs = dates, refs
+
+        # Inserted rows are forward-filled copies; add those inside the window
+        self.w = self._window_start()
+        inserted = np.setdiff1d(np.arange(len(dates)), old_pos)
+        self._add_rows(inserted[inserted >= self.w])
+
+    # -----------------------------
+    def add(self, ticker, returns):
+        """Add one return series, computing only its row and column of the statistics."""
+        if ticker in self.raw:
+            self.remove(ticker)
+        valid = returns.dropna()
+        values = np.asarray(valid.values, dtype=float)
+        index = np.asarray(valid.index)
+        if not self.tickers:
+            self.dates = self.dates.astype(index.dtype)
+
+        self._extend_calendar(index)
+        pos = np.searchsorted(self.dates, index)
+        self.refs[pos] += 1
+
+        x = np.full(len(self.dates), np.nan)
+        x[pos] = values
+        x = _ffill(x[:, None])[:, 0]
+
+        # A later-starting series shrinks the window for every pair; an empty one
+        # stays all NaN, which only reaches its own row and column of the sums
+        if len(index):
+            self.first[ticker] = index.min()
+        w = self._window_start()
+        if w > self.w:
+            self._add_rows(np.arange(self.w, w), sign=-1.0)
+        self.w = w
+
+        xw = x[self.w:]
+        cross = self.X[self.w:].T @ xw if self.tickers else np.empty(0)
+        n = len(self.tickers)
+        C = np.empty((n + 1, n + 1))
+        C[:n, :n] = self.C
+        C[n, :n] = C[:n, n] = cross
+        C[n, n] = xw @ xw
+        self.C = C
+        self.S = np.append(self.S, xw.sum())
+        self.X = np.column_stack([self.X, x]) if n else x[:, None]
+        self.tickers.append(ticker)
+        self.raw[ticker] = returns
+
+    def remove(self, ticker):
+        """Drop one series, widening the window and shrinking the calendar as needed."""
+        i = self.tickers.index(ticker)
+        keep = [j for j in range(len(self.tickers)) if j != i]
+        returns = self.raw.pop(ticker)
+        self.first.pop(ticker, None)
+        self.tickers.pop(i)
+        self.X = self.X[:, keep]
+        self.S = self.S[keep]
+        self.C = self.C[np.ix_(keep, keep)]
+
+        w = self._window_start()
+        if w < self.w:
+            self._add_rows(np.arange(w, self.w))
+        self.w = w
+
+        # Dates no remaining series was observed on disappear from the calendar
+        pos = np.searchsorted(self.dates, np.asarray(returns.dropna().index, dtype=self.dates.dtype))
+        self.refs[pos] -= 1
+        orphaned = np.flatnonzero(self.refs == 0)
+        if len(orphaned):
+            self._add_rows(orphaned[orphaned >= self.w], sign=-1.0)
+            live = self.refs != 0
+            self.dates, self.refs, self.X = self.dates[live], self.refs[live], self.X[live]
+            self.w = self._window_start()
+
+    def sync(self, returns):
+        """Make the engine hold exactly the given {ticker: returns} basket."""
+        for ticker in [t for t in self.tickers if returns.get(t) is not self.raw[t]]:
+            self.remove(ticker)
+        for ticker, series in returns.items():
+            if ticker not in self.raw:
+                self.add(ticker, series)
+
+    # -----------------------------
+    def corr(self, tickers=None):
+        """Correlation matrix (pd.DataFrame) for `tickers`, or for every held series."""
+        tickers = self.tickers if tickers is None else [t for t in tickers if t in self.raw]
+        idx = [self.tickers.index(t) for t in tickers]
+        n = len(self.dates) - self.w
+        S = self.S[idx]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = n * self.C[np.ix_(idx, idx)] - np.outer(S, S)
+            var = np.diag(cov)
+            # Rounding leaves a constant series with a tiny variance instead of zero
+            defined = var > VARIANCE_EPS * n * np.diag(self.C)[idx]
+            std = np.sqrt(np.clip(var, 0, None))
+            corr = cov / np.outer(std, std)
+        if n < 2:
+            corr[:] = np.nan
+        corr[~defined] = np.nan
+        corr[:, ~defined] = np.nan
+        np.fill_diagonal(corr, np.where(defined, 1.0, np.nan))
+        corr = np.clip(corr, -1.0, 1.0)
+        return pd.DataFrame(corr, index=tickers, columns=tickers)
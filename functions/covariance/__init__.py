@@ -0,0 +1,206 @@
+import io
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from timing import span
+
+# Where the nightly matrix is published and how often an instance checks for a new one
+MATRIX_BUCKET = os.environ.get("MATRIX_BUCKET", "quant-algo-4430a.firebasestorage.app")
+MATRIX_BLOB = os.environ.get("MATRIX_BLOB", "universe/covariance.npz")
+MATRIX_RELOAD_SECONDS = int(os.environ.get("MATRIX_RELOAD_SECONDS", 3600))
+
+# Pairs with fewer overlapping weeks are left undefined (NaN)
+MIN_OVERLAP = 26
+# Optional shrinkage towards zero correlation, in weeks: a pair with n overlapping weeks
+# keeps n / (n + SHRINKAGE) of its sample correlation. Off by default
+SHRINKAGE = int(os.environ.get("MATRIX_SHRINKAGE_WEEKS", 0))
+UNIVERSE_START = "2005-01-01"
+
+
+class UniverseMatrix:
+    """
+    Correlation and covariance of weekly returns across the whole asset universe.
+
+    Both matrices are float32 with one row/column per ticker; `index` maps a
+    ticker to its row so any basket is served by an O(k^2) slice.
+    """
+
+    def __init__(self, tickers, corr, cov, built):
+        self.tickers = list(tickers)
+        self.index = {t: i for i, t in enumerate(self.tickers)}
+        self.corr = corr
+        self.cov = cov
+        self.built = built
+
+    def __contains__(self, ticker):
+        return ticker in self.index
+
+    def covers(self, tickers):
+        return all(t in self.index for t in tickers)
+
+    def slice(self, tickers, kind="corr"):
+        """
+        Sub-matrix for the given tickers (those outside the universe are left out).
+
+        Parameters:
+            tickers: iterable of tickers
+            kind: 'corr' or 'cov' (weekly covariance)
+
+        Returns:
+            pd.DataFrame indexed and labelled by ticker, float64
+        """
+        tickers = [t for t in dict.fromkeys(tickers) if t in self.index]
+        rows = [self.index[t] for t in tickers]
+        matrix = self.corr if kind == "corr" else self.cov
+        return pd.DataFrame(matrix[np.ix_(rows, rows)].astype(np.float64), index=tickers, columns=tickers)
+
+    # -----------------------------
+    def to_bytes(self):
+        out = io.BytesIO()
+        np.savez(out, tickers=np.array(self.tickers, dtype=str), corr=self.corr, cov=self.cov,
+                 built=np.int64(pd.Timestamp(self.built).value))
+        return out.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data)) as f:
+            return cls(f["tickers"].tolist(), f["corr"], f["cov"], pd.Timestamp(int(f["built"])))
+
+
+def weekly_returns(closes):
+    """
+    Weekly returns of close prices on one shared Friday calendar.
+
+    Parameters:
+        closes: pd.DataFrame of closes, one column per ticker, DatetimeIndex
+
+    Returns:
+        pd.DataFrame of float32 returns (NaN where a ticker has no data)
+    """
+    weekly = closes.resample("W-FRI").last()
+    return weekly.pct_change(fill_method=None).iloc[1:].astype(np.float32)
+
+
+def build(returns, shrinkage=SHRINKAGE, min_overlap=MIN_OVERLAP):
+    """
+    Pairwise-complete correlation and covariance of a return matrix.
+
+    Each pair uses the weeks where both tickers have a return, as
+    pd.DataFrame.corr() does, but for every pair at once with three matrix
+    products. Correlations of pairs with short overlaps are shrunk towards
+    zero; covariances are rebuilt from the shrunk correlations.
+
+    Parameters:
+        returns: pd.DataFrame from weekly_returns
+        shrinkage: shrinkage strength in weeks (0 disables)
+        min_overlap: minimum overlapping weeks for a pair to be defined
+
+    Returns:
+        UniverseMatrix
+    """
+    X = returns.values.astype(np.float64)
+    M = (~np.isnan(X)).astype(np.float64)
+    X = np.where(M > 0, X, 0.0)
+
+    n = M.T @ M                  # overlapping weeks per pair
+    sums = X.T @ M               # sums[i, j]: sum of i's returns over weeks j is defined too
+    squares = (X * X).T @ M
+    cross = X.T @ X
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = (cross - sums * sums.T / n) / (n - 1)
+        var = (squares - sums * sums / n) / (n - 1)       # var[i, j]: i's variance over the pair's weeks
+        corr = cov / np.sqrt(var * var.T)
+    corr = np.clip(corr, -1.0, 1.0)
+    if shrinkage:
+        corr *= n / (n + shrinkage)
+
+    # Diagonal: the full-history variance of each ticker
+    std = np.sqrt(np.diag(var))
+    np.fill_diagonal(corr, np.where(std > 0, 1.0, np.nan))
+    undefined = n < min_overlap
+    corr[undefined] = np.nan
+    cov = corr * np.outer(std, std)
+    return UniverseMatrix(returns.columns, corr.astype(np.float32), cov.astype(np.float32), pd.Timestamp.now())
+
+
+def universe_tickers(db):
+    """Every ticker of the `light_assets` collection (document ids only), plus the S&P 500."""
+    docs = db.collection("light_assets").select([]).stream()
+    return sorted({d.id for d in docs} | {"^GSPC"})
+
+
+def _bucket():
+    # Plain Cloud Storage client on the default credentials, so readers don't need the Firebase app
+    from google.cloud import storage
+    return storage.Client().bucket(MATRIX_BUCKET)
+
+
+def precompute(db, tickers=None):
+    """
+    Nightly build: weekly closes of the universe (cut from the daily base series
+    the endpoints share), both matrices, published to Cloud Storage.
+
+    Parameters:
+        db: Firestore database object
+        tickers: optional ticker list (defaults to universe_tickers(db))
+
+    Returns:
+        dict of stats
+    """
+    from price_store import get_store
+
+    started = time.perf_counter()
+    tickers = tickers or universe_tickers(db)
+    with span("prices"):
+        closes = get_store().get_views(tickers, start=UNIVERSE_START, interval="1wk")
+    with span("matrix"):
+        matrix = build(weekly_returns(closes))
+    with span("publish"):
+        data = matrix.to_bytes()
+        _bucket().blob(MATRIX_BLOB).upload_from_string(data, content_type="application/octet-stream")
+    stats = {
+        "tickers": len(matrix.tickers),
+        "requested": len(tickers),
+        "bytes": len(data),
+        "seconds": time.perf_counter() - started,
+    }
+    print(f"[INFO] Published {stats['tickers']}x{stats['tickers']} universe matrix ({stats['bytes']} bytes)")
+    return stats
+
+
+_matrix = None
+_matrix_generation = None
+_matrix_checked = 0.0
+_matrix_guard = threading.Lock()
+
+
+def _reload():
+    global _matrix, _matrix_generation
+    try:
+        blob = _bucket().get_blob(MATRIX_BLOB)
+        if blob is not None and blob.generation != _matrix_generation:
+            matrix = UniverseMatrix.from_bytes(blob.download_as_bytes())
+            with _matrix_guard:
+                _matrix, _matrix_generation = matrix, blob.generation
+            print(f"[INFO] Loaded {len(matrix.tickers)}-ticker universe matrix built {matrix.built}")
+    except Exception as e:
+        print(f"[WARNING] Universe matrix unavailable: {e}")
+
+
+def get_matrix():
+    """
+    Process-wide universe matrix, or None until one has been loaded.
+
+    Never blocks: at most every MATRIX_RELOAD_SECONDS a background thread
+    checks the blob's generation and downloads it only when it changed.
+    Until the first load completes (or when none is published) callers fall
+    back to computing correlations themselves.
+    """
+    global _matrix_checked
+    with _matrix_guard:
+        if time.time() - _matrix_checked > MATRIX_RELOAD_SECONDS:
+            _matrix_checked = time.time()
+            threading.Thread(target=_reload, name="matrix-reload", daemon=True).start()
+        return _matrix
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+# Upper bound for ?points= so a request can't ask for an unbounded payload
+MAX_POINTS = 5000
+MIN_POINTS = 3
+# Refinement passes of lttb(); each one fixes at least the next bucket of the chain
+MAX_PASSES = 16
+
+
+def _pick(x, y, bucket, starts, anchor_x, anchor_y, next_x, next_y):
+    """Per bucket, the point spanning the largest triangle with its anchor and the next bucket's mean."""
+    ax, ay = anchor_x[bucket], anchor_y[bucket]
+    area = np.abs((ax - next_x[bucket]) * (y - ay) - (ax - x) * (next_y[bucket] - ay))
+    best = np.maximum.reduceat(area, starts)
+    # First position of each bucket's maximum, as np.argmax would pick
+    positions = np.where(area == best[bucket], np.arange(len(x)), len(x))
+    return np.minimum.reduceat(positions, starts)
+
+
+def lttb(x, y, n):
+    """
+    Largest-Triangle-Three-Buckets downsampling, vectorized across buckets.
+
+    Classic LTTB anchors each bucket on the point picked in the bucket
+    before it, which is sequential. Here every pass picks all buckets at
+    once from the previous pass's anchors (bucket means to start with) and
+    passes repeat until the picks stop changing, which is exactly the
+    sequential result; after MAX_PASSES the remaining picks differ only
+    where a previous pick is still moving.
+
+    Parameters:
+        x: 1-D float array, increasing
+        y: 1-D float array of the same length, without NaNs
+        n: number of points to keep (first and last are always kept)
+
+    Returns:
+        sorted int array of the kept positions
+    """
+    size = len(x)
+    n = max(int(n), MIN_POINTS)
+    if n >= size:
+        return np.arange(size)
+
+    # Interior points 1..size-2 split into n-2 non-empty buckets
+    xi, yi = x[1:-1], y[1:-1]
+    edges = np.floor(np.linspace(0, size - 2, n - 1)).astype(np.int64)
+    counts = np.diff(edges)
+    starts = edges[:-1]
+    bucket = np.repeat(np.arange(n - 2), counts)
+    means = np.add.reduceat(np.c_[xi, yi], starts, axis=0) / counts[:, None]
+    next_x = np.append(means[1:, 0], x[-1])
+    next_y = np.append(means[1:, 1], y[-1])
+
+    # First pass anchors on the previous bucket's mean; later passes anchor on the
+    # previous pass's picks until they settle (the sequential LTTB result)
+    picks = _pick(xi, yi, bucket, starts, np.r_[x[0], means[:-1, 0]], np.r_[y[0], means[:-1, 1]], next_x, next_y)
+    for _ in range(MAX_PASSES):
+        previous = picks
+        picks = _pick(xi, yi, bucket, starts, np.r_[x[0], xi[picks[:-1]]], np.r_[y[0], yi[picks[:-1]]], next_x, next_y)
+        if np.array_equal(picks, previous):
+            break
+
+    return np.r_[0, picks + 1, size - 1]
+
+
+def downsample(series, n):
+    """
+    Shape-preserving reduction of a date-indexed series to at most `n` points.
+
+    Parameters:
+        series: pd.Series indexed by date
+        n: target number of points
+
+    Returns:
+        pd.Series (the input itself when it is already short enough)
+    """
+    series = series.dropna()
+    if n is None or len(series) <= n:
+        return series
+    x = pd.DatetimeIndex(series.index).values.astype("datetime64[s]").astype(np.float64)
+    keep = lttb(x, series.values.astype(np.float64), n)
+    return series.iloc[keep]
+
+
+def parse_points(args):
+    """
+    Read ?points= (or its alias ?resolution=) from request args.
+
+    Returns:
+        int clamped to [MIN_POINTS, MAX_POINTS], or None when not given
+
+    Raises:
+        ValueError: when the value is not an integer
+    """
+    raw = args.get("points") or args.get("resolution")
+    if raw is None or raw == "":
+        return None
+    return min(max(int(raw), MIN_POINTS), MAX_POINTS)
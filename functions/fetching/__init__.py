@@ -0,0 +1,62 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Upstream calls in flight per instance, and the default time budget of one request
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", 8))
+FETCH_DEADLINE = float(os.environ.get("FETCH_DEADLINE_SECONDS", 20))
+
+_executor = None
+_executor_guard = threading.Lock()
+
+
+def get_executor():
+    """Process-wide thread pool shared by every request, so concurrency stays bounded under load."""
+    global _executor
+    with _executor_guard:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+        return _executor
+
+
+def fetch_all(fn, keys, deadline=None):
+    """
+    Run fn(key) for every key on the shared pool and collect what finishes in time.
+
+    Calls run in the caller's context, so timing spans and counters land in
+    the current request. Calls still queued at the deadline are cancelled;
+    calls already running are abandoned (their results are dropped).
+
+    Parameters:
+        fn: callable taking one key
+        keys: iterable of keys (tickers)
+        deadline: seconds from now (defaults to FETCH_DEADLINE)
+
+    Returns:
+        (results, missing): dict of key -> fn(key) for the calls that
+        succeeded, and dict of key -> reason ('timeout' or the error message)
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}, {}
+    started = time.monotonic()
+    budget = FETCH_DEADLINE if deadline is None else deadline
+    executor = get_executor()
+    futures = {executor.submit(contextvars.copy_context().run, fn, key): key for key in keys}
+    done, pending = wait(futures, timeout=max(0.0, budget - (time.monotonic() - started)))
+
+    results, missing = {}, {}
+    for future in pending:
+        future.cancel()
+        missing[futures[future]] = "timeout"
+    for future in done:
+        key = futures[future]
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            missing[key] = str(e) or type(e).__name__
+    if missing:
+        print(f"[WARNING] {len(missing)}/{len(keys)} fetches failed or timed out: {sorted(missing)}")
+    return results, missing
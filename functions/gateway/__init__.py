@@ -0,0 +1,331 @@
+import math
+import os
+import threading
+import time
+from datetime import timedelta
+from timing import count
+
+# pandas is imported where frames are handled, so a quote-only cold start doesn't pay for it
+
+# Upstream calls per second (sustained) and burst size of the token bucket
+GATEWAY_RATE = float(os.environ.get("GATEWAY_RATE", 4))
+GATEWAY_BURST = int(os.environ.get("GATEWAY_BURST", 8))
+# Retries of a throttled call, waiting BACKOFF_SECONDS * 2**attempt before each
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 0.5
+# Tickers that returned no data at all are answered from memory for this long
+NEGATIVE_TTL = int(os.environ.get("GATEWAY_NEGATIVE_TTL", 300))
+# A request must span this much history for "no data" to mean the ticker is unknown
+# (a short tail fetch can be legitimately empty, e.g. over a weekend)
+NEGATIVE_MIN_SPAN = timedelta(days=30)
+# Single-ticker history requests arriving within this window are merged into one download
+BATCH_WINDOW = float(os.environ.get("GATEWAY_BATCH_WINDOW", 0.02))
+# yfinance errors that mean the ticker has no data (anything else may be transient)
+NO_DATA_ERRORS = ("YFTickerMissingError", "YFTzMissingError", "YFPricesMissingError")
+QUOTE_FIELDS = ("lastPrice", "previousClose", "yearHigh", "yearLow")
+
+
+class NoDataError(LookupError):
+    """Upstream has no data for a ticker (possibly answered from the negative cache)."""
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "tickers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.tickers = []
+
+
+class Gateway:
+    """
+    The one way to market data upstream (yfinance).
+
+    - single-flight: concurrent identical calls share one upstream call
+    - negative caching: tickers without data are not re-queried for NEGATIVE_TTL
+    - token bucket: at most GATEWAY_RATE calls per second (bursts of
+      GATEWAY_BURST), with exponential backoff when upstream throttles anyway
+    - batching: single-ticker histories with the same range, requested within
+      BATCH_WINDOW of each other, are fetched with one bulk download
+
+    `client` is anything with yfinance's `download` and `Ticker`; the default
+    is the yfinance module itself, looked up on first use. Counters go to the
+    current request's timing trace (as gateway.*) and to `stats`.
+    """
+
+    def __init__(self, client=None, rate=GATEWAY_RATE, burst=GATEWAY_BURST, negative_ttl=NEGATIVE_TTL,
+                 batch_window=BATCH_WINDOW):
+        self._client = client
+        self.rate = rate
+        self.burst = burst
+        self.negative_ttl = negative_ttl
+        self.batch_window = batch_window
+        self.stats = {}
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._bucket_lock = threading.Lock()
+        self._negative = {}     # ticker -> expiry
+        self._flights = {}      # key -> _Flight in progress
+        self._batches = {}      # (start, end, interval) -> _Flight collecting tickers
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            import yfinance
+            self._client = yfinance
+        return self._client
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + n
+        count(f"gateway.{name}", n)
+
+    # -----------------------------
+    def _acquire(self):
+        """Take one token, sleeping until the bucket has one."""
+        while True:
+            with self._bucket_lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._count("rate_limited")
+            time.sleep(wait)
+
+    @staticmethod
+    def _throttled(error):
+        text = str(error)
+        return "RateLimit" in type(error).__name__ or "Too Many Requests" in text or "429" in text
+
+    def _call(self, name, fn):
+        """One rate-limited upstream call, retried with backoff while upstream throttles."""
+        for attempt in range(MAX_RETRIES + 1):
+            self._acquire()
+            count(f"upstream.{name}")
+            self._count("upstream")
+            try:
+                return fn()
+            except Exception as e:
+                if not self._throttled(e) or attempt == MAX_RETRIES:
+                    raise
+                self._count("throttled")
+                with self._bucket_lock:
+                    self._tokens = 0.0
+                time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+
+    def _single_flight(self, key, fn):
+        """Run fn() once for concurrent callers with the same key."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            self._count("coalesced")
+            flight.done.wait()
+        else:
+            try:
+                flight.result = fn()
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    # -----------------------------
+    def _is_negative(self, ticker):
+        expires = self._negative.get(ticker)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            self._negative.pop(ticker, None)
+            return False
+        return True
+
+    def _mark_negative(self, tickers):
+        expires = time.monotonic() + self.negative_ttl
+        for ticker in tickers:
+            self._negative[ticker] = expires
+        if tickers:
+            self._count("negative_stored", len(tickers))
+
+    @staticmethod
+    def _long_span(start=None, period=None):
+        if period is not None:
+            return True
+        import pandas as pd
+        return start is not None and pd.Timestamp.now() - pd.Timestamp(start) >= NEGATIVE_MIN_SPAN
+
+    # -----------------------------
+    def fast_info(self, ticker):
+        """
+        Latest quote fields of one ticker.
+
+        Returns:
+            dict with lastPrice, previousClose, yearHigh and yearLow
+
+        Raises:
+            NoDataError: when upstream has no quote for the ticker, or the call
+            failed (only a definite no-data answer is negatively cached)
+        """
+        if self._is_negative(ticker):
+            self._count("negative_hit")
+            raise NoDataError(f"No data for {ticker}")
+
+        def read():
+            # fast_info is lazy: its fields are the network reads, so they belong inside _call
+            info = self.client.Ticker(ticker).fast_info
+            return {k: info[k] for k in QUOTE_FIELDS}
+
+        def fetch():
+            try:
+                quote = self._call("fast_info", read)
+            except Exception as e:
+                if self._throttled(e):
+                    raise
+                if type(e).__name__ in NO_DATA_ERRORS:
+                    self._mark_negative([ticker])
+                raise NoDataError(f"No data for {ticker}: {e}") from e
+            if quote["lastPrice"] is None or math.isnan(quote["lastPrice"]):
+                self._mark_negative([ticker])
+                raise NoDataError(f"No data for {ticker}")
+            return quote
+
+        return self._single_flight(("fast_info", ticker), fetch)
+
+    def download(self, tickers, start=None, end=None, interval="1d", period=None, **kwargs):
+        """
+        Bulk download (yf.download) of several tickers, skipping negatively cached ones.
+
+        Tickers that come back without any close over a long enough range are
+        negatively cached.
+
+        Returns:
+            pd.DataFrame as yf.download returns it (empty when nothing is left to fetch)
+        """
+        import pandas as pd
+        tickers = [tickers] if isinstance(tickers, str) else list(dict.fromkeys(tickers))
+        known = [t for t in tickers if not self._is_negative(t)]
+        if len(known) < len(tickers):
+            self._count("negative_hit", len(tickers) - len(known))
+        if not known:
+            return pd.DataFrame()
+        options = dict(start=start, end=end, interval=interval, progress=False, **kwargs)
+        if period is not None:
+            options["period"] = period
+        key = ("download", tuple(sorted(known)), tuple(sorted((k, str(v)) for k, v in options.items())))
+
+        def fetch():
+            data = self._call("download", lambda: self.client.download(known, **options))
+            if self._long_span(start, period):
+                self._mark_negative([t for t in known if not _has_close(data, t, len(known))])
+            return data
+
+        return self._single_flight(key, fetch)
+
+    def history(self, ticker, start=None, end=None, interval="1d", period=None):
+        """
+        Price history of one ticker (yf.Ticker.history).
+
+        Requests for a start date are collected for BATCH_WINDOW and fetched
+        together with the other tickers asking for the same range: alone
+        through Ticker.history, several at once through one download.
+
+        Returns:
+            pd.DataFrame with at least a 'Close' column (empty when there is no data)
+        """
+        import pandas as pd
+        if self._is_negative(ticker):
+            self._count("negative_hit")
+            return pd.DataFrame()
+        if period is not None or self.batch_window <= 0:
+            return self._single_flight(("history", ticker, start, end, interval, period),
+                                       lambda: self._history_one(ticker, start, end, interval, period))
+
+        key = (start, end, interval)
+        with self._lock:
+            batch = self._batches.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._batches[key] = _Flight()
+            if ticker not in batch.tickers:
+                batch.tickers.append(ticker)
+        if leader:
+            time.sleep(self.batch_window)
+            with self._lock:
+                del self._batches[key]
+            try:
+                batch.result = self._history_batch(batch.tickers, start, end, interval)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.result.get(ticker, pd.DataFrame())
+
+    def _history_one(self, ticker, start, end, interval, period):
+        options = {"interval": interval}
+        if period is not None:
+            options["period"] = period
+        else:
+            options.update(start=start, end=end)
+        data = self._call("history", lambda: self.client.Ticker(ticker).history(**options))
+        if data.empty and self._long_span(start, period):
+            self._mark_negative([ticker])
+        return data
+
+    def _history_batch(self, tickers, start, end, interval):
+        """ticker -> history frame, one upstream call for the whole batch."""
+        if len(tickers) == 1:
+            return {tickers[0]: self._history_one(tickers[0], start, end, interval, None)}
+        self._count("batched", len(tickers))
+        data = self.download(tickers, start=start, end=end, interval=interval)
+        if data.empty:
+            return {}
+        close = data["Close"]
+        return {t: close[[t]].rename(columns={t: "Close"}) for t in tickers if t in close.columns}
+
+
+def _has_close(data, ticker, n):
+    """Whether a yf.download result holds any close for `ticker`."""
+    import pandas as pd
+    if data.empty:
+        return False
+    close = data["Close"]
+    if isinstance(close, pd.Series):
+        return n == 1 and close.notna().any()
+    return ticker in close.columns and close[ticker].notna().any()
+
+
+_gateway = None
+_gateway_guard = threading.Lock()
+
+
+def get_gateway():
+    """Process-wide Gateway instance."""
+    global _gateway
+    with _gateway_guard:
+        if _gateway is None:
+            _gateway = Gateway()
+        return _gateway
+
+
+def set_gateway(gateway):
+    """Replace the process-wide gateway (a Gateway over a fake client in tests and benchmarks); returns the previous one."""
+    global _gateway
+    with _gateway_guard:
+        previous, _gateway = _gateway, gateway
+        return previous
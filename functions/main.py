@@ -1,16 +1,71 @@
-from firebase_functions import https_fn, options
-import firebase_admin
-from firebase_admin import credentials, firestore
-import yfinance as yf
-import pandas as pd
+from firebase_functions import https_fn, options, scheduler_fn
+import importlib
 import json
-import time
-from portfolio import Portfolio
-import datetime
-
-cred = credentials.Certificate("./quant-algo-4430a-firebase-adminsdk-l8bgg-1b126ee4ee.json")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+import os
+import threading
+from cache import LRUCache, TieredCache
+from timing import traced, span
+
+# Heavy modules (pandas, yfinance, firebase_admin) are imported inside the
+# functions that use them, so each endpoint only pays for what it needs on a
+# cold start. ENDPOINT_MODULES lists them for warm_up() and the startup benchmark.
+ENDPOINT_MODULES = {
+    "get_fast_data": ["yfinance", "gateway"],
+    "get_compare_info": ["yfinance", "gateway", "price_store", "correlation", "covariance", "metrics", "market_data",
+                         "serialization", "downsample", "fetching"],
+    "get_portfolio_data": ["firebase_admin.firestore", "portfolio", "portfolio.snapshot", "trades.log", "covariance",
+                           "market_data", "price_store", "serialization", "downsample", "fetching", "risk"],
+    "portfolio_action": ["firebase_admin.firestore", "yfinance", "gateway", "trades"],
+    "recompute_portfolios": ["firebase_admin.firestore", "portfolio.batch"],
+    "compact_trade_logs": ["firebase_admin.firestore", "trades.log"],
+    "precompute_universe": ["firebase_admin.firestore", "covariance", "price_store"],
+    "refresh_market_data": ["market_data"],
+    "warm_caches": ["firebase_admin.firestore", "yfinance", "gateway", "price_store", "popularity", "fetching"],
+}
+ENDPOINT_CLIENTS = {"get_portfolio_data", "portfolio_action", "recompute_portfolios", "compact_trade_logs",
+                    "precompute_universe", "warm_caches"}
+
+CREDENTIALS_FILE = "./quant-algo-4430a-firebase-adminsdk-l8bgg-1b126ee4ee.json"
+_db = None
+_db_guard = threading.Lock()
+
+
+def get_db():
+    """Firestore client, initialized on first use."""
+    global _db
+    with _db_guard:
+        if _db is None:
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+            with span("firestore_init"):
+                firebase_admin.initialize_app(credentials.Certificate(CREDENTIALS_FILE))
+                _db = firestore.client()
+        return _db
+
+
+def warm_up(endpoint=None, clients=True):
+    """
+    Import what an endpoint needs ahead of its first request.
+
+    Parameters:
+        endpoint: function name, or None for every endpoint
+        clients: also create the Firestore client when the endpoint uses it
+    """
+    endpoints = [endpoint] if endpoint else list(ENDPOINT_MODULES)
+    for name in endpoints:
+        for module in ENDPOINT_MODULES.get(name, []):
+            importlib.import_module(module)
+        if clients and name in ENDPOINT_CLIENTS:
+            get_db()
+
+
+# Optional warm-up at instance start (useful with min instances): WARMUP=1 loads
+# the modules of the function this instance serves (FUNCTION_TARGET), or all of them.
+if os.environ.get("WARMUP") == "1":
+    try:
+        warm_up(os.environ.get("FUNCTION_TARGET"))
+    except Exception as e:
+        print(f"[WARNING] Warm-up failed: {e}")
 
 @https_fn.on_request( 
         cors=options.CorsOptions(
@@ -18,19 +73,49 @@ db = firestore.client()
         cors_methods=["get", "post", "options"],
     )
 )
+@traced("get_fast_data")
 def get_fast_data(req: https_fn.Request) -> https_fn.Response:
-    ticker = req.args.get('t')
-    if not ticker:
+    tickers = list(dict.fromkeys(req.args.getlist('t')))
+    if not tickers:
         return https_fn.Response("Ticker parameter is required", status=400)
-    data = get_fast_cache()
-    result = data.get(ticker)
-    if result is None:
-        result = price_and_change(ticker)
-        data[ticker] = result
-        update_fast_cache(data)
-    if result:
-        return https_fn.Response(json.dumps(result), status=200, content_type="application/json")
-    return https_fn.Response({'message':"Metrics not foun.d"}, status=404)
+
+    if len(tickers) == 1:
+        ticker = tickers[0]
+        result = get_quotes([ticker]).get(ticker)
+        if result is None:
+            from gateway import NoDataError
+            try:
+                with span("upstream"):
+                    result = price_and_change(ticker)
+                update_quote(ticker, result)
+            except NoDataError:
+                result = None
+        if result:
+            record_requests([ticker])
+            with span("serialize"):
+                body = json.dumps(result)
+            return https_fn.Response(body, status=200, content_type="application/json")
+        return https_fn.Response({'message':"Metrics not foun.d"}, status=404)
+
+    # Batch mode: serve fresh quotes from cache, fetch the rest in one bulk call
+    quotes = get_quotes(tickers)
+    cached = [t for t in tickers if t in quotes]
+    missing = [t for t in tickers if t not in quotes]
+    with span("upstream"):
+        fetched = price_and_change_many(missing) if missing else {}
+    for ticker, result in fetched.items():
+        update_quote(ticker, result)
+    quotes.update(fetched)
+    record_requests([t for t in tickers if t in quotes])
+
+    with span("serialize"):
+        body = json.dumps({
+            'quotes': {t: quotes[t] for t in tickers if t in quotes},
+            'cached': cached,
+            'fetched': [t for t in missing if t in fetched],
+            'missing': [t for t in missing if t not in fetched],
+        })
+    return https_fn.Response(body, status=200, content_type="application/json")
 
 
 
@@ -41,61 +126,43 @@ def get_fast_data(req: https_fn.Request) -> https_fn.Response:
         cors_methods=["get", "post", "options"],
     )
 )
+@traced("get_compare_info")
 def get_compare_info(req: https_fn.Request) -> https_fn.Response:
     try:
+        from serialization import FORMATS
+        from downsample import parse_points
+        from price_store import BASE_START, parse_view
+
         tickers = req.args.getlist('t')  # Extract tickers from query params
         if not tickers:
             return https_fn.Response("Tickers parameter is required", status=400)
-
-        # Ensure S&P 500 is always included for calculations but not in the response
-        tickers_set = set(tickers + ["^GSPC"])
-
-        # Fetch cached data
-        cached_returns, cached_corr, cached_plot, cached_prices = get_cached_data()
-
-        # If cache contains extra tickers, reset it
-        if cached_returns.keys() - tickers_set:
-            update_cached_data({}, {}, {}, {})
-            cached_returns, cached_corr, cached_plot, cached_prices = {}, {}, {}, {}
-
-        # Identify new tickers that are not in the cache
-        new_tickers = tickers_set - cached_returns.keys()
-
-        if not new_tickers:
-            # Filter cached results to only return requested tickers
-            filtered_corr = {t: {k: v for k, v in cached_corr[t].items() if k in tickers_set} for t in tickers_set if t in cached_corr}
-            filtered_plot = {t: cached_plot[t] for t in tickers if t in cached_plot}
-            filtered_prices = {t: cached_prices[t] for t in tickers if t in cached_prices}
-            return https_fn.Response(json.dumps({'corr': filtered_corr, 'plot': filtered_plot, 'prices':filtered_prices}), status=200, content_type="application/json")
-
-        # Compute returns for new tickers
-        new_returns, new_plot, new_prices = {}, {}, {}
-        for ticker in new_tickers:
-            price = price_weekly_long(ticker)
-            price.index = price.index.strftime('%Y-%m-%d')
-            new_returns[ticker] = price.pct_change().dropna()
-            if ticker != "^GSPC":
-                new_plot[ticker] = price.to_dict()
-                new_prices[ticker] = price.iloc[-1]
-
-
-        # Merge with cache
-        cached_returns.update(new_returns)
-        cached_plot.update(new_plot)
-        cached_prices.update(new_prices)
-
-        # Compute correlation matrix
-        returns_df = pd.DataFrame(cached_returns).ffill().dropna()
-        cached_corr = returns_df.corr().to_dict()
-
-        # Update cache
-        update_cached_data(cached_returns, cached_corr, cached_plot, cached_prices)
-
-        # Return only requested tickers
-        filtered_corr = {t: {k: v for k, v in cached_corr[t].items() if k in tickers_set} for t in tickers_set if t in cached_corr}
-        filtered_plot = {t: cached_plot[t] for t in tickers if t in cached_plot}
-        filtered_prices = {t: cached_prices[t] for t in tickers if t in cached_prices}
-        return https_fn.Response(json.dumps({'corr': filtered_corr, 'plot': filtered_plot, 'prices':filtered_prices}), status=200, content_type="application/json")
+        fmt = req.args.get('format', 'json')
+        if fmt not in FORMATS:
+            return https_fn.Response(f"format must be one of {', '.join(FORMATS)}", status=400)
+        try:
+            points = parse_points(req.args)
+        except ValueError:
+            return https_fn.Response("points must be an integer", status=400)
+        try:
+            # Weekly closes since BASE_START unless ?interval= / ?start= say otherwise
+            interval, start = parse_view(req.args, interval="1wk", start=BASE_START)
+        except ValueError as e:
+            return https_fn.Response(str(e), status=400)
+
+        # Whole responses are cached per request; incomplete ones (missing tickers) are not
+        key = f"{fmt}:{points}:{view_key(interval, start, ','.join(tickers))}"
+        cached, is_stale = _compare_result_cache.get(key)
+        if cached is None:
+            body, content_type, missing = compare_response(tickers, fmt, points, interval, start)
+            if not missing:
+                _compare_result_cache.set(key, (body, content_type))
+        else:
+            (body, content_type), missing = cached, {}
+            if is_stale:
+                _compare_result_cache.revalidate([key], lambda keys: refresh_compare_result(tickers, fmt, points, key, interval, start))
+        # Only tickers that resolved count towards popularity
+        record_requests([t for t in dict.fromkeys(tickers) if t not in missing])
+        return https_fn.Response(body, status=200, content_type=content_type)
 
     except Exception as e:
         return https_fn.Response(f"Error processing request: {str(e)}", status=500)
@@ -108,15 +175,42 @@ def get_compare_info(req: https_fn.Request) -> https_fn.Response:
         cors_methods=["get", "post", "options"],
     )
 )
+@traced("get_portfolio_data")
 def get_portfolio_data(req: https_fn.Request) -> https_fn.Response:
     portfolio_id = req.args.get('t')  # Fetch portfolio ID
     if not portfolio_id:
         return https_fn.Response(json.dumps({"error": "Portfolio ID is required"}), status=400, content_type="application/json")
+    fmt = req.args.get('format', 'json')
 
     try:
+        from portfolio import Portfolio
+        from portfolio.snapshot import load_snapshot, save_snapshot
+        from trades.log import load_actions
+        from serialization import FORMATS, encode
+        from downsample import downsample, parse_points
+        from covariance import get_matrix
+        from risk import parse_risk
+        from price_store import derive_view, parse_view
+
+        if fmt not in FORMATS:
+            return https_fn.Response(json.dumps({"error": f"format must be one of {', '.join(FORMATS)}"}), status=400, content_type="application/json")
+        try:
+            points = parse_points(req.args)
+        except ValueError:
+            return https_fn.Response(json.dumps({"error": "points must be an integer"}), status=400, content_type="application/json")
+        try:
+            risk = parse_risk(req.args)
+            # Window and frequency of the returned series; metrics always use every daily close
+            interval, start = parse_view(req.args)
+        except ValueError as e:
+            return https_fn.Response(json.dumps({"error": str(e)}), status=400, content_type="application/json")
+        reshape = points is not None or interval != '1d' or start is not None
+
         # Fetch portfolio document from Firestore
+        db = get_db()
         portfolio_ref = db.collection("portfolios").document(portfolio_id)
-        portfolio_doc = portfolio_ref.get()
+        with span("firestore_read"):
+            portfolio_doc = portfolio_ref.get()
 
         if not portfolio_doc.exists:
             print("Empty")
@@ -125,20 +219,44 @@ def get_portfolio_data(req: https_fn.Request) -> https_fn.Response:
         # Extract attributes
         portfolio_data = portfolio_doc.to_dict()
         initial_cash = portfolio_data.get("initialCash", 0)
-        actions = portfolio_data.get("actions", {})
-
-        # Process portfolio
-        p = Portfolio(tickers=actions, initial_cash=initial_cash, db=db)
-        basic, adv = p.get_info()
-
-        for k, v in (basic | adv).items():
-            print(k, v)
-
-
-
-        portfolio_ref.update(basic)
+        # Checkpoint plus the tail of the trade log (and legacy actions of uncompacted portfolios)
+        with span("trade_log_read"):
+            actions = load_actions(db, portfolio_id, portfolio_data)
+
+        # Process portfolio, continuing from the last persisted valuation
+        with span("snapshot_read"):
+            snapshot = load_snapshot(db, portfolio_id)
+        p = Portfolio(tickers=actions, initial_cash=initial_cash, db=db, snapshot=snapshot, matrix=get_matrix())
+        basic, adv = p.get_info(columnar=fmt != 'json' or reshape)
+        if adv and p.missing:
+            adv['missing'] = sorted(p.missing)
+        if adv and risk:
+            adv['risk'] = p.forward_risk(**risk)
+        if reshape:
+            with span("downsample"):
+                for key in ('historicalReturns', 'marketReturns'):
+                    if len(adv.get(key, ())):
+                        adv[key] = derive_view(adv[key], start, interval)
+                        if points:
+                            adv[key] = downsample(adv[key], points)
+                        if fmt == 'json':
+                            adv[key] = dict(zip(adv[key].index.strftime('%Y-%m-%d'), adv[key].values.tolist()))
+        if p.snapshot_changed:
+            with span("snapshot_write"):
+                save_snapshot(db, portfolio_id, p.snapshot, previous=snapshot)
+
+        with span("firestore_write"):
+            portfolio_ref.update(basic)
         if basic:
-            return https_fn.Response(json.dumps(basic | adv), status=200, content_type="application/json")
+            with span("serialize"):
+                if fmt == 'json':
+                    body, content_type = json.dumps(basic | adv), "application/json"
+                else:
+                    series_keys = ('historicalReturns', 'marketReturns')
+                    history = {k: adv[k] for k in series_keys if len(adv.get(k, ()))}
+                    rest = {k: v for k, v in adv.items() if k not in series_keys}
+                    body, content_type = encode(basic | rest, 'history', history, fmt)
+            return https_fn.Response(body, status=200, content_type=content_type)
         return https_fn.Response(json.dumps({"message": "Metrics not found"}), status=404, content_type="application/json")
 
     except IndexError as e:
@@ -152,71 +270,40 @@ def get_portfolio_data(req: https_fn.Request) -> https_fn.Response:
         cors_methods=["get", "post", "options"],
     )
 )
+@traced("portfolio_action")
 def portfolio_action(req: https_fn.Request) -> https_fn.Response:
     if req.method != "POST":
         return https_fn.Response("Method not allowed", status=405)
 
     try:
+        from trades import TradeError, parse_trades, apply_trades
+
         body = req.get_json()
         portfolio_id = body.get("portfolioId")
-        ticker = body.get("ticker")
-        shares_delta = body.get("shares")
-
-        if not portfolio_id or not ticker or shares_delta is None:
+        try:
+            if not portfolio_id:
+                raise TradeError("portfolioId, ticker, and shares are required")
+            deltas = parse_trades(body)
+
+            # One bulk quote fetch for every ticker not fresh in the quote cache
+            with span("upstream"):
+                prices = trade_prices(list(deltas))
+
+            with span("firestore_transaction"):
+                new_cash = apply_trades(get_db(), portfolio_id, deltas, prices)
+        except TradeError as e:
             return https_fn.Response(
-                json.dumps({"error": "portfolioId, ticker, and shares are required"}),
-                status=400,
+                json.dumps({"error": str(e)}),
+                status=e.status,
                 content_type="application/json"
             )
 
-        portfolio_ref = db.collection("portfolios").document(portfolio_id)
-        snapshot = portfolio_ref.get()
-        if not snapshot.exists:
-            return https_fn.Response(
-                json.dumps({"error": "Portfolio not found"}),
-                status=404,
-                content_type="application/json"
-            )
-
-        data = snapshot.to_dict()
-
-        # Fetch price
-        price_info = yf.Ticker(ticker).fast_info
-        price = price_info.get('lastPrice')
-        if price is None or price <= 0:
-            return https_fn.Response(
-                json.dumps({"error": "Error fetching price"}),
-                status=400,
-                content_type="application/json"
-            )
-
-        # Update shares and cash
-        current_shares = data.get("shares", {}).get(ticker, 0)
-        new_shares = current_shares + shares_delta
-
-        current_cash = data.get("cash", 0)
-        new_cash = current_cash - shares_delta * price
-        if new_cash < 0:
-            return https_fn.Response(
-                json.dumps({"error": "Insufficient cash"}),
-                status=400,
-                content_type="application/json"
-            )
-
-        # Update actions
-        current_actions = data.get("actions", {}).get(ticker, {})
-        timestamp = datetime.datetime.now().isoformat()
-        new_actions = {**current_actions, timestamp: shares_delta}
-
-        # Update Firestore document
-        portfolio_ref.update({
-            f"shares.{ticker}": new_shares,
-            f"actions.{ticker}": new_actions,
-            "cash": new_cash,
-        })
-
+        result = {"message": "Portfolio updated successfully"}
+        if "trades" in body:
+            result["cash"] = new_cash
+            result["trades"] = [{"ticker": t, "shares": d, "price": prices[t]} for t, d in deltas.items()]
         return https_fn.Response(
-            json.dumps({"message": "Portfolio updated successfully"}),
+            json.dumps(result),
             status=200,
             content_type="application/json"
         )
@@ -228,33 +315,289 @@ def portfolio_action(req: https_fn.Request) -> https_fn.Response:
             content_type="application/json"
         )
 
+
+@scheduler_fn.on_schedule(schedule="0 6 * * *", timezone=scheduler_fn.Timezone("America/New_York"), memory=options.MemoryOption.GB_2)
+@traced("recompute_portfolios")
+def recompute_portfolios(event: scheduler_fn.ScheduledEvent) -> None:
+    """Nightly refresh of the stored metrics behind the ranking and leaderboard pages."""
+    from portfolio.batch import recompute_all
+    stats = recompute_all(get_db())
+    print(json.dumps(stats))
+
+
+@scheduler_fn.on_schedule(schedule="30 5 * * *", timezone=scheduler_fn.Timezone("America/New_York"))
+@traced("compact_trade_logs")
+def compact_trade_logs(event: scheduler_fn.ScheduledEvent) -> None:
+    """Fold trade log tails (and legacy actions maps) into per-portfolio checkpoints, ahead of the nightly recompute."""
+    from trades.log import compact_all
+    stats = compact_all(get_db())
+    print(json.dumps(stats))
+
+
+@scheduler_fn.on_schedule(schedule="0 5 * * *", timezone=scheduler_fn.Timezone("America/New_York"), memory=options.MemoryOption.GB_4,
+                          timeout_sec=1800)
+@traced("precompute_universe")
+def precompute_universe(event: scheduler_fn.ScheduledEvent) -> None:
+    """Nightly universe-wide correlation/covariance matrix served to compare and portfolio requests."""
+    from covariance import precompute
+    stats = precompute(get_db())
+    print(json.dumps(stats))
+
+
+@scheduler_fn.on_schedule(schedule="5 0 * * *", timezone=scheduler_fn.Timezone("Etc/UTC"))
+@traced("refresh_market_data")
+def refresh_market_data(event: scheduler_fn.ScheduledEvent) -> None:
+    """
+    Daily market returns and RFR, published right after instances' dates roll
+    over (UTC) so requests load the new snapshot instead of fetching it.
+    """
+    from market_data import get_manager
+    get_manager().publish()
+
+
+@scheduler_fn.on_schedule(schedule="*/10 * * * *", memory=options.MemoryOption.GB_1)
+@traced("warm_caches")
+def warm_caches(event: scheduler_fn.ScheduledEvent) -> None:
+    """
+    Refresh quotes and default-view histories of the most requested and most held
+    tickers every CACHE_EXPIRY, so requests find them fresh. Skipped without a
+    shared cache backend, where it would only warm this scheduler instance.
+    """
+    from fetching import fetch_all
+    from popularity import popular_tickers
+    from price_store import BASE_START
+
+    if _quote_cache.backend is None:
+        print("[WARNING] No shared cache backend (CACHE_BACKEND), skipping warm-up")
+        return
+    with span("popular"):
+        tickers = popular_tickers(get_db(), WARM_TICKERS)
+    with span("quotes"):
+        quotes = price_and_change_many(tickers) if tickers else {}
+    for ticker, quote in quotes.items():
+        update_quote(ticker, quote)
+    with span("histories"):
+        fetched, missing = fetch_all(price_view, tickers + ["^GSPC"])
+    for ticker, price in fetched.items():
+        if not price.empty:
+            update_compare_entry(view_key(COMPARE_INTERVAL, BASE_START, ticker), compare_entry(ticker, price))
+    print(json.dumps({"tickers": len(tickers), "quotes": len(quotes), "histories": len(fetched), "missing": missing}))
+
     
 # Cache expiry time (10 minutes)
 CACHE_EXPIRY = 600
 
-_fast_cache = {"data":{}, "timestamp": 0}
-def get_fast_cache():
-    if time.time() - _fast_cache["timestamp"] > CACHE_EXPIRY:
+# Stale entries are served for up to CACHE_STALE more seconds while they refresh in the background
+CACHE_STALE = int(os.environ.get("CACHE_STALE_SECONDS", 300))
+
+# Quotes, per-ticker compare entries (closes of one view, returns, last price) and whole
+# compare responses: an in-process LRU per instance in front of the shared L2 store
+# selected by CACHE_BACKEND (see cache.backends)
+def shared_backend():
+    from cache.backends import get_backend
+    return get_backend(get_db)
+
+QUOTE_CACHE_MAX_BYTES = int(os.environ.get("QUOTE_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+_quote_cache = TieredCache("quote_cache", QUOTE_CACHE_MAX_BYTES, ttl=CACHE_EXPIRY, stale_ttl=CACHE_STALE,
+                           backend=shared_backend)
+def get_quotes(tickers, allow_stale=True):
+    """
+    Retrieve the cached quotes for the given tickers.
+
+    Stale quotes are returned too (unless allow_stale is False) and refreshed
+    in the background.
+    """
+    quotes, stale = _quote_cache.get_many(tickers, allow_stale=allow_stale)
+    if stale:
+        _quote_cache.revalidate(stale, price_and_change_many)
+    return quotes
+def update_quote(ticker, quote):
+    """Cache one quote with its own TTL."""
+    _quote_cache.set(ticker, quote)
+
+COMPARE_CACHE_MAX_BYTES = int(os.environ.get("COMPARE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+_compare_cache = TieredCache("compare_cache", COMPARE_CACHE_MAX_BYTES, ttl=CACHE_EXPIRY, stale_ttl=CACHE_STALE,
+                             backend=shared_backend)
+def get_compare_entries(tickers, interval, start):
+    """Retrieve the cached entries of one view for the given tickers, refreshing stale ones in the background."""
+    keys = {view_key(interval, start, t): t for t in tickers}
+    entries, stale = _compare_cache.get_many(list(keys))
+    if stale:
+        _compare_cache.revalidate(stale, fetch_compare_entries)
+    return {keys[k]: entry for k, entry in entries.items()}
+def update_compare_entry(key, entry):
+    """Cache one entry (keyed by view_key()) with its own TTL."""
+    _compare_cache.set(key, entry)
+
+# Compare interval without ?interval= (closes start at price_store.BASE_START without ?start=)
+COMPARE_INTERVAL = "1wk"
+def view_key(interval, start, tickers):
+    """Cache key of ticker(s) in one view: '<interval>:<start date>:<tickers>'."""
+    return f"{interval}:{start:%Y-%m-%d}:{tickers}"
+
+# Tickers kept warm by the warm_caches job, and per-instance request counting for its ranking
+WARM_TICKERS = int(os.environ.get("WARM_TICKERS", 100))
+def record_requests(tickers):
+    from popularity import record
+    record(tickers, get_db)
+
+COMPARE_RESULT_CACHE_MAX_BYTES = int(os.environ.get("COMPARE_RESULT_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+_compare_result_cache = TieredCache("compare_result_cache", COMPARE_RESULT_CACHE_MAX_BYTES, ttl=CACHE_EXPIRY,
+                                    stale_ttl=CACHE_STALE, backend=shared_backend)
+
+def trade_prices(tickers):
+    """Execution prices from the quote cache, fetching the stale or missing ones in one call."""
+    quotes = get_quotes(tickers, allow_stale=False)
+    missing = [t for t in tickers if t not in quotes]
+    if len(missing) == 1:
+        from gateway import NoDataError
+        try:
+            fetched = {missing[0]: price_and_change(missing[0])}
+        except NoDataError:
+            fetched = {}
+    else:
+        fetched = price_and_change_many(missing) if missing else {}
+    for ticker, quote in fetched.items():
+        update_quote(ticker, quote)
+    quotes.update(fetched)
+    return {t: quotes[t]["price"] for t in tickers if t in quotes}
+
+def compare_response(tickers, fmt, points, interval=None, start=None):
+    """
+    Build the get_compare_info body.
+
+    Closes are the requested view (interval and start, COMPARE_INTERVAL
+    since BASE_START by default) of each ticker's daily base series. 'corr'
+    is always the sample correlation of the basket's returns over their
+    common window (the CorrelationEngine's `ffill().dropna().corr()`), for
+    every view; the nightly universe matrix (pairwise windows, float32) only
+    serves portfolio risk.
+
+    Returns:
+        (body, content type, dict of ticker -> reason for tickers that failed)
+    """
+    from serialization import encode
+    from fetching import fetch_all
+    from price_store import BASE_START
+    interval, start = interval or COMPARE_INTERVAL, BASE_START if start is None else start
+
+    # Ensure S&P 500 is always included for calculations but not in the response
+    tickers_set = set(tickers + ["^GSPC"])
+
+    # Per-ticker entries: only tickers missing from the cache are fetched, in parallel
+    # under one deadline; tickers that fail or time out are reported, not fatal
+    entries = get_compare_entries(tickers_set, interval, start)
+    with span("prices"):
+        fetched, missing = fetch_all(lambda t: price_view(t, interval, start), tickers_set - entries.keys())
+    for ticker, price in fetched.items():
+        if price.empty:
+            missing[ticker] = "no data"
+            continue
+        entries[ticker] = compare_entry(ticker, price)
+        update_compare_entry(view_key(interval, start, ticker), entries[ticker])
+
+    # Correlation over the requested basket, computed incrementally from the returns
+    engine = get_corr_engine()
+    with span("corr"), engine.lock:
+        engine.sync({t: e['returns'] for t, e in entries.items()})
+        corr = engine.corr(list(entries)).to_dict()
+
+    # Return only requested tickers
+    filtered_close = {t: entries[t]['close'] for t in tickers if 'close' in entries.get(t, {})}
+    filtered_prices = {t: entries[t]['price'] for t in tickers if 'price' in entries.get(t, {})}
+    with span("metrics"):
+        market = entries["^GSPC"]['returns'] if "^GSPC" in entries else None
+        metrics = compare_metrics(filtered_close, market)
+    fields = {'corr': corr, 'prices': filtered_prices, 'metrics': metrics,
+              'missing': [t for t in dict.fromkeys(tickers) if t in missing]}
+    if points:
+        with span("downsample"):
+            filtered_close = {t: sampled_close(view_key(interval, start, t), entries[t], points) for t in filtered_close}
+    with span("serialize"):
+        if fmt == 'json':
+            filtered_plot = {t: dict(zip(c.index.strftime('%Y-%m-%d'), c.values.tolist())) for t, c in filtered_close.items()}
+            body, content_type = json.dumps({**fields, 'plot': filtered_plot}), "application/json"
+        else:
+            body, content_type = encode(fields, 'plot', filtered_close, fmt)
+    return body, content_type, missing
+
+def compare_entry(ticker, price):
+    """Cached compare data of one ticker from its close series."""
+    returns = price.pct_change().dropna()
+    returns.index = returns.index.strftime('%Y-%m-%d')
+    entry = {'returns': returns}
+    if ticker != "^GSPC":
+        entry['close'] = price
+        entry['price'] = price.iloc[-1]
+    return entry
+
+def fetch_compare_entries(keys):
+    """Fresh compare entries (by view_key()) for a background revalidation; tickers that fail keep their stale entry."""
+    import pandas as pd
+    from fetching import fetch_all
+    views = {k: k.split(":", 2) for k in keys}
+    fetched, _ = fetch_all(lambda k: price_view(views[k][2], views[k][0], pd.Timestamp(views[k][1])), list(keys))
+    return {k: compare_entry(views[k][2], price) for k, price in fetched.items() if not price.empty}
+
+def refresh_compare_result(tickers, fmt, points, key, interval=None, start=None):
+    """Rebuilt compare response for a background revalidation; empty when it came out incomplete."""
+    body, content_type, missing = compare_response(tickers, fmt, points, interval, start)
+    return {} if missing else {key: (body, content_type)}
+
+# Downsampled compare closes per (entry key, resolution), in their own budget so any
+# number of ?points= values stays bounded
+SAMPLED_CACHE_MAX_BYTES = int(os.environ.get("SAMPLED_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+_sampled_cache = LRUCache(SAMPLED_CACHE_MAX_BYTES, ttl=CACHE_EXPIRY + CACHE_STALE, name="sampled_cache")
+def sampled_close(key, entry, points):
+    """Downsampled close series of a compare entry (cached under `key`), memoized per resolution."""
+    from downsample import downsample
+    cached = _sampled_cache.get((key, points))
+    # Only valid for the entry it was cut from; a refreshed entry has a new close series
+    if cached is not None and cached[0] is entry['close']:
+        return cached[1]
+    sampled = downsample(entry['close'], points)
+    _sampled_cache.set((key, points), (entry['close'], sampled))
+    return sampled
+
+# Aligned returns and window statistics of the last compared basket
+_corr_engine = None
+_corr_engine_guard = threading.Lock()
+def get_corr_engine():
+    global _corr_engine
+    with _corr_engine_guard:
+        if _corr_engine is None:
+            from correlation import CorrelationEngine
+            _corr_engine = CorrelationEngine()
+        return _corr_engine
+
+
+COMPARE_METRICS = ['allTimeGrowth', 'oneYearGrowth', 'sixMonthGrowth', 'threeMonthGrowth', 'oneMonthGrowth',
+                   'cagr', 'maxDrawdown', 'avgDrawdown', 'beta', 'alpha', 'sharpe']
+def compare_metrics(closes, market_returns):
+    """Risk and return metrics of every compared ticker in one batched pass over their closes."""
+    if not closes:
         return {}
-    return _fast_cache["data"]
-def update_fast_cache(data):
-    _fast_cache.update({"data":data, "timestamp": time.time()})
-
-_cache = {"returns": {}, "corr": {}, "plot": {}, "prices":{}, "timestamp": 0}
-def get_cached_data():
-    """Retrieve cached returns, correlation matrix, and plots, ensuring cache expiry."""
-    if time.time() - _cache["timestamp"] > CACHE_EXPIRY:
-        return {}, {}, {}, {} # Expired cache, return empty
-    return _cache["returns"], _cache["corr"], _cache["plot"], _cache["prices"]
-def update_cached_data(returns, corr, plot, prices):
-    """Update the cache with new data and reset timestamp."""
-    _cache.update({"returns": returns, "corr": corr, "plot": plot, "prices":prices, "timestamp": time.time()})
-
-
-
+    import numpy as np
+    import pandas as pd
+    from market_data import get_manager
+    from metrics import compute_metrics
+
+    prices = pd.DataFrame(closes).sort_index()
+    growth = prices.ffill() / prices.bfill().iloc[0]
+    if market_returns is not None:
+        market = market_returns.copy()
+        market.index = pd.to_datetime(market.index)
+        m = compute_metrics(growth.values.T, growth.index, market_returns=market, rfr=get_manager().get_data()["rfr"] or 0.0)
+    else:
+        m = compute_metrics(growth.values.T, growth.index)
+    return {
+        t: {k: (None if np.isnan(m[k][i]) else float(m[k][i])) for k in COMPARE_METRICS}
+        for i, t in enumerate(growth.columns)
+    }
 
 def price_and_change(ticker):  ##
-        dat = yf.Ticker(ticker).fast_info
+        from gateway import get_gateway
+        dat = get_gateway().fast_info(ticker)
         max = round(dat['yearHigh'], 2)
         min = round(dat['yearLow'], 2)
 
@@ -266,7 +609,36 @@ def price_and_change(ticker):  ##
             "range": f'{min} - {max}'
         }
 
-def price_weekly_long(ticker):
-        his = yf.Ticker(ticker).history(start='2005-01-01', interval='5d')['Close']
-        his.index = his.index.tz_localize(None)
+def price_and_change_many(tickers):
+        """Quotes for several tickers from a single bulk download; unknown tickers are left out."""
+        from gateway import get_gateway
+        his = get_gateway().download(tickers, period='1y', interval='1d', group_by='column')
+        quotes = {}
+        if his.empty:
+            return quotes
+        for ticker in tickers:
+            try:
+                close = his['Close'][ticker].dropna()
+                high = his['High'][ticker].dropna()
+                low = his['Low'][ticker].dropna()
+            except KeyError:
+                continue
+            if len(close) < 2:
+                continue
+            current_price = float(close.iloc[-1])
+            open = float(close.iloc[-2])
+            max = round(float(high.max()), 2)
+            min = round(float(low.min()), 2)
+            quotes[ticker] = {
+                "price": current_price,
+                "change": (current_price / open) - 1,
+                "range": f'{min} - {max}'
+            }
+        return quotes
+
+def price_view(ticker, interval=None, start=None):
+        """Closes of one compare view (the default one unless given), cut from the ticker's daily base series."""
+        from price_store import BASE_START, get_store
+        his = get_store().get_view(ticker, start=BASE_START if start is None else start,
+                                   interval=interval or COMPARE_INTERVAL)
         return his.ffill().dropna()
\ No newline at end of file
@@ -1,80 +1,216 @@
 import json
 import os
+import threading
 from datetime import datetime
+import numpy as np
 import pandas as pd
-import yfinance as yf
+from price_store import get_store
+from timing import span
+
+# Cloud Functions only allows writes under /tmp
+DEFAULT_SNAPSHOT_FILE = os.path.join(os.environ.get("MARKET_DATA_DIR", "/tmp/market_data"), "market_data.bin")
+SEED_JSON_FILE = os.path.join(os.path.dirname(__file__), "market_data.json")
+# Snapshot published by the scheduled refresh (see publish()); set MARKET_DATA_BLOB= to disable
+MARKET_DATA_BUCKET = os.environ.get("MARKET_DATA_BUCKET", "quant-algo-4430a.firebasestorage.app")
+MARKET_DATA_BLOB = os.environ.get("MARKET_DATA_BLOB", "market/market_data.bin")
+
+# Snapshot layout: one header record, then int64 dates[n] and float64 returns[n]
+_MAGIC = b"QTXMKT01"
+_HEADER = np.dtype([("magic", "S8"), ("n", "<i8"), ("rfr", "<f8"), ("last_update", "<i8")])
+
+
+class MarketSnapshot:
+    """Immutable, memory-mapped view of one market data snapshot file."""
+
+    def __init__(self, path):
+        header = np.memmap(path, dtype=_HEADER, mode="r", shape=(1,))[0]
+        if header["magic"] != _MAGIC:
+            raise ValueError(f"Not a market data snapshot: {path}")
+        n = int(header["n"])
+        dates = np.memmap(path, dtype="<i8", mode="r", offset=_HEADER.itemsize, shape=(n,))
+        returns = np.memmap(path, dtype="<f8", mode="r", offset=_HEADER.itemsize + 8 * n, shape=(n,))
+
+        self.rfr = float(header["rfr"]) if not np.isnan(header["rfr"]) else None
+        last_update = int(header["last_update"])
+        self.last_update = datetime.fromordinal(last_update).strftime("%Y-%m-%d") if last_update else None
+        self.market_returns = pd.Series(returns, index=pd.DatetimeIndex(dates.view("datetime64[ns]")), copy=False)
+
+    @staticmethod
+    def write(path, market_returns, rfr, last_update):
+        """Write a snapshot to a temp file and swap it in atomically."""
+        market_returns = pd.Series(market_returns, dtype=float).sort_index()
+        index = pd.DatetimeIndex(market_returns.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        header = np.zeros(1, dtype=_HEADER)
+        header["magic"] = _MAGIC
+        header["n"] = len(market_returns)
+        header["rfr"] = np.nan if rfr is None else rfr
+        header["last_update"] = datetime.strptime(last_update, "%Y-%m-%d").toordinal() if last_update else 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(header.tobytes())
+            f.write(index.values.astype("datetime64[ns]").astype("<i8").tobytes())
+            f.write(market_returns.values.astype("<f8").tobytes())
+        os.replace(tmp, path)
+
+
+def _bucket():
+    from google.cloud import storage
+    return storage.Client().bucket(MARKET_DATA_BUCKET)
+
 
 class MarketDataManager:
-    def __init__(self, json_file="./market_data/market_data.json"):
-        self.json_file = json_file
-        self.data = self._load_data()
-
-    def _load_data(self):
-        """Load data from the JSON file or create a new file if it doesn't exist."""
-        if os.path.exists(self.json_file):
-            with open(self.json_file, "r") as file:
-                data = json.load(file)
-                market_returns_dict = {pd.to_datetime(k): v for k, v in data["market_returns"].items()}
-                
-                # Create a pandas Series from the dictionary
-                data["market_returns"] = pd.Series(market_returns_dict)
-                return data
-        else:
-            return {"market_returns": None, "rfr": None, "last_update": None}
+    """
+    Market returns and risk-free rate shared by every request in the process.
+
+    The data is held in a memory-mapped binary snapshot that is loaded once
+    (from the published snapshot, else the bundled seed JSON) and replaced
+    wholesale (new file, atomic rename, reference swap) when refreshed.
+    Readers never see a partially updated snapshot, and never wait for a
+    refresh: an outdated snapshot is served while a background thread pulls
+    the published one (or, if that is outdated too, fetches upstream).
+    """
+
+    def __init__(self, snapshot_file=DEFAULT_SNAPSHOT_FILE, seed_file=SEED_JSON_FILE, blob=MARKET_DATA_BLOB):
+        self.snapshot_file = snapshot_file
+        self.seed_file = seed_file
+        self.blob = blob
+        self._refresh_lock = threading.Lock()
+        self.snapshot = self._load_snapshot()
 
-    def _write_data(self):
-        """Write updated data to the JSON file."""
-        data = self.data
-        data["market_returns"].index = data["market_returns"].index.to_series().apply(lambda x: x.isoformat())
-        data["market_returns"] = data["market_returns"].to_dict()
-        with open(self.json_file, "w") as file:
-            json.dump(data, file, indent=4)
+    def _pull_published(self):
+        """Replace the local snapshot file with the published one; False when there is none."""
+        if not self.blob:
+            return False
+        try:
+            with span("market_data_pull"):
+                blob = _bucket().get_blob(self.blob)
+                if blob is None:
+                    return False
+                tmp = f"{self.snapshot_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+                os.makedirs(os.path.dirname(self.snapshot_file), exist_ok=True)
+                blob.download_to_filename(tmp)
+                MarketSnapshot(tmp)      # validate before swapping it in
+                os.replace(tmp, self.snapshot_file)
+            return True
+        except Exception as e:
+            print(f"[WARNING] Published market data unavailable: {e}")
+            return False
+
+    def _load_snapshot(self):
+        """Map the binary snapshot, pulling the published one or building it from the seed JSON if it doesn't exist."""
+        if not os.path.exists(self.snapshot_file) and not self._pull_published():
+            if os.path.exists(self.seed_file):
+                with open(self.seed_file, "r") as file:
+                    data = json.load(file)
+                returns = pd.Series(data["market_returns"], dtype=float)
+                returns.index = pd.to_datetime(returns.index)
+                MarketSnapshot.write(self.snapshot_file, returns, data.get("rfr"), data.get("last_update"))
+            else:
+                MarketSnapshot.write(self.snapshot_file, pd.Series(dtype=float), None, None)
+        return MarketSnapshot(self.snapshot_file)
 
     def _fetch_market_data(self):
-        """
-        Simulate fetching market returns and RFR from an external source.
-        Replace this function with real API calls to get the data.
-        """
+        """Fetch market returns and the risk-free rate from upstream."""
         market_returns = get_market_returns()
         rfr = get_rfr()
-        
+
         return market_returns, rfr
 
     def _is_update_needed(self):
         """Check if the data needs to be updated (daily update)."""
-        last_update_str = self.data.get("last_update")
+        last_update_str = self.snapshot.last_update
         if last_update_str:
             last_update = datetime.strptime(last_update_str, "%Y-%m-%d")
             return datetime.now().date() > last_update.date()
         return True
 
-    def update_data(self):
-        """Update the market returns and RFR if needed."""
-        if self._is_update_needed():
-            market_returns, rfr = self._fetch_market_data()
-            self.data["market_returns"] = market_returns
-            self.data["rfr"] = rfr
-            self.data["last_update"] = datetime.now().strftime("%Y-%m-%d")
-            self._write_data()
-            print("Market data updated.")
-        else:
+    def _refresh(self):
+        """Runs with the refresh lock held: published snapshot first, upstream only if that is outdated too."""
+        try:
+            if self._pull_published():
+                self.snapshot = MarketSnapshot(self.snapshot_file)
+            if self._is_update_needed():
+                with span("market_data_refresh"):
+                    market_returns, rfr = self._fetch_market_data()
+                MarketSnapshot.write(self.snapshot_file, market_returns, rfr, datetime.now().strftime("%Y-%m-%d"))
+                self.snapshot = MarketSnapshot(self.snapshot_file)
+            print(f"Market data updated ({self.snapshot.last_update}).")
+        except Exception as e:
+            print(f"[WARNING] Market data refresh failed, keeping the {self.snapshot.last_update} snapshot: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def update_data(self, wait=False):
+        """
+        Update the market returns and RFR if needed.
+
+        By default the refresh runs in a background thread and this returns
+        at once; concurrent callers keep the current snapshot.
+
+        Parameters:
+            wait: refresh inline instead (used by the scheduled refresh)
+        """
+        if not self._is_update_needed():
             print("Data is already up-to-date.")
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        if wait:
+            self._refresh()
+        else:
+            threading.Thread(target=self._refresh, name="market-data-refresh", daemon=True).start()
+
+    def publish(self):
+        """
+        Fetch market returns and RFR upstream and publish them for every instance.
+
+        Called by the scheduled refresh, so requests find a current snapshot.
+        """
+        with self._refresh_lock:
+            with span("market_data_refresh"):
+                market_returns, rfr = self._fetch_market_data()
+            MarketSnapshot.write(self.snapshot_file, market_returns, rfr, datetime.now().strftime("%Y-%m-%d"))
+            self.snapshot = MarketSnapshot(self.snapshot_file)
+        if self.blob:
+            with span("market_data_publish"):
+                _bucket().blob(self.blob).upload_from_filename(self.snapshot_file,
+                                                               content_type="application/octet-stream")
+        print(f"[INFO] Published market data for {self.snapshot.last_update}")
 
     def get_data(self):
         self.update_data()
+        snapshot = self.snapshot
         return {
-            "market_returns": self.data.get("market_returns"),
-            "rfr": self.data.get("rfr"),
-            "last_update": self.data.get("last_update"),
+            "market_returns": snapshot.market_returns,
+            "rfr": snapshot.rfr,
+            "last_update": snapshot.last_update,
         }
-    
-   
+
+
+_manager = None
+_manager_guard = threading.Lock()
+
+
+def get_manager():
+    """Process-wide MarketDataManager instance."""
+    global _manager
+    with _manager_guard:
+        if _manager is None:
+            _manager = MarketDataManager()
+        return _manager
+
+
 def get_market_returns():
-    his = yf.Ticker('^GSPC').history(period='5y', interval='1d')
-    his.index = pd.to_datetime(his.index).tz_localize(None)
-    return his.ffill().dropna()['Close'].pct_change().dropna()
+    start = pd.Timestamp(datetime.now()).normalize() - pd.DateOffset(years=5)
+    his = get_store().get_view('^GSPC', start=start, interval='1d')
+    return his.ffill().dropna().pct_change().dropna()
 
-def get_rfr(): 
-    dat = yf.Ticker('^TNX').fast_info
+def get_rfr():
+    from gateway import get_gateway
+    dat = get_gateway().fast_info('^TNX')
     current_price = dat["lastPrice"]
-    return current_price / 100
\ No newline at end of file
+    return current_price / 100
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+# (days, output key) of the annualized trailing returns
+PERIODS = [(365, 'oneYearGrowth'), (182, 'sixMonthGrowth'), (91, 'threeMonthGrowth'), (30, 'oneMonthGrowth')]
+
+
+def _masked_stats(x, y, mask):
+    """Per-row mean of x, y and ddof=1 var/cov over the masked columns of two 2-D arrays."""
+    n = mask.sum(axis=1)
+    xs = np.where(mask, x, 0.0)
+    ys = np.where(mask, y, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx = xs.sum(axis=1) / n
+        my = ys.sum(axis=1) / n
+        dx = np.where(mask, x - mx[:, None], 0.0)
+        dy = np.where(mask, y - my[:, None], 0.0)
+        var_x = (dx * dx).sum(axis=1) / (n - 1)
+        var_y = (dy * dy).sum(axis=1) / (n - 1)
+        cov = (dx * dy).sum(axis=1) / (n - 1)
+    return n, mx, my, var_x, var_y, cov
+
+
+def _rolling(x, y, mask, window):
+    """Rolling ddof=1 std of x and beta of x on y over `window` columns (NaN until full)."""
+    def csum(a):
+        return np.concatenate([np.zeros((a.shape[0], 1)), np.cumsum(np.where(mask, a, 0.0), axis=1)], axis=1)
+
+    def win(c):
+        return c[:, window:] - c[:, :-window]
+
+    n = win(csum(np.ones_like(x)))
+    sx, sy, sxx, syy, sxy = (win(csum(a)) for a in (x, y, x * x, y * y, x * y))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var_x = (sxx - sx * sx / n) / (n - 1)
+        var_y = (syy - sy * sy / n) / (n - 1)
+        cov = (sxy - sx * sy / n) / (n - 1)
+        vol = np.sqrt(np.clip(var_x, 0, None))
+        beta = cov / var_y
+    full = n == window
+    pad = np.full((x.shape[0], window - 1), np.nan)
+    return (np.concatenate([pad, np.where(full, vol, np.nan)], axis=1),
+            np.concatenate([pad, np.where(full, beta, np.nan)], axis=1))
+
+
+def compute_metrics(values, index, market_returns=None, rfr=None, window=12):
+    """
+    Return and risk metrics for many value series on one date axis.
+
+    Every series may start late (leading NaNs) but must be gap-free after its
+    first value. The definitions follow Portfolio._compute_returns: trailing
+    returns are annualized from the first value on or after `end - days`,
+    CAGR and drawdowns need 30 days of history, and beta, alpha and Sharpe
+    use calendar-month returns of the days that also have a market return.
+
+    Parameters:
+        values: 2-D array-like (series x dates), or 1-D for a single series
+        index: pd.DatetimeIndex of the dates
+        market_returns: optional pd.Series of daily market returns
+        rfr: annual risk-free rate, required with market_returns
+        window: months in the rolling volatility and beta windows
+
+    Returns:
+        dict of per-series arrays: 'totalDays', 'allTimeGrowth', one entry per
+        PERIODS key, 'cagr', 'maxDrawdown', 'avgDrawdown', 'beta', 'alpha',
+        'sharpe' and the month count 'months' (NaN where not defined). With
+        market returns it also holds (series x months) 'rollingVolatility'
+        and 'rollingBeta' on 'monthIndex', and (series x dates)
+        'marketCumulative' on 'marketIndex'
+    """
+    V = np.atleast_2d(np.asarray(values, dtype=float))
+    index = pd.DatetimeIndex(index)
+    S, T = V.shape
+    valid = ~np.isnan(V)
+    has = valid.any(axis=1)
+    first = np.argmax(valid, axis=1)
+    rows = np.arange(S)
+
+    out = {}
+    start_val = V[rows, first]
+    curr = V[:, -1]
+    days = np.asarray((index[-1] - index[first]).days, dtype=float)
+    days[~has] = np.nan
+    out['totalDays'] = days
+    out['allTimeGrowth'] = curr - 1
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for d, key in PERIODS:
+            pos = index.searchsorted(index[-1] - pd.Timedelta(days=d))
+            ok = days >= d
+            out[key] = np.where(ok, (curr / V[:, min(pos, T - 1)]) ** (365 / d) - 1, np.nan)
+
+        # CAGR and drawdowns
+        years = np.maximum(days / 365, 1e-6)
+        long_enough = days >= 30
+        out['cagr'] = np.where(long_enough, (curr / start_val) ** (1 / years) - 1, np.nan)
+        drawdown = 1 - V / np.fmax.accumulate(V, axis=1)
+        out['maxDrawdown'] = np.where(long_enough, np.nanmax(np.where(valid, drawdown, -np.inf), axis=1), np.nan)
+        out['avgDrawdown'] = np.where(long_enough, np.nansum(drawdown, axis=1) / valid.sum(axis=1), np.nan)
+
+    for key in ('beta', 'alpha', 'sharpe', 'months'):
+        out[key] = np.full(S, np.nan)
+    if market_returns is None or T < 2:
+        return out
+
+    # Daily returns on the dates that also carry a market return
+    market = pd.Series(market_returns, dtype=float)
+    market.index = pd.to_datetime(market.index)
+    keep = np.flatnonzero(index[1:].isin(market.index)) + 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        R = V[:, keep] / V[:, keep - 1] - 1
+    R_ok = ~np.isnan(R)
+    M = market.reindex(index[keep]).values[None, :].repeat(S, axis=0)
+    kept_index = index[keep]
+
+    # Calendar-month compounding; empty months in between count as flat
+    NO_MONTH = np.iinfo(np.int64).max
+    month = kept_index.to_period('M').asi8
+    if len(keep):
+        months = np.arange(month.min(), month.max() + 1)
+        lo = np.where(R_ok.any(axis=1), month[np.argmax(R_ok, axis=1)], NO_MONTH)
+    else:
+        months, lo = np.array([], dtype=np.int64), np.full(S, NO_MONTH)
+    starts = np.flatnonzero(np.r_[True, month[1:] != month[:-1]]) if len(keep) else np.array([], dtype=np.int64)
+    cols = np.searchsorted(months, month[starts])
+    growth_p = np.ones((S, len(months)))
+    growth_m = np.ones((S, len(months)))
+    for g, r in ((growth_p, R), (growth_m, M)):
+        if len(starts):
+            g[:, cols] = np.multiply.reduceat(np.where(R_ok, 1 + r, 1.0), starts, axis=1)
+    pm, mm = growth_p - 1, growth_m - 1
+    in_range = months[None, :] >= lo[:, None]
+
+    rfr_adj = (1 + float(rfr)) ** (1 / 12) - 1
+    n, p_mean, m_mean, p_var, m_var, cov = _masked_stats(pm, mm, in_range)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ok = (m_var != 0) & (n >= 6)
+        beta = cov / m_var
+        out['months'] = n.astype(float)
+        out['beta'] = np.where(ok, beta, np.nan)
+        out['alpha'] = np.where(ok, p_mean - (rfr_adj + beta * (m_mean - rfr_adj)), np.nan)
+        out['sharpe'] = np.where(ok, (p_mean - rfr_adj) / np.sqrt(p_var), np.nan)
+        out['marketCumulative'] = np.where(R_ok, np.cumprod(np.where(R_ok, 1 + M, 1.0), axis=1) - 1, np.nan)
+    out['marketIndex'] = kept_index
+
+    vol, rolling_beta = _rolling(pm, mm, in_range, window) if len(months) >= window else (
+        np.full(pm.shape, np.nan), np.full(pm.shape, np.nan))
+    out['rollingVolatility'] = vol * np.sqrt(12)
+    out['rollingBeta'] = rolling_beta
+    out['monthIndex'] = pd.PeriodIndex.from_ordinals(months, freq='M')
+    out['rfrMonthly'] = rfr_adj
+    return out
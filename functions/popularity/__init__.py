@@ -0,0 +1,94 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+from itertools import zip_longest
+
+# Requested tickers are counted per instance and added to Firestore at most this often
+FLUSH_SECONDS = int(os.environ.get("POPULARITY_FLUSH_SECONDS", 300))
+STATS_DOCUMENT = ("stats", "tickerRequests")
+# At most this many tickers (the most requested) are written per flush
+FLUSH_MAX_TICKERS = int(os.environ.get("POPULARITY_FLUSH_MAX_TICKERS", 500))
+# Counted tickers are used as Firestore field names; anything else is not counted
+TICKER_PATTERN = r"[A-Za-z0-9^][A-Za-z0-9.^=-]{0,19}"
+# Portfolios holding each ticker, rewritten by the nightly recompute from its full read
+HOLDERS_DOCUMENT = ("stats", "tickerHolders")
+
+_pending = Counter()
+_flushed = time.time()
+_guard = threading.Lock()
+
+
+def _flush(db, counts):
+    from firebase_admin import firestore
+    try:
+        db.collection(STATS_DOCUMENT[0]).document(STATS_DOCUMENT[1]).set(
+            {t: firestore.Increment(n) for t, n in counts.items()}, merge=True)
+    except Exception as e:
+        print(f"[WARNING] Ticker request counts not saved: {e}")
+
+
+def record(tickers, db_factory):
+    """
+    Count a request for `tickers`; every FLUSH_SECONDS the counts of the
+    FLUSH_MAX_TICKERS most requested tickers are added to the shared stats
+    document in a background thread.
+
+    Parameters:
+        tickers: tickers the request resolved (quotes served, compare entries
+            found); values that aren't ticker-shaped are ignored
+        db_factory: callable returning the Firestore client
+    """
+    global _flushed
+    with _guard:
+        _pending.update(dict.fromkeys((t for t in tickers if re.fullmatch(TICKER_PATTERN, t)), 1))
+        if time.time() - _flushed < FLUSH_SECONDS or not _pending:
+            return
+        counts = dict(_pending.most_common(FLUSH_MAX_TICKERS))
+        _pending.clear()
+        _flushed = time.time()
+    threading.Thread(target=lambda: _flush(db_factory(), counts), name="popularity-flush", daemon=True).start()
+
+
+def save_holders(db, portfolios):
+    """
+    Store how many portfolios hold each ticker (non-zero shares).
+
+    Parameters:
+        db: Firestore database object
+        portfolios: dict of portfolio id -> document dict, every portfolio
+    """
+    held = Counter(t for data in portfolios.values() for t, n in data.get("shares", {}).items() if n)
+    try:
+        db.collection(HOLDERS_DOCUMENT[0]).document(HOLDERS_DOCUMENT[1]).set(dict(held))
+    except Exception as e:
+        print(f"[WARNING] Ticker holder counts not saved: {e}")
+
+
+def _counts(db, document):
+    doc = db.collection(document[0]).document(document[1]).get()
+    return Counter(doc.to_dict() or {}) if doc.exists else Counter()
+
+
+def popular_tickers(db, limit):
+    """
+    Most requested and most held tickers, alternating between the two rankings.
+
+    Reads the two stats documents only; holder counts are as of the last
+    nightly recompute.
+
+    Parameters:
+        db: Firestore database object
+        limit: number of tickers to return
+
+    Returns:
+        list of tickers, most popular first
+    """
+    requested = _counts(db, STATS_DOCUMENT)
+    held = _counts(db, HOLDERS_DOCUMENT)
+
+    ranked = {}
+    for pair in zip_longest([t for t, _ in requested.most_common(limit)], [t for t, _ in held.most_common(limit)]):
+        ranked.update((t, None) for t in pair if t is not None)
+    return list(ranked)[:limit]
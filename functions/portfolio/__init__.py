@@ -1,15 +1,30 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
-from datetime import timedelta
-from market_data import MarketDataManager
-from portfolio.helpers import get_pnl, get_df
+from datetime import datetime, timedelta
+from market_data import get_manager
+from portfolio.helpers import pnl_frame, actions_list, pnl_matrix, matrix_state, matrix_actions, get_df
+from portfolio.snapshot import actions_digest
+from price_store import get_store
+from metrics import compute_metrics, PERIODS
+from timing import span
+from fetching import fetch_all
+
+
+def _hourly_history(ticker):
+    """Full hourly close history of one ticker (fallback when there are no daily prices)."""
+    from gateway import get_gateway
+    his = get_gateway().history(ticker, period='max', interval='1h')
+    return his['Close'].ffill() if not his.empty else pd.Series(dtype=float)
 
 
 class Portfolio:
-    def __init__(self, tickers: dict, initial_cash: float, db):
+    def __init__(self, tickers: dict, initial_cash: float, db, snapshot=None, prices=None, assets=None, m_data=None,
+                 matrix=None):
         self.db = db
-        self.m_data = MarketDataManager().get_data()
+        if m_data is None:
+            with span("market_data"):
+                m_data = get_manager().get_data()
+        self.m_data = m_data
         self.initial_cash = float(initial_cash)
         self.cash = self.initial_cash
         self.actions = []
@@ -24,65 +39,168 @@ class Portfolio:
         self.value = self.initial_cash
         self.tickers = tickers
 
-        print(f"[DEBUG] Initializing Portfolio with tickers: {tickers}, initial_cash: {initial_cash}")
-        self._process_tickers(tickers)
+        # valuation state persisted between runs (see portfolio.snapshot)
+        self.snapshot = None
+        self.snapshot_changed = False
+
+        # pre-fetched inputs shared by batch jobs (see portfolio.batch)
+        self.shared_prices = prices
+        self.assets = assets
+
+        # precomputed universe correlation/covariance (see covariance), sliced in get_info
+        self.matrix = matrix
+
+        # tickers left out because no price data could be fetched: ticker -> reason
+        self.missing = {}
+
+        print(f"[DEBUG] Initializing Portfolio with {len(tickers)} tickers, initial_cash: {initial_cash}")
+        self._process_tickers(tickers, snapshot)
 
     # -----------------------------
-    def _prepare_prices(self, tickers: dict):
+    def _prepare_prices(self, tickers: dict, since=None):
         print("[DEBUG] Preparing prices...")
-        all_dates = {pd.to_datetime(d).tz_localize(None) for t in tickers for d in tickers[t].keys()}
-        min_date = min(all_dates) - timedelta(weeks=1)
+        first = min(a.index.min() for a in tickers.values()).tz_localize(None) if since is None else since
+        min_date = first - timedelta(weeks=1)
         tick_list = list(tickers.keys())
-        print(f"[DEBUG] Downloading data for tickers: {tick_list} starting from {min_date}")
-
-        prices = yf.download(
-            tick_list,
-            start=min_date.strftime('%Y-%m-%d'),
-            interval='1d'
-        )['Close'].ffill()
-
-        print(f"[DEBUG] Prices fetched, head:\n{prices.head()}")
+        if self.shared_prices is not None:
+            # Same calendar as a download of just these tickers: drop rows none of them trade on
+            prices = self.shared_prices.reindex(columns=tick_list)
+            prices = prices[prices.index >= min_date.normalize()].dropna(how='all').ffill()
+            return prices
+
+        print(f"[DEBUG] Downloading data for {len(tick_list)} tickers starting from {min_date}")
+        prices = get_store().get_views(tick_list, start=min_date, interval='1d').ffill()
         return prices
 
+    def _valid_snapshot(self, snapshot, actions):
+        """Return the snapshot if it still describes these actions, else None."""
+        if not snapshot:
+            return None
+        if snapshot['initialCash'] != self.initial_cash:
+            return None
+        if snapshot['digest'] != actions_digest(actions, snapshot['asOf']):
+            print("[DEBUG] Actions changed before snapshot date, recomputing from scratch.")
+            return None
+        return snapshot
+
     # -----------------------------
-    def _process_tickers(self, tickers: dict):
-        tickers = {t: a for t, a in tickers.items() if a}
+    def _process_tickers(self, tickers: dict, snapshot=None):
+        tickers = {t: a for t, a in tickers.items() if len(a)}
         if not tickers:
             print("[DEBUG] No valid tickers with actions.")
             return
 
-        prices = self._prepare_prices(tickers)
-
-        for ticker, actions in tickers.items():
-            print(f"[DEBUG] Processing {ticker} with actions: {actions}")
-            actions_series = pd.Series({pd.to_datetime(d): float(qty) for d, qty in actions.items()})
-
-            price_series = prices[ticker].dropna()
-            if price_series.empty:
-                print(f"[DEBUG] No daily prices found for {ticker}, fetching hourly history.")
-                price_series = yf.Ticker(ticker).history(period='max', interval='1h')['Close'].ffill()
-
-            if price_series.empty:
+        # Trade logs come typed (see trades.log); plain {timestamp: shares} maps are parsed here
+        parsed = {t: a if isinstance(a, pd.Series) else
+                  pd.Series({pd.to_datetime(d): float(qty) for d, qty in a.items()}, dtype=float)
+                  for t, a in tickers.items()}
+        snapshot = self._valid_snapshot(snapshot, parsed)
+        states = snapshot['tickers'] if snapshot else {}
+        as_of = snapshot['asOf'] if snapshot else None
+
+        # Only prices after the snapshot date are needed when every ticker is covered
+        incremental = bool(states) and all(t in states for t in tickers)
+        with span("prices"):
+            prices = self._prepare_prices(parsed, since=as_of if incremental else None)
+
+        # Rows before today are final and are frozen into the next snapshot
+        cutoff = pd.Timestamp(datetime.now()).normalize()
+        frozen = {}
+
+        # Tickers without daily prices fall back to hourly history, fetched in parallel
+        daily = [t for t in parsed if t in states or not prices[t].dropna().empty]
+        hourly = [t for t in parsed if t not in daily]
+        if hourly:
+            print(f"[DEBUG] No daily prices found for {hourly}, fetching hourly history.")
+        with span("prices"):
+            histories, self.missing = fetch_all(_hourly_history, hourly)
+        fallback = {}
+        for ticker in hourly:
+            price_series = histories.get(ticker)
+            if price_series is None or price_series.empty:
                 print(f"[WARNING] No price data available for {ticker}, skipping.")
+                self.missing.setdefault(ticker, "no data")
                 continue
+            fallback[ticker] = pnl_frame(parsed[ticker], price_series)
+
+        # All daily tickers in one pass on a shared date axis
+        with span("pnl"):
+            m = pnl_matrix(prices[daily], {t: parsed[t] for t in daily},
+                           {t: (as_of, states[t]) for t in daily if t in states})
+        own = m['own']
+        has_rows = own.any(axis=0)
+        last_row = len(m['index']) - 1 - np.argmax(own[::-1], axis=0) if own.size else np.zeros(len(daily), dtype=int)
+        col = {t: j for j, t in enumerate(daily)}
+        trades = matrix_actions(m)
+        final = m['index'] < cutoff
+        last_day = cutoff.strftime('%Y-%m-%d')
+
+        processed = []
+        for ticker in parsed:
+            state = states.get(ticker)
+            if ticker in fallback:
+                frame = fallback[ticker]
+                values = frame.iloc[-1]
+                contrib = frame['value'].iloc[-1]
+                new_actions = actions_list(frame)
+            elif ticker in col:
+                j = col[ticker]
+                values = matrix_state(m, last_row[j], j) if has_rows[j] else state
+                contrib = m['value'][last_row[j], j] if has_rows[j] else state['pnl'].iloc[-1]
+                new_actions = trades[j]
+                if state is not None:
+                    new_actions = state['actions'] + new_actions
+            else:
+                continue
+            processed.append(ticker)
 
-            pnl, total_value, cash_diff, action_list, num_shares, last_price, avg_buy = get_pnl(actions_series, price_series)
-            print(f"[DEBUG] {ticker} -> shares: {num_shares}, last_price: {last_price}, cash_diff: {cash_diff}")
+            num_shares, last_price, cash_diff = values['shares'], values['price'], values['cash']
+            avg_buy = values['buy_cost'] / values['buy_shares'] if values['buy_shares'] > 0 else 0.0
 
             # Cash after trade effects
             self.cash += float(cash_diff)
 
-            # Holdings time series
-            self.holdings[ticker] = pnl.astype(float)
-
             # Save per-ticker state
-            current_market_val = float(num_shares * last_price)
-            self.market_value[ticker] = current_market_val   # ✅ actual market value
-            self.contrib[ticker] = float(pnl.iloc[-1])
+            self.market_value[ticker] = float(num_shares * last_price)
+            self.contrib[ticker] = float(contrib)
             self.num[ticker] = float(num_shares)
             self.price[ticker] = float(last_price)
             self.avg_buy[ticker] = float(avg_buy)
-            self.actions += [{**a, 'ticker': ticker} for a in action_list]
+            self.actions += [{**a, 'ticker': ticker} for a in new_actions]
+
+            # Freeze every row before the cutoff for the next run (hourly fallbacks are always recomputed)
+            if ticker in fallback:
+                continue
+            if state is not None and as_of == cutoff:
+                frozen[ticker] = state
+                continue
+            done = own[:, j] & final
+            if done.any():
+                k = np.flatnonzero(done)[-1]
+                stamps, values = m['index'].values[done], m['value'][done, j]
+                if state is not None:
+                    stamps = np.concatenate([state['pnl'].index.values, stamps])
+                    values = np.concatenate([state['pnl'].values, values])
+                frozen[ticker] = {
+                    **matrix_state(m, k, j),
+                    'actions': (state['actions'] if state else []) + [a for a in trades[j] if a['date'] < last_day],
+                    'pnl': pd.Series(values, index=pd.DatetimeIndex(stamps)),
+                }
+            elif state is not None:
+                frozen[ticker] = state
+
+        if processed:
+            self.holdings = self._assemble_holdings(processed, m, fallback, states)
+
+        self.snapshot = {
+            'asOf': cutoff,
+            'initialCash': self.initial_cash,
+            'digest': actions_digest(parsed, cutoff),
+            'tickers': frozen,
+            # Only these tickers' series need rewriting; the rest are unchanged since the last save
+            'changed': [t for t, state in frozen.items() if state is not states.get(t)],
+        }
+        self.snapshot_changed = snapshot is None or as_of != cutoff or frozen.keys() != states.keys()
 
         # Total portfolio value over time (cash + positions)
         if not self.holdings.empty:
@@ -94,8 +212,53 @@ class Portfolio:
             self.value = float(self.cash + sum(self.market_value.values()))
             print(f"[DEBUG] Portfolio value updated: {self.value}, cash: {self.cash}")
 
+    def _assemble_holdings(self, processed, m, fallback, states):
+        """
+        Per-ticker P&L columns on the first processed ticker's dates, as
+        assigning them one column at a time would align them.
+
+        Matrix rows, snapshot series and hourly fallbacks are stacked into
+        one array and the frame is built once.
+        """
+        first = processed[0]
+        if first in fallback:
+            base = fallback[first]['value'].index
+        else:
+            j = m['tickers'].index(first)
+            base = m['index'][m['own'][:, j]]
+            if first in states:
+                base = states[first]['pnl'].index.append(base)
+
+        # Daily tickers: one masked take from the shared matrix
+        col = {t: j for j, t in enumerate(m['tickers'])}
+        daily = [col[t] for t in processed if t in col]
+        H = np.full((len(base), len(processed)), np.nan)
+        if daily:
+            pos = m['index'].get_indexer(base)
+            rows = np.maximum(pos, 0)
+            at = [i for i, t in enumerate(processed) if t in col]
+            H[:, at] = np.where((pos >= 0)[:, None] & m['own'][:, daily][rows], m['value'][:, daily][rows], np.nan)
+
+        # Snapshot and hourly fallback series, scattered onto `base` in one pass
+        extra = [(i, fallback[t]['value'] if t in fallback else states[t]['pnl'])
+                 for i, t in enumerate(processed) if t in fallback or t in states]
+        if extra:
+            stamps = np.concatenate([s.index.values for _, s in extra])
+            # Scatter onto a unique calendar; rows off `base` are dropped, as reindex would
+            calendar = base if base.is_unique else pd.DatetimeIndex(np.unique(base.values))
+            slot = calendar.get_indexer(stamps)
+            hit = slot >= 0
+            E = np.full((len(calendar), len(extra)), np.nan)
+            E[slot[hit], np.repeat(np.arange(len(extra)), [len(s) for _, s in extra])[hit]] = \
+                np.concatenate([s.values for _, s in extra]).astype(float)[hit]
+            if calendar is not base:
+                E = E[calendar.get_indexer(base)]
+            cols = [i for i, _ in extra]
+            H[:, cols] = np.where(np.isnan(H[:, cols]), E, H[:, cols])
+        return pd.DataFrame(H, index=base, columns=processed)
+
     # -----------------------------
-    def _compute_returns(self):
+    def _compute_returns(self, columnar=False):
         if 'portfolio' not in self.holdings or self.holdings.empty:
             return {}, {}
 
@@ -106,73 +269,122 @@ class Portfolio:
                 'allTimeGrowth': float(portfolio_series.iloc[-1] - 1)
             }, {}
 
-        curr_val = float(portfolio_series.iloc[-1])
-        total_days = (portfolio_series.index[-1] - portfolio_series.index[0]).days
-
-        def safe_period_return(days):
-            if total_days < days:
-                return None
-            end_date = portfolio_series.index[-1]
-            start_date = end_date - timedelta(days=days)
-            subset = portfolio_series[portfolio_series.index >= start_date]
-            if subset.empty:
-                return None
-            start_val = float(subset.iloc[0])
-            return float((curr_val / start_val) ** (365 / days) - 1)
-
-        returns = {'allTimeGrowth': float(curr_val - 1)}
-        for d, k in [(365, 'oneYearGrowth'), (182, 'sixMonthGrowth'), (91, 'threeMonthGrowth'), (30, 'oneMonthGrowth')]:
-            val = safe_period_return(d)
-            if val is not None:
-                returns[k] = val
+        use_market = bool(self.m_data) and (portfolio_series.index[-1] - portfolio_series.index[0]).days >= 180
+        m = compute_metrics(
+            portfolio_series.values, portfolio_series.index,
+            market_returns=self.m_data.get("market_returns") if use_market else None,
+            rfr=self.m_data.get("rfr") if use_market else None,
+        )
+        total_days = m['totalDays'][0]
+
+        returns = {'allTimeGrowth': float(m['allTimeGrowth'][0])}
+        for _, k in PERIODS:
+            if not np.isnan(m[k][0]):
+                returns[k] = float(m[k][0])
 
         # CAGR & risk metrics
         if total_days >= 30:
-            years = max(total_days / 365, 1e-6)
-            start_value = float(portfolio_series.iloc[0])
-            returns['cagr'] = float((curr_val / start_value) ** (1 / years) - 1)
-
-            rolling_max = portfolio_series.cummax()
-            drawdown = 1 - portfolio_series / rolling_max
-            returns['maxDrawdown'] = float(drawdown.max())
-            returns['avgDrawdown'] = float(drawdown.mean())
+            returns['cagr'] = float(m['cagr'][0])
+            returns['maxDrawdown'] = float(m['maxDrawdown'][0])
+            returns['avgDrawdown'] = float(m['avgDrawdown'][0])
 
         alpha = beta = sharpe = None
         marketRet = {}
-        if self.m_data and total_days >= 180:
-            market_returns = pd.Series(self.m_data.get("market_returns")).astype(float)
-            rfr = float(self.m_data.get("rfr"))
-            rfr_adj = (1 + rfr) ** (1 / 12) - 1
-
-            portfolio_ret = portfolio_series.pct_change().dropna()
-            market_returns.index = pd.to_datetime(market_returns.index)
-            portfolio_ret = portfolio_ret[portfolio_ret.index.isin(market_returns.index)]
-            market_ret_aligned = market_returns.loc[portfolio_ret.index]
-
-            portfolio_monthly = (1 + portfolio_ret).resample('ME').prod() - 1
-            market_monthly = (1 + market_ret_aligned).resample('ME').prod() - 1
-
-            if market_monthly.var() != 0 and len(portfolio_monthly) >= 6:
-                cov_matrix = np.cov(portfolio_monthly, market_monthly)
-                beta = float(cov_matrix[0, 1] / market_monthly.var())
-                alpha = float(portfolio_monthly.mean() - (rfr_adj + beta * (market_monthly.mean() - rfr_adj)))
-                sharpe = float((portfolio_monthly.mean() - rfr_adj) / portfolio_monthly.std())
-
-                market_prices = (market_ret_aligned + 1).cumprod() - 1
-                marketRet = {k.strftime('%Y-%m-%d'): float(v) for k, v in market_prices.items()}
+        if use_market and not np.isnan(m['beta'][0]):
+            beta = float(m['beta'][0])
+            alpha = float(m['alpha'][0])
+            sharpe = float(m['sharpe'][0])
+            market_prices = m['marketCumulative'][0]
+            ok = ~np.isnan(market_prices)
+            if columnar:
+                marketRet = pd.Series(market_prices[ok], index=m['marketIndex'][ok])
+            else:
+                marketRet = dict(zip(m['marketIndex'][ok].strftime('%Y-%m-%d'), market_prices[ok].tolist()))
 
         returns['alpha'] = alpha
         returns['beta'] = beta
         returns['sharpe'] = sharpe
-        history = {k.strftime('%Y-%m-%d'): float(v) for k, v in portfolio_series.sub(1).items()}
+        if columnar:
+            return returns, {'historicalReturns': portfolio_series - 1, 'marketReturns': marketRet}
+        history = dict(zip(portfolio_series.index.strftime('%Y-%m-%d'), (portfolio_series.values - 1).tolist()))
         return returns, {'historicalReturns': history, 'marketReturns': marketRet}
 
+    def forward_risk(self, method="bootstrap", horizon=None, paths=None, seed=None):
+        """
+        Monte Carlo VaR/CVaR of the current holdings over the next `horizon` days.
+
+        Joint daily returns of the held tickers over the last risk.LOOKBACK_DAYS
+        drive the simulation; positions are weighted by market value and cash
+        stays flat. Tickers without daily prices are left out (reported in
+        'excluded') and their weight is treated as cash.
+
+        Returns:
+            dict from risk.summarize() plus the simulation settings, or {}
+        """
+        from risk import HORIZON_DAYS, DEFAULT_PATHS, LOOKBACK_DAYS, simulate, summarize
+        horizon = horizon or HORIZON_DAYS
+        paths = paths or DEFAULT_PATHS
+        held = [t for t in self.tickers if self.num.get(t)]
+        if not held:
+            return {}
+
+        start = pd.Timestamp(datetime.now()).normalize() - timedelta(days=LOOKBACK_DAYS)
+        with span("risk_prices"):
+            prices = get_store().get_views(held, start=start, interval='1d')
+        returns = prices.reindex(columns=held).ffill().pct_change(fill_method=None).iloc[1:]
+        usable = [t for t in held if returns[t].notna().sum() > 1]
+        returns = returns[usable].dropna()
+        if len(returns) < 2:
+            return {}
+
+        total_val = max(self.cash + sum(self.market_value.values()), 1e-9)
+        weights = np.array([self.market_value[t] / total_val for t in usable])
+        with span("risk_simulation"):
+            terminal = simulate(returns.values, weights, horizon=horizon, paths=paths, method=method, seed=seed)
+        return {
+            'method': method,
+            'horizonDays': horizon,
+            'paths': paths,
+            'historyDays': len(returns),
+            'excluded': [t for t in held if t not in usable],
+            **summarize(terminal),
+        }
+
+    def _risk_matrix(self, weights):
+        """
+        Holdings' correlation and the portfolio's annualized volatility from the
+        universe matrix (an O(k^2) slice; nothing is downloaded or recomputed).
+        """
+        holding = [t for t in self.tickers if self.num.get(t)]
+        held = [t for t in holding if t in self.matrix]
+        if len(held) < 2:
+            return {}
+        corr = self.matrix.slice(held)
+        risk = {'correlation': {t: {u: (None if np.isnan(v) else float(v)) for u, v in row.items()}
+                                for t, row in corr.to_dict().items()}}
+        cov = self.matrix.slice(held, kind='cov').values
+        w = np.array([weights.get(t, 0.0) for t in held])
+        if len(held) == len(holding) and not np.isnan(cov).any():
+            risk['expectedVolatility'] = float(np.sqrt(max(w @ cov @ w, 0.0) * 52))
+        return risk
+
     # -----------------------------
-    def get_info(self):
+    def get_info(self, columnar=False):
+        """
+        Summary metrics and chart data of the portfolio.
+
+        Parameters:
+            columnar: return the historical and market returns in `adv` as
+                pd.Series (for serialization.encode) instead of date-keyed dicts
+
+        Returns:
+            (basic, adv) dicts
+        """
         if not self.tickers or self.holdings.empty:
             return {}, {}
 
-        basic, adv = self._compute_returns()
+        with span("metrics"):
+            basic, adv = self._compute_returns(columnar)
 
         # total value = cash + positions
         total_val = max(self.cash + sum(self.market_value.values()), 1e-9)
@@ -182,7 +394,11 @@ class Portfolio:
         weights = {k: float(v / total_val) for k, v in self.market_value.items()}
         contrib = {k: float(v / invested_val) for k, v in self.contrib.items()}
 
-        df = get_df(self.tickers.keys(), self.db)
+        if self.assets is not None:
+            df = self.assets[self.assets.index.isin(list(self.tickers.keys()))].copy()
+        else:
+            with span("assets"):
+                df = get_df(self.tickers.keys(), self.db)
         df['weight'] = df.index.map(weights).fillna(0).astype(float)
         df['contrib'] = df.index.map(contrib).fillna(0).astype(float)
         df['shares'] = df.index.map(self.num).fillna(0).astype(float)
@@ -223,6 +439,10 @@ class Portfolio:
             for k, row in holdings.T.to_dict().items()
         ]
 
+        if self.matrix is not None:
+            with span("correlation"):
+                adv.update(self._risk_matrix(weights))
+
         return {
             **basic,
             'primaryAssetClass': str(primary_asset),
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+import pandas as pd
+from timing import count
+
+# The `assets` fields Portfolio.get_info uses; everything else in the documents is never read
+ASSET_FIELDS = ("name", "asset-class", "sector", "yield", "cagr")
+# Rows older than this are re-read (projected) on their next lookup
+ASSET_REFRESH_SECONDS = int(os.environ.get("ASSET_REFRESH_SECONDS", 900))
+
+
+class AssetIndex:
+    """
+    In-memory, columnar view of the `assets` collection, filled on demand.
+
+    Documents are read with a field projection the first time a ticker is
+    looked up and kept as one DataFrame row; lookups for known tickers are a
+    single reindex with no Firestore read. Rows (and tickers without a
+    document) are re-read once they are older than `max_age`; a row is only
+    rewritten when the document's update time changed.
+    """
+
+    def __init__(self, db, fields=ASSET_FIELDS, max_age=ASSET_REFRESH_SECONDS):
+        self.db = db
+        self.fields = list(fields)
+        self.max_age = max_age
+        self.frame = pd.DataFrame(columns=self.fields, index=pd.Index([], name="ticker"))
+        self.loaded = {}     # ticker -> (time read, document update time or None when there is no document)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _read(self, tickers):
+        """Projected read of the given tickers; updates rows whose document changed."""
+        collection = self.db.collection("assets")
+        docs = self.db.get_all([collection.document(t) for t in tickers],
+                               field_paths=[f"`{f}`" for f in self.fields])
+        count("assets_index.read", len(tickers))
+        now = time.time()
+        changed, absent = {}, []
+        seen = set()
+        for doc in docs:
+            seen.add(doc.id)
+            if not doc.exists:
+                absent.append(doc.id)
+                self.loaded[doc.id] = (now, None)
+                continue
+            update_time = getattr(doc, "update_time", None)
+            previous = self.loaded.get(doc.id)
+            self.loaded[doc.id] = (now, update_time)
+            if previous is not None and update_time is not None and previous[1] == update_time:
+                continue
+            # Numbers are stored as floats, as JSON-safe values for the response
+            changed[doc.id] = {k: (float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else v)
+                               for k, v in doc.to_dict().items()}
+        for ticker in tickers:
+            if ticker not in seen:
+                absent.append(ticker)
+                self.loaded[ticker] = (now, None)
+
+        stale = [t for t in list(changed) + absent if t in self.frame.index]
+        if stale or changed:
+            frame = self.frame.drop(index=stale)
+            if changed:
+                rows = pd.DataFrame.from_dict(changed, orient="index").reindex(columns=self.fields)
+                rows.index.name = "ticker"
+                frame = rows if frame.empty else pd.concat([frame, rows])
+            self.frame = frame
+
+    def lookup(self, tickers):
+        """
+        Metadata rows for `tickers`, reading only unknown or outdated ones.
+
+        Returns:
+            pd.DataFrame indexed by ticker (tickers without a document are left
+            out, as are fields none of them has)
+        """
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return pd.DataFrame()
+        with self._lock:
+            cutoff = time.time() - self.max_age
+            due = [t for t in tickers if self.loaded.get(t, (0, None))[0] < cutoff]
+            count("assets_index.hit", len(tickers) - len(due))
+            if due:
+                self._read(due)
+            rows = self.frame.reindex([t for t in tickers if t in self.frame.index])
+        if rows.empty:
+            return pd.DataFrame()
+        return rows.dropna(axis=1, how="all")
+
+
+_index = None
+_index_guard = threading.Lock()
+
+
+def get_asset_index(db):
+    """Process-wide AssetIndex over `db` (a new one when called with another client)."""
+    global _index
+    with _index_guard:
+        if _index is None or _index.db is not db:
+            _index = AssetIndex(db)
+        return _index
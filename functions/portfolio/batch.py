@@ -0,0 +1,117 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import pandas as pd
+from market_data import get_manager
+from popularity import save_holders
+from portfolio import Portfolio
+from portfolio.helpers import get_df
+from price_store import get_store
+from trades.log import load_actions
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+
+def _compute(job):
+    """Worker: value one portfolio from shared inputs. Must stay picklable (no db)."""
+    portfolio_id, actions, initial_cash, prices, assets, m_data = job
+    try:
+        p = Portfolio(tickers=actions, initial_cash=initial_cash, db=None,
+                      prices=prices, assets=assets, m_data=m_data)
+        basic, _ = p.get_info()
+        return portfolio_id, basic, None
+    except Exception as e:
+        return portfolio_id, None, str(e)
+
+
+def _jobs(portfolios, trades, prices, assets, m_data):
+    """Slice the shared prices and metadata down to what each portfolio needs."""
+    for portfolio_id, data in portfolios.items():
+        actions = {t: a for t, a in trades[portfolio_id].items() if len(a)}
+        tickers = list(actions)
+        if tickers:
+            start = min(a.index.min() for a in actions.values()) - timedelta(weeks=1)
+            own_prices = prices.reindex(columns=tickers)
+            own_prices = own_prices[own_prices.index >= start.normalize()]
+            own_assets = assets[assets.index.isin(tickers)] if not assets.empty else assets
+        else:
+            own_prices, own_assets = prices.iloc[:0, :0], assets.iloc[:0]
+        yield portfolio_id, actions, data.get("initialCash", 0), own_prices, own_assets, m_data
+
+
+def recompute_all(db, portfolio_ids=None, workers=None):
+    """
+    Recompute and store the summary metrics of many portfolios at once.
+
+    Prices and `assets` metadata are fetched once for the union of all held
+    tickers, the Portfolio computations run across a process pool and the
+    results are written back with batched Firestore writes. A run over every
+    portfolio also refreshes the ticker holder counts used by warm_caches.
+
+    Parameters:
+        db: Firestore database object
+        portfolio_ids: optional list of ids; defaults to every portfolio
+        workers: process count (defaults to the CPU count; 1 runs inline)
+
+    Returns:
+        dict with counts, failures, elapsed seconds and portfolios per second
+    """
+    started = time.perf_counter()
+    collection = db.collection("portfolios")
+    if portfolio_ids is None:
+        docs = collection.stream()
+    else:
+        docs = db.get_all([collection.document(pid) for pid in portfolio_ids])
+    portfolios = {d.id: d.to_dict() for d in docs if d.exists}
+    trades = {pid: load_actions(db, pid, data) for pid, data in portfolios.items()}
+
+    # Shared inputs: one download and one metadata read for the ticker union
+    all_actions = [a for p in trades.values() for a in p.values() if len(a)]
+    tickers = sorted({t for p in trades.values() for t, a in p.items() if len(a)})
+    if tickers:
+        start = min(a.index.min() for a in all_actions) - timedelta(weeks=1)
+        prices = get_store().get_views(tickers, start=start, interval='1d')
+    else:
+        prices = pd.DataFrame()
+    assets = get_df(tickers, db)
+    m_data = get_manager().get_data()
+    fetched = time.perf_counter()
+
+    jobs = _jobs(portfolios, trades, prices, assets, m_data)
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(portfolios) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_compute, jobs, chunksize=max(1, len(portfolios) // (workers * 4))))
+    else:
+        results = [_compute(job) for job in jobs]
+    computed = time.perf_counter()
+
+    # Batched write-back
+    failed = {pid: err for pid, _, err in results if err}
+    updates = [(pid, basic) for pid, basic, err in results if not err and basic]
+    for i in range(0, len(updates), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for pid, basic in updates[i:i + MAX_BATCH_WRITES]:
+            batch.update(collection.document(pid), basic)
+        batch.commit()
+    if portfolio_ids is None:
+        save_holders(db, portfolios)
+    finished = time.perf_counter()
+
+    elapsed = finished - started
+    stats = {
+        "portfolios": len(portfolios),
+        "updated": len(updates),
+        "failed": failed,
+        "tickers": len(tickers),
+        "fetchSeconds": fetched - started,
+        "computeSeconds": computed - fetched,
+        "writeSeconds": finished - computed,
+        "seconds": elapsed,
+        "portfoliosPerSecond": len(portfolios) / elapsed if elapsed > 0 else 0.0,
+    }
+    print(f"[INFO] Recomputed {stats['updated']}/{stats['portfolios']} portfolios "
+          f"in {elapsed:.2f}s ({stats['portfoliosPerSecond']:.1f}/s)")
+    return stats
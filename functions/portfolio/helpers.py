@@ -1,101 +1,237 @@
 import pandas as pd
 import numpy as np
 
-def get_pnl(actions, prices):
+def get_pnl(actions, prices, state=None):
     """
     Vectorized PnL calculation.
     
     Parameters:
         actions: dict of date -> shares bought/sold (+/-)
         prices: pd.Series of prices indexed by date
+        state: optional position state to continue from (see pnl_frame)
         
     Returns:
         total_value_series (pd.Series), last_value (float), last_cash (float), 
         actions_list (list), num_shares (float), last_price (float), avg_buy_price (float)
     """
+    frame = pnl_frame(actions, prices, state)
+    if frame.empty:
+        return pd.Series(dtype=float), 0.0, 0.0, [], 0.0, 0.0, 0.0
+
+    last = frame.iloc[-1]
+    avg_buy_price = float(last['buy_cost'] / last['buy_shares']) if last['buy_shares'] > 0 else 0.0
+
+    return (frame['value'], float(last['value']), float(last['cash']), actions_list(frame),
+            float(last['shares']), float(last['price']), avg_buy_price)
+
+
+def pnl_frame(actions, prices, state=None):
+    """
+    Per-row position arrays behind get_pnl.
+
+    Parameters:
+        actions: dict of date -> shares bought/sold (+/-)
+        prices: pd.Series of prices indexed by date
+        state: optional dict with the cumulative 'shares', 'cash', 'buy_shares',
+            'buy_cost' and last 'price' of an earlier run; the cumulative columns
+            continue from it and leading rows are priced at state['price']
+
+    Returns:
+        pd.DataFrame indexed by date with columns value, shares, cash,
+        buy_shares, buy_cost, price and action
+    """
+    state = state or {}
+    columns = ['value', 'shares', 'cash', 'buy_shares', 'buy_cost', 'price', 'action']
+
     # Standardize prices
     prices = prices.copy()
     prices.index = pd.to_datetime(prices.index)
     prices = prices.groupby(prices.index).last().sort_index().ffill()
 
-    if prices.empty:
-        return pd.Series(dtype=float), 0.0, 0.0, [], 0.0, 0.0, 0.0
+    if prices.empty and 'price' not in state:
+        return pd.DataFrame(columns=columns, dtype=float)
 
     # Standardize actions
-    actions_series = pd.Series(actions).astype(float)
+    actions_series = pd.Series(actions, dtype=float)
     actions_series.index = pd.to_datetime(actions_series.index)
 
     # Unified date index
     full_index = prices.index.union(actions_series.index)
     actions_aligned = actions_series.reindex(full_index, fill_value=0).values
-    prices_aligned = prices.reindex(full_index).ffill().values
+    prices_aligned = prices.reindex(full_index).ffill()
+    if 'price' in state:
+        prices_aligned = prices_aligned.fillna(state['price'])
+    prices_aligned = prices_aligned.values
 
     # Cumulative shares and cash impact
-    cum_shares = np.cumsum(actions_aligned)
-    cash_diffs = -np.cumsum(actions_aligned * prices_aligned)
+    cum_shares = state.get('shares', 0.0) + np.cumsum(actions_aligned)
+    cash_diffs = state.get('cash', 0.0) - np.cumsum(actions_aligned * prices_aligned)
     total_value = cum_shares * prices_aligned + cash_diffs
 
-    # Average buy price
+    # Average buy price inputs
     buys = np.clip(actions_aligned, 0, None)
-    cum_buy_shares = np.cumsum(buys)
-    cum_buy_cost = np.cumsum(buys * prices_aligned)
-    avg_buy_price = float(cum_buy_cost[-1] / cum_buy_shares[-1]) if cum_buy_shares[-1] > 0 else 0.0
-
-    # Actions list
-    mask = actions_aligned != 0
-    actions_list = [
+    cum_buy_shares = state.get('buy_shares', 0.0) + np.cumsum(buys)
+    cum_buy_cost = state.get('buy_cost', 0.0) + np.cumsum(buys * prices_aligned)
+
+    return pd.DataFrame({
+        'value': total_value,
+        'shares': cum_shares,
+        'cash': cash_diffs,
+        'buy_shares': cum_buy_shares,
+        'buy_cost': cum_buy_cost,
+        'price': prices_aligned,
+        'action': actions_aligned,
+    }, index=full_index, dtype=float)
+
+
+def actions_list(frame):
+    """Trade rows of a pnl_frame as JSON-safe dicts."""
+    mask = frame['action'].values != 0
+    return [
         {
             'date': d.strftime('%Y-%m-%d'),
             'shares': float(abs(shares)),
             'action': int(shares > 0),
             'price': float(price)
         }
-        for d, shares, price in zip(full_index[mask], actions_aligned[mask], prices_aligned[mask])
+        for d, shares, price in zip(frame.index[mask], frame['action'].values[mask], frame['price'].values[mask])
     ]
 
-    # Last values
-    last_price = float(prices_aligned[-1])
-    num_shares = float(cum_shares[-1])
-    last_cash = float(cash_diffs[-1])
-    last_value = float(total_value[-1])
 
-    # Convert to pd.Series
-    total_value_series = pd.Series(total_value, index=full_index, dtype=float)
+def pnl_matrix(prices, actions, states=None):
+    """
+    get_pnl for many tickers at once on a shared date axis.
+
+    Trades are sparse, so the cumulative quantities are computed only on the
+    rows where some ticker trades and then broadcast over the full axis.
 
-    return total_value_series, last_value, last_cash, actions_list, num_shares, last_price, avg_buy_price
+    Parameters:
+        prices: pd.DataFrame of daily prices (dates x tickers), already forward-filled
+        actions: dict of ticker -> pd.Series of shares bought/sold indexed by timestamp
+        states: optional dict of ticker -> (start, state); rows before `start`
+            are ignored for that ticker and its columns continue from `state`
+            as in pnl_frame
+
+    Returns:
+        dict with the shared 'index', the 'tickers' order, (rows x tickers)
+        arrays 'value' and 'price', the boolean 'own' mask of the rows on each
+        ticker's own get_pnl index (its price dates and action dates), and the
+        trade rows 'events' with (events x tickers) 'action', 'traded' and
+        cumulative 'shares', 'cash', 'buy_shares' and 'buy_cost'
+    """
+    states = states or {}
+    tickers = list(prices.columns)
+    held = [t for t in tickers if t in actions and len(actions[t])]
+    stamps = pd.DatetimeIndex(np.concatenate([actions[t].index for t in held])) if held else pd.DatetimeIndex([])
+    index = prices.index.union(stamps.unique())
+    T, N = len(index), len(tickers)
+
+    # Map every row to the last price row at or before it: reindex + ffill as one gather
+    is_price = np.zeros(T, dtype=bool)
+    is_price[index.get_indexer(prices.index)] = True
+    src = np.maximum.accumulate(np.where(is_price, np.cumsum(is_price) - 1, -1))
+    P = np.asarray(prices.values.T, dtype=float)[:, np.maximum(src, 0)]   # ticker-major (N x T)
+    P[:, src < 0] = np.nan
+
+    # Trades on the rows where at least one ticker trades
+    events = index.get_indexer(stamps.unique().sort_values()) if held else np.array([], dtype=np.int64)
+    A = np.zeros((N, len(events)))
+    traded = np.zeros((N, len(events)), dtype=bool)
+    if held:
+        col_of = {t: j for j, t in enumerate(tickers)}
+        cols = np.repeat([col_of[t] for t in held], [len(actions[t]) for t in held])
+        ev = np.searchsorted(events, index.get_indexer(stamps))
+        np.add.at(A, (cols, ev), np.concatenate([actions[t].values for t in held]).astype(float))
+        traded[cols, ev] = True
+
+    # Rows before a ticker's start belong to its earlier (snapshotted) run
+    seed = {k: np.zeros((N, 1)) for k in ('shares', 'cash', 'buy_shares', 'buy_cost')}
+    first = np.zeros(N, dtype=np.int64)
+    src_row = np.where(src >= 0, np.flatnonzero(is_price)[src], -1)
+    for t, (start, state) in states.items():
+        if t not in tickers:
+            continue
+        j = tickers.index(t)
+        first[j] = index.searchsorted(start)
+        for k in seed:
+            seed[k][j] = state[k]
+        # Prices from before the start are not visible; until the first new one, use the snapshot price
+        P[j] = np.where(src_row < first[j], state['price'], P[j])
+    late = events[None, :] < first[:, None]
+    A[late] = 0.0
+    traded &= ~late
+
+    own = ~np.isnan(P)
+    own &= is_price
+    if states:
+        own &= np.arange(T) >= first[:, None]
+    own[:, events] |= traded
+
+    # Cumulative positions at trade rows, broadcast to every row after them
+    Pe = P[:, events]
+    flows = np.where(traded, A * Pe, 0.0)
+    buys = np.clip(A, 0, None)
+    buy_flows = np.where(traded, buys * Pe, 0.0)
+    cum = {
+        'shares': seed['shares'] + np.cumsum(A, axis=1),
+        'cash': seed['cash'] - np.cumsum(flows, axis=1),
+        'buy_shares': seed['buy_shares'] + np.cumsum(buys, axis=1),
+        'buy_cost': seed['buy_cost'] + np.cumsum(buy_flows, axis=1),
+    }
+    k = np.searchsorted(events, np.arange(T), side='right') - 1
+    shares = np.concatenate([cum['shares'], seed['shares']], axis=1)[:, k]
+    value = np.concatenate([cum['cash'], seed['cash']], axis=1)[:, k]
+    value += shares * P
+
+    return {
+        'index': index,
+        'tickers': tickers,
+        'own': own.T,
+        'value': value.T,
+        'price': P.T,
+        'events': events,
+        'action': A.T,
+        'traded': traded.T,
+        **{key: v.T for key, v in cum.items()},
+    }
+
+
+def matrix_state(m, row, j):
+    """Position state (shares, cash, buy_shares, buy_cost, price) of ticker column j at a row."""
+    e = np.searchsorted(m['events'], row, side='right') - 1
+    state = {k: float(m[k][e, j]) if e >= 0 else 0.0 for k in ('shares', 'cash', 'buy_shares', 'buy_cost')}
+    state['price'] = float(m['price'][row, j])
+    return state
+
+
+def matrix_actions(m):
+    """Trade rows of every pnl_matrix column as the dicts actions_list produces, one list per column."""
+    events, cols = np.nonzero((m['action'] != 0) & m['traded'])
+    order = np.argsort(cols, kind='stable')
+    events, cols = events[order], cols[order]
+    rows = m['events'][events]
+    dates = m['index'][rows].strftime('%Y-%m-%d')
+    flat = [
+        {'date': d, 'shares': abs(q), 'action': int(q > 0), 'price': p}
+        for d, q, p in zip(dates, m['action'][events, cols].tolist(), m['price'][rows, cols].tolist())
+    ]
+    bounds = np.searchsorted(cols, np.arange(len(m['tickers']) + 1))
+    return [flat[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
 
 
 def get_df(tickers, db):
     """
-    Fetch asset information from Firestore for a list of tickers.
-    
+    Asset information for a list of tickers, from the in-memory asset index.
+
+    Only the fields in portfolio.assets.ASSET_FIELDS are read, and only for
+    tickers the index doesn't hold yet (or holds an outdated row for).
+
     Parameters:
         tickers: list of ticker symbols
         db: Firestore database object
-        
+
     Returns:
         pd.DataFrame indexed by ticker, with JSON-safe values
     """
-    if not tickers:
-        return pd.DataFrame()
-
-    doc_refs = [db.collection("assets").document(ticker) for ticker in tickers]
-    docs = db.get_all(doc_refs)
-
-    data = []
-    for doc in docs:
-        if doc.exists:
-            doc_data = doc.to_dict()
-            doc_data['ticker'] = doc.id
-            # Ensure numeric values are float
-            for k, v in doc_data.items():
-                if isinstance(v, (np.integer, np.int64, int, np.floating, np.float64)):
-                    doc_data[k] = float(v)
-            data.append(doc_data)
-
-    if not data:
-        return pd.DataFrame()
-
-    df = pd.DataFrame(data)
-    df.set_index('ticker', inplace=True)
-    return df
+    from portfolio.assets import get_asset_index
+    return get_asset_index(db).lookup(tickers)
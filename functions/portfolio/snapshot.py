@@ -0,0 +1,143 @@
+import hashlib
+import zlib
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_COLLECTION = "portfolio_snapshots"
+STATE_KEYS = ['shares', 'cash', 'buy_shares', 'buy_cost', 'price']
+
+
+def actions_digest(actions, cutoff):
+    """
+    Fingerprint of every action dated before `cutoff`.
+
+    Parameters:
+        actions: dict of ticker -> pd.Series of shares indexed by timestamp
+        cutoff: pd.Timestamp
+
+    Returns:
+        hex digest string; a back-dated, edited or deleted action changes it
+    """
+    cutoff = np.datetime64(cutoff, 'ns')
+    digest = hashlib.sha1()
+    for t in sorted(actions):
+        s = actions[t]
+        dates = s.index.values.astype('datetime64[ns]')
+        keep = dates < cutoff
+        if not keep.any():
+            continue
+        dates = dates[keep].astype(np.int64)
+        shares = s.values[keep].astype(np.float64)
+        order = np.lexsort((shares, dates))
+        digest.update(t.encode() + b'\0')
+        digest.update(len(order).to_bytes(8, 'little'))
+        digest.update(dates[order].tobytes() + shares[order].tobytes())
+    return digest.hexdigest()
+
+
+def encode_series(series):
+    """A float series on a DatetimeIndex as two zlib-compressed binary fields."""
+    index = series.index.values.astype('datetime64[ns]').astype(np.int64)
+    return {
+        'index': zlib.compress(index.tobytes()),
+        'value': zlib.compress(series.values.astype(np.float64).tobytes()),
+    }
+
+
+def decode_series(data):
+    """Inverse of encode_series."""
+    index = np.frombuffer(zlib.decompress(data['index']), dtype=np.int64)
+    values = np.frombuffer(zlib.decompress(data['value']), dtype=np.float64)
+    return pd.Series(values, index=pd.DatetimeIndex(index.astype('datetime64[ns]')), dtype=float)
+
+
+def encode_actions(actions):
+    """Trade rows (the dicts actions_list produces) as zlib-compressed binary columns."""
+    return {
+        'date': zlib.compress(np.array([a['date'] for a in actions], dtype='datetime64[D]').astype(np.int64).tobytes()),
+        'shares': zlib.compress(np.array([a['shares'] for a in actions], dtype=np.float64).tobytes()),
+        'action': zlib.compress(np.array([a['action'] for a in actions], dtype=np.int8).tobytes()),
+        'price': zlib.compress(np.array([a['price'] for a in actions], dtype=np.float64).tobytes()),
+    }
+
+
+def decode_actions(data):
+    """Inverse of encode_actions."""
+    dates = np.frombuffer(zlib.decompress(data['date']), dtype=np.int64).astype('datetime64[D]')
+    shares = np.frombuffer(zlib.decompress(data['shares']), dtype=np.float64)
+    action = np.frombuffer(zlib.decompress(data['action']), dtype=np.int8)
+    price = np.frombuffer(zlib.decompress(data['price']), dtype=np.float64)
+    return [
+        {'date': d, 'shares': q, 'action': a, 'price': p}
+        for d, q, a, p in zip(np.datetime_as_string(dates, unit='D').tolist(), shares.tolist(), action.tolist(), price.tolist())
+    ]
+
+
+def load_snapshot(db, portfolio_id):
+    """
+    Load the persisted valuation state of a portfolio.
+
+    The snapshot document holds the valuation cutoff, the action digest and
+    per-ticker position state with its trade count; each ticker's frozen P&L
+    series and trade rows live in its own document of the `series`
+    subcollection, so the snapshot document doesn't grow with the history.
+
+    Returns:
+        dict with 'asOf', 'initialCash', 'digest' and 'tickers', or None
+    """
+    ref = db.collection(SNAPSHOT_COLLECTION).document(portfolio_id)
+    doc = ref.get()
+    if not doc.exists:
+        return None
+    meta = doc.to_dict()
+    tickers = meta.get('tickers', {})
+
+    series_docs = db.get_all([ref.collection("series").document(t) for t in tickers])
+    series = {d.id: d.to_dict() for d in series_docs if d.exists}
+    if series.keys() != tickers.keys():
+        return None
+
+    states = {}
+    for t, state in tickers.items():
+        data = series[t]
+        # A series doc from another save than the snapshot doc can't be used
+        if 'trades' not in state or 'actions' not in data:
+            return None
+        actions = decode_actions(data['actions'])
+        if len(actions) != state['trades']:
+            return None
+        states[t] = {**{k: state[k] for k in STATE_KEYS}, 'actions': actions, 'pnl': decode_series(data)}
+
+    return {
+        'asOf': pd.Timestamp(meta['asOf']),
+        'initialCash': float(meta['initialCash']),
+        'digest': meta['digest'],
+        'tickers': states,
+    }
+
+
+def save_snapshot(db, portfolio_id, snapshot, previous=None):
+    """
+    Persist a snapshot built by Portfolio in one batched write.
+
+    Only the series documents of tickers in snapshot['changed'] are
+    rewritten; the others still hold the rows frozen by an earlier save.
+    """
+    ref = db.collection(SNAPSHOT_COLLECTION).document(portfolio_id)
+    batch = db.batch()
+    batch.set(ref, {
+        'asOf': snapshot['asOf'].isoformat(),
+        'initialCash': snapshot['initialCash'],
+        'digest': snapshot['digest'],
+        'tickers': {
+            t: {**{k: float(state[k]) for k in STATE_KEYS}, 'trades': len(state['actions'])}
+            for t, state in snapshot['tickers'].items()
+        },
+    })
+    for t in snapshot['changed']:
+        state = snapshot['tickers'][t]
+        batch.set(ref.collection("series").document(t),
+                  {**encode_series(state['pnl']), 'actions': encode_actions(state['actions'])})
+    for t in (previous or {}).get('tickers', {}).keys() - snapshot['tickers'].keys():
+        batch.delete(ref.collection("series").document(t))
+    batch.commit()
@@ -0,0 +1,387 @@
+import os
+import re
+import threading
+from datetime import datetime, time, timedelta
+import numpy as np
+import pandas as pd
+from cache import LRUCache
+from timing import span
+
+# Cloud Functions only allows writes under /tmp
+DEFAULT_STORE_DIR = os.environ.get("PRICE_STORE_DIR", "/tmp/price_store")
+
+# Only daily closes are stored; a stored tail older than one bar is refetched
+STEP = timedelta(days=1)
+# While US markets trade, today's partial bar is refetched once it is this old
+# (seconds; the same 10 minutes the response caches use). The session is widened
+# past the close so the final close replaces the last partial bar, and a tail
+# fetched before a session's close is refetched once that close has passed.
+# Fetch times are tz-aware UTC.
+TAIL_TTL = int(os.environ.get("PRICE_TAIL_TTL", 600))
+MARKET_TZ = "America/New_York"
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 30)
+
+# Views cut from the daily base series: interval -> period of one bar (None: every close)
+VIEW_PERIODS = {"1d": None, "1wk": "W-FRI", "1mo": "M", "3mo": "Q"}
+# The daily base series reaches back to here, so any later lookback is a slice of it
+BASE_START = pd.Timestamp(os.environ.get("PRICE_BASE_START", "2005-01-01"))
+# Memory for derived views; a view is rebuilt once its base series was refreshed
+VIEW_CACHE_BYTES = int(os.environ.get("PRICE_VIEW_CACHE_BYTES", 64 * 1024 * 1024))
+VIEW_TTL = 24 * 3600
+# Relative ?start= values: <n>d, <n>wk, <n>mo, <n>y
+LOOKBACK_UNITS = {"d": "days", "wk": "weeks", "mo": "months", "y": "years"}
+
+
+class PriceStore:
+    """
+    On-disk daily close-price history, one series per ticker.
+
+    Each series is stored as two columns (int64 dates, float64 closes) in a
+    single .npz file. On a request only the missing head and tail of the
+    range are fetched from yfinance and merged into the stored columns.
+
+    get_view()/get_views() serve daily, weekly, monthly and quarterly closes
+    for any start from that one series, reaching back to BASE_START. Views are memoized in memory per (ticker, interval, start)
+    and the base series' last fetch, so a new lookback or frequency costs no
+    upstream call and a repeated one no disk read.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+        os.makedirs(self.store_dir, exist_ok=True)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._known = {}    # ticker -> (stored start, last fetch) as last read or written
+        self._views = LRUCache(VIEW_CACHE_BYTES, ttl=VIEW_TTL, name="price_view")
+
+    # -----------------------------
+    def _path(self, ticker):
+        safe = ticker.replace("^", "_idx_").replace("/", "_").replace("=", "_eq_")
+        return os.path.join(self.store_dir, f"{safe}.1d.npz")
+
+    def _lock(self, key):
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _read(self, ticker):
+        """Return (series, start, fetched) for a stored ticker, or (None, None, None)."""
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return None, None, None
+        with np.load(path) as f:
+            series = pd.Series(f["close"], index=pd.DatetimeIndex(f["dates"].astype("datetime64[ns]")), dtype=float)
+            start = pd.Timestamp(int(f["start"]))
+            fetched = pd.Timestamp(int(f["fetched"]), tz="UTC")
+        self._known[ticker] = (start, fetched)
+        return series, start, fetched
+
+    def _write(self, ticker, series, start, fetched):
+        """Write the columns to a temp file and swap it in atomically."""
+        path = self._path(ticker)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                dates=series.index.values.astype("datetime64[ns]").astype(np.int64),
+                close=series.values.astype(np.float64),
+                start=np.int64(pd.Timestamp(start).value),
+                fetched=np.int64(pd.Timestamp(fetched).value),
+            )
+        os.replace(tmp, path)
+        self._known[ticker] = (pd.Timestamp(start), pd.Timestamp(fetched))
+
+    # -----------------------------
+    @staticmethod
+    def _normalize(series):
+        series = series.dropna().astype(float)
+        index = pd.to_datetime(series.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        series.index = index
+        return series.groupby(series.index).last().sort_index()
+
+    @staticmethod
+    def _merge(stored, fresh):
+        if stored is None or stored.empty:
+            return fresh
+        if fresh is None or fresh.empty:
+            return stored
+        # Fresh rows win: the last stored bar may have been a partial one
+        merged = pd.concat([stored[~stored.index.isin(fresh.index)], fresh])
+        return merged.sort_index()
+
+    def _missing_ranges(self, start, stored_start, fetched, now):
+        """Return the (start, end) ranges that have to be fetched upstream."""
+        ranges = []
+        if stored_start is None:
+            return [(start, None)]
+        if start < stored_start:
+            ranges.append((start, stored_start))
+        stale = now - fetched > (timedelta(seconds=TAIL_TTL) if _market_open(now) else STEP)
+        # A bar fetched during a session is partial until that session's close
+        stale = stale or fetched < _last_close(now)
+        if now.normalize() > fetched.normalize() or stale:
+            # Refetch from the last fetch day so a partial bar gets completed
+            ranges.append((fetched.tz_convert(None).normalize() - STEP, None))
+        return ranges
+
+    # -----------------------------
+    def get_history(self, ticker, start):
+        """
+        Daily close prices for `ticker` from `start` to today.
+
+        Parameters:
+            ticker: ticker symbol
+            start: anything accepted by pd.Timestamp
+
+        Returns:
+            pd.Series of closes on a tz-naive DatetimeIndex
+        """
+        start = pd.Timestamp(start).normalize()
+        now = _now()
+        with self._lock(ticker):
+            stored, stored_start, fetched = self._read(ticker)
+            ranges = self._missing_ranges(start, stored_start, fetched, now)
+            for s, e in ranges:
+                fresh = fetch_history(ticker, s, e)
+                stored = self._merge(stored, fresh)
+            if ranges:
+                stored_start = min(start, stored_start) if stored_start is not None else start
+                stored = stored if stored is not None else pd.Series(dtype=float)
+                self._write(ticker, stored, stored_start, now)
+        return stored[stored.index >= start].copy()
+
+    def get_many(self, tickers, start):
+        """
+        Daily close prices for several tickers as one DataFrame (one column per ticker).
+
+        Tickers that need upstream data are fetched with at most two
+        yf.download calls, see _load_many().
+        """
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return pd.DataFrame()
+        series = self._load_many(tickers, pd.Timestamp(start).normalize())
+        df = pd.DataFrame({t: s for t, s in series.items() if s is not None})
+        return df.reindex(columns=tickers).sort_index()
+
+    def _load_many(self, tickers, start):
+        """
+        ticker -> closes from `start` (None when nothing is stored), fetching what is missing.
+
+        Tickers without history back to `start` are fetched in one download
+        from `start`; tickers that only need their tail refreshed share a
+        second download from the earliest stale tail, so one new ticker
+        doesn't pull years of history for all the others.
+        """
+        now = _now()
+        locks = [self._lock(t) for t in sorted(tickers)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            state = {t: self._read(t) for t in tickers}
+            heads, tails = [], {}
+            for t, (_, stored_start, fetched) in state.items():
+                ranges = self._missing_ranges(start, stored_start, fetched, now)
+                if stored_start is None or start < stored_start:
+                    heads.append(t)
+                elif ranges:
+                    tails[t] = min(s for s, _ in ranges)
+
+            groups = [(heads, start)] if heads else []
+            if tails:
+                groups.append((list(tails), min(tails.values())))
+            for group, since in groups:
+                fresh = fetch_many(group, since)
+                for t in group:
+                    stored, stored_start, _ = state[t]
+                    col = fresh[t] if t in fresh else pd.Series(dtype=float)
+                    stored = self._merge(stored, col)
+                    stored = stored if stored is not None else pd.Series(dtype=float)
+                    stored_start = min(start, stored_start) if stored_start is not None else start
+                    self._write(t, stored, stored_start, now)
+                    state[t] = (stored, stored_start, now)
+        finally:
+            for lock in locks:
+                lock.release()
+        return {t: (s[s.index >= start] if s is not None else None) for t, (s, _, _) in state.items()}
+
+    # -----------------------------
+    def _memo(self, ticker, interval, start, now):
+        """Memoized view, as long as the base series it was cut from needs no fetch."""
+        known = self._known.get(ticker)
+        if known is None or self._missing_ranges(min(start, BASE_START), *known, now):
+            return None
+        return self._views.get((ticker, interval, start, known[1]))
+
+    def _cut(self, ticker, base, start, interval):
+        view = derive_view(base, start, interval)
+        known = self._known.get(ticker)
+        if known is not None:
+            self._views.set((ticker, interval, start, known[1]), view)
+        return view
+
+    def get_view(self, ticker, start, interval="1d"):
+        """
+        Closes of `ticker` from `start` at `interval`, cut from its daily base series.
+
+        Parameters:
+            ticker: ticker symbol
+            start: anything accepted by pd.Timestamp
+            interval: one of VIEW_PERIODS
+
+        Returns:
+            pd.Series of closes on a tz-naive DatetimeIndex, one per bar, dated
+            on the bar's last trading day
+        """
+        _check_interval(interval)
+        start = pd.Timestamp(start).normalize()
+        view = self._memo(ticker, interval, start, _now())
+        if view is None:
+            base = self.get_history(ticker, min(start, BASE_START))
+            view = self._cut(ticker, base, start, interval)
+        return view
+
+    def get_views(self, tickers, start, interval="1d"):
+        """
+        get_view() of several tickers as one DataFrame (one column per ticker).
+
+        Base series that need upstream data are fetched in bulk, as in
+        get_many().
+        """
+        _check_interval(interval)
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return pd.DataFrame()
+        start = pd.Timestamp(start).normalize()
+        now = _now()
+        views = {t: self._memo(t, interval, start, now) for t in tickers}
+        due = [t for t, v in views.items() if v is None]
+        if due:
+            for t, base in self._load_many(due, min(start, BASE_START)).items():
+                views[t] = self._cut(t, base if base is not None else pd.Series(dtype=float), start, interval)
+        return pd.DataFrame(views).reindex(columns=tickers).sort_index()
+
+
+def _now():
+    return pd.Timestamp.now(tz="UTC")
+
+
+def _market_open(now):
+    now = now.tz_convert(MARKET_TZ)
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+
+def _last_close(now):
+    """The latest weekday MARKET_CLOSE at or before the tz-aware `now`."""
+    day = now.tz_convert(MARKET_TZ).date()
+    while True:
+        close = pd.Timestamp.combine(day, MARKET_CLOSE).tz_localize(MARKET_TZ)
+        if day.weekday() < 5 and close <= now:
+            return close
+        day -= timedelta(days=1)
+
+
+def _check_interval(interval):
+    if interval not in VIEW_PERIODS:
+        raise ValueError(f"interval must be one of {', '.join(VIEW_PERIODS)}")
+
+
+def derive_view(series, start, interval):
+    """
+    Closes of a daily series from `start`, keeping the last close of each `interval` bar.
+
+    Parameters:
+        series: pd.Series of daily closes (or values) on a DatetimeIndex
+        start: first date kept, or None for all of them
+        interval: one of VIEW_PERIODS
+
+    Returns:
+        pd.Series on the bars' last trading days
+    """
+    _check_interval(interval)
+    if start is not None:
+        series = series[series.index >= start]
+    period = VIEW_PERIODS[interval]
+    if period is None or series.empty:
+        return series
+    return series[~series.index.to_period(period).duplicated(keep="last")]
+
+
+def parse_view(args, interval="1d", start=None):
+    """
+    Read ?interval=&start= from request args.
+
+    `start` is a date (2020-01-01) or a lookback from today (30d, 12wk,
+    6mo, 5y).
+
+    Returns:
+        (interval, start as a pd.Timestamp or the given default)
+
+    Raises:
+        ValueError: on an unknown interval or an unreadable start
+    """
+    interval = args.get("interval") or interval
+    _check_interval(interval)
+    text = args.get("start")
+    if not text:
+        return interval, start
+    match = re.fullmatch(r"(\d+)(d|wk|mo|y)", text)
+    if match:
+        offset = pd.DateOffset(**{LOOKBACK_UNITS[match.group(2)]: int(match.group(1))})
+        return interval, pd.Timestamp(datetime.now()).normalize() - offset
+    try:
+        start = pd.Timestamp(text)
+    except ValueError:
+        start = pd.NaT
+    if start is pd.NaT:
+        raise ValueError("start must be a date (YYYY-MM-DD) or a lookback like 30d, 12wk, 6mo or 5y")
+    if start.tz is not None:
+        start = start.tz_convert(None)
+    return interval, start.normalize()
+
+
+def fetch_history(ticker, start, end=None, interval="1d"):
+    """Fetch closes for a single ticker through the gateway, normalized to a tz-naive index."""
+    from gateway import get_gateway
+    with span("upstream"):
+        his = get_gateway().history(
+            ticker,
+            start=pd.Timestamp(start).strftime('%Y-%m-%d'),
+            end=pd.Timestamp(end).strftime('%Y-%m-%d') if end is not None else None,
+            interval=interval,
+        )
+    if his.empty:
+        return pd.Series(dtype=float)
+    return PriceStore._normalize(his['Close'])
+
+
+def fetch_many(tickers, start, interval="1d"):
+    """Fetch closes for several tickers in one bulk download through the gateway."""
+    from gateway import get_gateway
+    with span("upstream"):
+        data = get_gateway().download(
+            tickers,
+            start=pd.Timestamp(start).strftime('%Y-%m-%d'),
+            interval=interval,
+        )
+    if data.empty:
+        return {}
+    close = data['Close']
+    if isinstance(close, pd.Series):
+        close = close.to_frame(tickers[0])
+    return {t: PriceStore._normalize(close[t]) for t in close.columns}
+
+
+_store = None
+_store_guard = threading.Lock()
+
+
+def get_store():
+    """Process-wide PriceStore instance."""
+    global _store
+    with _store_guard:
+        if _store is None:
+            _store = PriceStore()
+        return _store
@@ -0,0 +1,168 @@
+import os
+import numpy as np
+
+# Defaults and bounds of a simulation request
+HORIZON_DAYS = 21
+MAX_HORIZON_DAYS = 252
+DEFAULT_PATHS = 10000
+MAX_PATHS = 100000
+CONFIDENCE_LEVELS = (0.95, 0.99)
+TERMINAL_QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+HISTOGRAM_BINS = 50
+METHODS = ("bootstrap", "normal")
+# Daily history the joint returns are estimated from
+LOOKBACK_DAYS = 730
+# Working memory of one chunk of paths, and processes to spread chunks over (1 runs inline)
+CHUNK_BYTES = int(os.environ.get("RISK_CHUNK_BYTES", 32 * 1024 * 1024))
+RISK_WORKERS = int(os.environ.get("RISK_WORKERS", 1))
+
+
+def _chunks(paths, per_path_bytes):
+    """Split `paths` into chunk sizes that each fit CHUNK_BYTES."""
+    size = max(1, CHUNK_BYTES // max(per_path_bytes, 1))
+    return [min(size, paths - start) for start in range(0, paths, size)]
+
+
+def _bootstrap_chunk(job):
+    """
+    Terminal log returns of one chunk of bootstrap paths.
+
+    Each path resamples `horizon` whole days (rows) of the joint return
+    history; the sum over its sampled days is counts @ log_returns, where
+    counts[p, t] is how often path p drew day t, so one BLAS product
+    replaces the (paths, horizon, assets) gather.
+    """
+    log_returns, horizon, n, seed = job
+    rng = np.random.default_rng(seed)
+    days = log_returns.shape[0]
+    draws = rng.integers(0, days, size=(n, horizon)) + (np.arange(n) * days)[:, None]
+    counts = np.bincount(draws.ravel(), minlength=n * days).reshape(n, days).astype(log_returns.dtype)
+    return counts @ log_returns
+
+
+def _normal_chunk(job):
+    """
+    Terminal log returns of one chunk of multivariate-normal paths.
+
+    The sum of `horizon` i.i.d. N(mu, cov) days is N(horizon * mu,
+    horizon * cov), so each path takes one draw instead of one per day.
+    """
+    mu, chol, horizon, n, seed = job
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((n, len(mu)))
+    return horizon * mu + np.sqrt(horizon) * (z @ chol.T)
+
+
+def _cholesky(cov):
+    """Cholesky factor of a covariance matrix, clipping negative eigenvalues of a non-PSD estimate."""
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh(cov)
+        return vectors * np.sqrt(np.clip(values, 0, None))
+
+
+def simulate(returns, weights, horizon=HORIZON_DAYS, paths=DEFAULT_PATHS, method="bootstrap", seed=None, workers=None):
+    """
+    Monte Carlo distribution of a buy-and-hold portfolio's value after `horizon` days.
+
+    Paths are generated in chunks of at most CHUNK_BYTES working memory,
+    so 100k paths over 500 assets never materialize at once, and only the
+    terminal value of each path is kept. Chunk seeds are spawned from one
+    seed, so results don't depend on how chunks are spread over workers.
+
+    Parameters:
+        returns: 2-D array (days, assets) of joint daily simple returns, no NaNs
+        weights: 1-D array of position weights in total portfolio value
+                 (the rest, 1 - sum(weights), is cash and doesn't move)
+        horizon: days simulated
+        paths: number of paths
+        method: 'bootstrap' (resample historical days) or 'normal' (multivariate normal)
+        seed: seed for reproducible results
+        workers: processes to spread chunks over (defaults to RISK_WORKERS)
+
+    Returns:
+        1-D array of terminal values relative to today's value (1.0 = unchanged)
+    """
+    log_returns = np.log1p(np.asarray(returns, dtype=np.float64))
+    weights = np.asarray(weights, dtype=np.float64)
+    days, assets = log_returns.shape
+    seeds = np.random.SeedSequence(seed)
+
+    if method == "bootstrap":
+        sizes = _chunks(paths, 8 * (days + assets + horizon))
+        jobs = [(log_returns, horizon, n, s) for n, s in zip(sizes, seeds.spawn(len(sizes)))]
+        run = _bootstrap_chunk
+    elif method == "normal":
+        mu = log_returns.mean(axis=0)
+        chol = _cholesky(np.atleast_2d(np.cov(log_returns, rowvar=False)))
+        sizes = _chunks(paths, 8 * 2 * assets)
+        jobs = [(mu, chol, horizon, n, s) for n, s in zip(sizes, seeds.spawn(len(sizes)))]
+        run = _normal_chunk
+    else:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+
+    workers = RISK_WORKERS if workers is None else workers
+    cash = 1.0 - weights.sum()
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            terminal = [np.exp(log_sums) @ weights + cash for log_sums in pool.map(run, jobs)]
+    else:
+        terminal = [np.exp(run(job)) @ weights + cash for job in jobs]
+    return np.concatenate(terminal)
+
+
+def summarize(terminal, levels=CONFIDENCE_LEVELS):
+    """
+    VaR, CVaR and the terminal value distribution of simulated paths.
+
+    Parameters:
+        terminal: 1-D array from simulate()
+        levels: confidence levels
+
+    Returns:
+        dict with 'var' and 'cvar' (fractional losses keyed by level),
+        'expectedReturn', and 'terminal' quantiles and histogram
+    """
+    losses = 1.0 - terminal
+    var, cvar = {}, {}
+    for level in levels:
+        threshold = float(np.quantile(losses, level))
+        var[str(level)] = threshold
+        cvar[str(level)] = float(losses[losses >= threshold].mean())
+    counts, edges = np.histogram(terminal, bins=HISTOGRAM_BINS)
+    return {
+        'var': var,
+        'cvar': cvar,
+        'expectedReturn': float(terminal.mean() - 1.0),
+        'terminal': {
+            'quantiles': {str(q): float(v) for q, v in zip(TERMINAL_QUANTILES, np.quantile(terminal, TERMINAL_QUANTILES))},
+            'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()},
+        },
+    }
+
+
+def parse_risk(args):
+    """
+    Read ?risk=<method>&horizon=&paths= from request args.
+
+    Returns:
+        dict of simulate() keyword arguments, or None when ?risk= is not given
+
+    Raises:
+        ValueError: on an unknown method or a non-integer horizon/paths
+    """
+    method = args.get("risk")
+    if not method:
+        return None
+    if method not in METHODS:
+        raise ValueError(f"risk must be one of {', '.join(METHODS)}")
+    try:
+        horizon = int(args.get("horizon") or HORIZON_DAYS)
+        paths = int(args.get("paths") or DEFAULT_PATHS)
+    except ValueError:
+        raise ValueError("horizon and paths must be integers")
+    horizon = min(max(horizon, 1), MAX_HORIZON_DAYS)
+    paths = min(max(paths, 100), MAX_PATHS)
+    return {"method": method, "horizon": horizon, "paths": paths}
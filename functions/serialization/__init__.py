@@ -0,0 +1,141 @@
+import json
+import math
+import struct
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # plain json fallback, same output
+    orjson = None
+
+# ?format= values: the legacy per-point dicts, columnar JSON, or columnar float32 binary
+FORMATS = ("json", "columnar", "f32")
+F32_CONTENT_TYPE = "application/x-quantix-f32"
+
+# f32 layout: magic, uint32 header length, uint32 series length, JSON header padded
+# to 8 bytes, float64 dates[n] (unix seconds), then float32 values[n] per series
+_F32_MAGIC = b"QTXCOL01"
+_F32_PREFIX = struct.Struct("<8sII")
+
+
+def to_columnar(series):
+    """
+    Align several series on one shared date axis without building per-point objects.
+
+    Parameters:
+        series: dict of name -> pd.Series indexed by date
+
+    Returns:
+        dict with 'dates' (int64 unix seconds) and 'series' (name -> float64
+        array, NaN where a series has no value on a date)
+    """
+    if not series:
+        return {"dates": np.array([], dtype=np.int64), "series": {}}
+    indexes = [pd.DatetimeIndex(s.index) for s in series.values()]
+    dates = indexes[0]
+    for index in indexes[1:]:
+        if not dates.equals(index):
+            dates = dates.union(index)
+    values = {}
+    for (name, s), index in zip(series.items(), indexes):
+        if index.equals(dates):
+            values[name] = np.asarray(s.values, dtype=np.float64)
+        else:
+            out = np.full(len(dates), np.nan)
+            out[dates.get_indexer(index)] = s.values
+            values[name] = out
+    return {"dates": dates.values.astype("datetime64[s]").astype(np.int64), "series": values}
+
+
+def _finite(value):
+    """`value` with every non-finite float replaced by None, as orjson writes them."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    return value
+
+
+def _default(value):
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == "f":
+            return np.where(np.isfinite(value), value, None).tolist()
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return _finite(value.item())
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(obj):
+    """
+    JSON-encode a response that may hold NumPy arrays and scalars; NaN and
+    infinities become null.
+
+    Uses orjson when installed (arrays are written straight from their buffers),
+    the standard library otherwise.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_finite(obj), default=_default, allow_nan=False, separators=(",", ":")).encode()
+
+
+def pack_f32(fields, block):
+    """
+    Binary float32 variant of a columnar response.
+
+    Parameters:
+        fields: JSON-serializable dict of everything except the series
+        block: to_columnar() output
+
+    Returns:
+        bytes: prefix, JSON header (fields plus the series names in order),
+        float64 dates, then one float32 array per series
+    """
+    names = list(block["series"])
+    header = dumps({**fields, "series": names})
+    header += b" " * (-len(header) % 8)
+    n = len(block["dates"])
+    parts = [_F32_PREFIX.pack(_F32_MAGIC, len(header), n), header,
+             block["dates"].astype("<f8").tobytes()]
+    parts += [block["series"][name].astype("<f4").tobytes() for name in names]
+    return b"".join(parts)
+
+
+def unpack_f32(data):
+    """Decode pack_f32 output into (fields, block); the inverse used by Python clients."""
+    magic, header_len, n = _F32_PREFIX.unpack_from(data)
+    if magic != _F32_MAGIC:
+        raise ValueError("Not an f32 response")
+    offset = _F32_PREFIX.size
+    fields = json.loads(data[offset:offset + header_len])
+    names = fields.pop("series")
+    offset += header_len
+    dates = np.frombuffer(data, dtype="<f8", count=n, offset=offset).astype(np.int64)
+    offset += 8 * n
+    series = {}
+    for name in names:
+        series[name] = np.frombuffer(data, dtype="<f4", count=n, offset=offset)
+        offset += 4 * n
+    return fields, {"dates": dates, "series": series}
+
+
+def encode(fields, key, series, fmt):
+    """
+    Encode a response whose `key` holds chart series in the requested format.
+
+    Parameters:
+        fields: dict of the other response fields
+        key: response key of the series block
+        series: dict of name -> pd.Series
+        fmt: 'columnar' or 'f32'
+
+    Returns:
+        (body bytes, content type)
+    """
+    block = to_columnar(series)
+    if fmt == "f32":
+        return pack_f32(fields, block), F32_CONTENT_TYPE
+    return dumps({**fields, key: block}), "application/json"
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from correlation import CorrelationEngine
+
+
+def _returns(seed, dates):
+    rng = np.random.default_rng(seed)
+    return pd.Series(rng.normal(0, 0.01, len(dates)), index=dates)
+
+
+def _expected(basket):
+    return pd.DataFrame(basket).ffill().dropna().corr()
+
+
+def test_empty_series_first():
+    dates = np.array([f"2024-01-{d:02d}" for d in range(1, 21)], dtype=object)
+    basket = {"EMPTY": pd.Series(dtype=float), "A": _returns(0, dates), "B": _returns(1, dates[5:])}
+    engine = CorrelationEngine()
+    engine.sync(basket)
+    corr = engine.corr()
+    assert corr.loc["EMPTY"].isna().all() and corr["EMPTY"].isna().all()
+    expected = _expected({t: s for t, s in basket.items() if len(s)})
+    pd.testing.assert_frame_equal(corr.loc[["A", "B"], ["A", "B"]], expected.loc[["A", "B"], ["A", "B"]])
+
+    engine.remove("EMPTY")
+    pd.testing.assert_frame_equal(engine.corr(), expected.loc[["A", "B"], ["A", "B"]])
+
+
+def test_constant_series_is_undefined():
+    dates = np.array([f"2024-01-{d:02d}" for d in range(1, 21)], dtype=object)
+    basket = {"A": _returns(0, dates), "FLAT": pd.Series(0.003, index=dates), "B": _returns(1, dates)}
+    engine = CorrelationEngine()
+    engine.sync(basket)
+    corr = engine.corr()
+    expected = _expected(basket)
+    assert corr.loc["FLAT"].isna().all() and corr["FLAT"].isna().all()
+    pd.testing.assert_frame_equal(corr, expected.loc[corr.index, corr.columns])
@@ -0,0 +1,136 @@
+import contextlib
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+
+# Set TIMING_ENABLED=0 to leave the handlers undecorated; span() and count() then do nothing.
+ENABLED = os.environ.get("TIMING_ENABLED", "1") != "0"
+# Fraction of requests run under cProfile, with the top functions logged (0 disables)
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOP = 25
+
+_current = contextvars.ContextVar("timing_trace", default=None)
+_NOOP = contextlib.nullcontext()
+
+
+class Trace:
+    """
+    Stage durations and counters collected while one request is handled.
+
+    Fetch threads (see fetching.fetch_all) share the request's trace, so
+    updates are locked.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = {}       # stage -> [seconds, calls], in first-seen order
+        self.counters = {}    # counter -> value
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            entry = self.spans.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def server_timing(self):
+        """Server-Timing header value, one metric per stage in milliseconds."""
+        return ", ".join(f"{name};dur={seconds * 1e3:.1f}" for name, (seconds, _) in self.spans.items())
+
+    def to_dict(self):
+        return {
+            "function": self.name,
+            "spans": {name: {"ms": round(seconds * 1e3, 3), "calls": calls}
+                      for name, (seconds, calls) in self.spans.items()},
+            "counters": self.counters,
+        }
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def span(name):
+    """
+    Time a stage of the current request:
+
+        with span("prices"):
+            ...
+
+    Outside a traced request this returns a shared no-op context manager.
+    """
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name)
+
+
+def count(name, n=1):
+    """Increment a counter (cache hits, upstream calls, ...) of the current request."""
+    trace = _current.get()
+    if trace is not None:
+        trace.count(name, n)
+
+
+def _log_profile(name, profiler):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    print(f"[PROFILE] {name}\n{out.getvalue()}")
+
+
+def traced(name):
+    """
+    Decorator for HTTP and scheduled handlers: collects the spans and counters
+    of each call, logs them as one structured line and sets a Server-Timing
+    header on the response.
+    """
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def handler(*args, **kwargs):
+            trace = Trace(name)
+            token = _current.set(trace)
+            profiler = cProfile.Profile() if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE else None
+            started = time.perf_counter()
+            try:
+                if profiler is not None:
+                    profiler.enable()
+                response = fn(*args, **kwargs)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                _current.reset(token)
+                trace.add("total", time.perf_counter() - started)
+                print(json.dumps({"severity": "INFO", "message": f"[TIMING] {name}", **trace.to_dict()}))
+                if profiler is not None:
+                    _log_profile(name, profiler)
+            if hasattr(response, "headers"):
+                response.headers["Server-Timing"] = trace.server_timing()
+            return response
+        return handler
+    return decorate
@@ -0,0 +1,134 @@
+import datetime
+
+# Upper bound on trades per request; each one becomes a log entry written in a single transaction
+MAX_TRADES = 100
+# Each portfolio's append-only trade log: portfolios/{id}/trades/{entry_id(seq)}
+LOG_COLLECTION = "trades"
+
+
+class TradeError(Exception):
+    """A trade request that can't be applied; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_trades(body):
+    """
+    Normalize a trade request body.
+
+    Accepts either a single trade ({"ticker", "shares"}) or a batch
+    ({"trades": [{"ticker", "shares"}, ...]}). Several trades in the same
+    ticker are netted into one.
+
+    Returns:
+        dict of ticker -> shares delta, in first-seen order
+
+    Raises:
+        TradeError: on a malformed or empty request
+    """
+    raw = body.get("trades")
+    if raw is None:
+        raw = [{"ticker": body.get("ticker"), "shares": body.get("shares")}]
+    if not isinstance(raw, list) or not raw:
+        raise TradeError("trades must be a non-empty list")
+    if len(raw) > MAX_TRADES:
+        raise TradeError(f"At most {MAX_TRADES} trades per request")
+
+    deltas = {}
+    for trade in raw:
+        ticker = trade.get("ticker") if isinstance(trade, dict) else None
+        shares = trade.get("shares") if isinstance(trade, dict) else None
+        if not ticker or shares is None:
+            raise TradeError("portfolioId, ticker, and shares are required")
+        if isinstance(shares, bool) or not isinstance(shares, (int, float)):
+            raise TradeError(f"shares must be a number for {ticker}")
+        deltas[ticker] = deltas.get(ticker, 0) + shares
+    return deltas
+
+
+def entry_id(seq):
+    """Trade log document id of a sequence number (zero-padded, so ids sort like numbers)."""
+    return f"{seq:010d}"
+
+
+def plan_trades(data, deltas, prices, timestamp):
+    """
+    Validate a batch against a portfolio document and build its writes.
+
+    Cash is checked for the batch as a whole, so sells in the batch fund its
+    buys. The document only keeps current cash and shares plus the last
+    sequence number of its trade log; each trade becomes one typed log entry.
+
+    Parameters:
+        data: portfolio document dict
+        deltas: dict of ticker -> shares delta
+        prices: dict of ticker -> execution price
+        timestamp: datetime recorded on every trade of the batch
+
+    Returns:
+        (updates dict for DocumentReference.update, new cash,
+         dict of log entry id -> entry)
+
+    Raises:
+        TradeError: when a price is missing or cash would go negative
+    """
+    missing = [t for t in deltas if not prices.get(t) or prices[t] <= 0]
+    if missing:
+        raise TradeError(f"Error fetching price for {', '.join(missing)}")
+
+    new_cash = data.get("cash", 0) - sum(delta * prices[t] for t, delta in deltas.items())
+    if new_cash < 0:
+        raise TradeError("Insufficient cash")
+
+    shares = data.get("shares", {})
+    seq = data.get("tradeSeq", 0)
+    updates = {"cash": new_cash}
+    entries = {}
+    for ticker, delta in deltas.items():
+        updates[f"shares.{ticker}"] = shares.get(ticker, 0) + delta
+        seq += 1
+        entries[entry_id(seq)] = {
+            "seq": seq,
+            "ticker": ticker,
+            "shares": float(delta),
+            "price": float(prices[ticker]),
+            "at": timestamp,
+        }
+    updates["tradeSeq"] = seq
+    return updates, new_cash, entries
+
+
+def apply_trades(db, portfolio_id, deltas, prices):
+    """
+    Apply a batch of trades to a portfolio in one Firestore transaction.
+
+    The document is read inside the transaction, so concurrent trades are
+    retried against the latest state instead of overwriting each other (or
+    taking the same log sequence numbers).
+
+    Returns:
+        new cash balance
+
+    Raises:
+        TradeError: 404 when the portfolio doesn't exist, 400 when the batch is invalid
+    """
+    from firebase_admin import firestore
+
+    ref = db.collection("portfolios").document(portfolio_id)
+    log = ref.collection(LOG_COLLECTION)
+    timestamp = datetime.datetime.now()
+
+    @firestore.transactional
+    def run(transaction):
+        snapshot = ref.get(transaction=transaction)
+        if not snapshot.exists:
+            raise TradeError("Portfolio not found", status=404)
+        updates, new_cash, entries = plan_trades(snapshot.to_dict(), deltas, prices, timestamp)
+        transaction.update(ref, updates)
+        for doc_id, entry in entries.items():
+            transaction.create(log.document(doc_id), entry)
+        return new_cash
+
+    return run(db.transaction())
@@ -0,0 +1,216 @@
+import datetime
+import os
+import time
+import numpy as np
+import pandas as pd
+from trades import LOG_COLLECTION, entry_id
+
+# Compacted history (every trade up to a sequence number) of each portfolio, one document each
+CHECKPOINT_COLLECTION = "trade_checkpoints"
+# Portfolios are compacted once their log holds this many trades past the checkpoint
+COMPACT_MIN_TRADES = int(os.environ.get("COMPACT_MIN_TRADES", 50))
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+
+def parse_actions(actions):
+    """
+    Legacy `actions` map of a portfolio document as typed series.
+
+    Parameters:
+        actions: dict of ticker -> {ISO timestamp: shares}
+
+    Returns:
+        dict of ticker -> pd.Series of shares indexed by timestamp
+    """
+    return {
+        t: pd.Series(np.fromiter(a.values(), dtype=float, count=len(a)),
+                     index=pd.to_datetime(list(a), format="ISO8601"), dtype=float)
+        for t, a in actions.items() if a
+    }
+
+
+def _series(stamps, shares):
+    index = pd.DatetimeIndex(stamps)
+    if index.tz is not None:
+        # Firestore hands timestamps back in UTC; trades are recorded as naive UTC
+        index = index.tz_convert(None)
+    return pd.Series(np.asarray(shares, dtype=float), index=index, dtype=float)
+
+
+def read_log(ref, after=0, until=None):
+    """
+    Trade log entries of a portfolio in a sequence range.
+
+    Parameters:
+        ref: portfolio DocumentReference
+        after: only entries with a larger sequence number
+        until: optional last sequence number to include
+
+    Returns:
+        dict of ticker -> pd.Series of shares indexed by timestamp, tickers
+        in order of their first entry
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = ref.collection(LOG_COLLECTION).where(filter=FieldFilter("seq", ">", after))
+    if until is not None:
+        query = query.where(filter=FieldFilter("seq", "<=", until))
+    rows = {}
+    for doc in query.order_by("seq").stream():
+        entry = doc.to_dict()
+        stamps, shares = rows.setdefault(entry["ticker"], ([], []))
+        stamps.append(entry["at"])
+        shares.append(entry["shares"])
+    return {t: _series(stamps, shares) for t, (stamps, shares) in rows.items()}
+
+
+def load_checkpoint(db, portfolio_id):
+    """
+    Compacted trade history of a portfolio.
+
+    Returns:
+        dict with 'seq' (last trade folded in) and 'tickers' (ticker ->
+        pd.Series of shares indexed by timestamp), or None
+    """
+    from portfolio.snapshot import decode_series
+
+    doc = db.collection(CHECKPOINT_COLLECTION).document(portfolio_id).get()
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    return {
+        'seq': int(data['seq']),
+        'tickers': {t: decode_series(packed) for t, packed in data.get('tickers', {}).items()},
+    }
+
+
+def _merge(parts):
+    merged = {}
+    for part in parts:
+        for t, s in part.items():
+            merged[t] = pd.concat([merged[t], s]) if t in merged else s
+    return merged
+
+
+def load_actions(db, portfolio_id, data):
+    """
+    Every trade of a portfolio, as Portfolio takes them.
+
+    Merges the legacy `actions` map (until the portfolio is first
+    compacted), the checkpoint and the log entries after it, up to the
+    document's `tradeSeq`. Nothing beyond the document is read for a
+    portfolio without a checkpoint or new trades.
+
+    Parameters:
+        db: Firestore database object
+        portfolio_id: portfolio document id
+        data: the portfolio document dict, as the caller read it
+
+    Returns:
+        dict of ticker -> pd.Series of shares indexed by timestamp
+    """
+    ref = db.collection("portfolios").document(portfolio_id)
+    seq = data.get("checkpointSeq")
+    checkpoint = load_checkpoint(db, portfolio_id) if seq is not None else None
+    seq = seq or 0
+    if checkpoint is not None and checkpoint['seq'] != seq:
+        # Compacted since the caller's read: that document may still hold folded legacy actions
+        data = ref.get().to_dict()
+        seq = checkpoint['seq']
+
+    parts = [parse_actions(data.get("actions", {}))]
+    if checkpoint is not None:
+        parts.append(checkpoint['tickers'])
+    last = data.get("tradeSeq", 0)
+    if last > seq:
+        parts.append(read_log(ref, after=seq, until=last))
+    return _merge(parts)
+
+
+def compact(db, portfolio_id):
+    """
+    Fold a portfolio's legacy actions and log tail into its checkpoint.
+
+    The checkpoint and the document's `checkpointSeq` are written in one
+    batch, which also drops the legacy `actions` map. Log entries are only
+    deleted once a later compaction has moved past them, so a reader still
+    holding an older document never misses a trade; `prunedSeq` records how
+    far they are gone.
+
+    Returns:
+        number of trades in the new checkpoint (0 when nothing was folded)
+    """
+    from firebase_admin import firestore
+    from portfolio.snapshot import encode_series
+
+    ref = db.collection("portfolios").document(portfolio_id)
+    doc = ref.get()
+    if not doc.exists:
+        return 0
+    data = doc.to_dict()
+    previous = data.get("checkpointSeq", 0)
+    seq = data.get("tradeSeq", 0)
+    if seq <= previous and not data.get("actions"):
+        return 0
+
+    # Entries the current checkpoint already holds
+    log = ref.collection(LOG_COLLECTION)
+    stale = [log.document(entry_id(n)) for n in range(data.get("prunedSeq", 0) + 1, previous + 1)]
+    for i in range(0, len(stale), MAX_BATCH_WRITES):
+        batch = db.batch()
+        for entry in stale[i:i + MAX_BATCH_WRITES]:
+            batch.delete(entry)
+        batch.commit()
+
+    actions = {t: s.sort_index(kind="stable") for t, s in load_actions(db, portfolio_id, data).items()}
+    folded = int(sum(len(s) for s in actions.values()))
+    batch = db.batch()
+    batch.set(db.collection(CHECKPOINT_COLLECTION).document(portfolio_id), {
+        'seq': seq,
+        'trades': folded,
+        'compactedAt': datetime.datetime.now(),
+        'tickers': {t: encode_series(s) for t, s in actions.items()},
+    })
+    updates = {"checkpointSeq": seq, "prunedSeq": previous}
+    if "actions" in data:
+        updates["actions"] = firestore.DELETE_FIELD
+    batch.update(ref, updates)
+    batch.commit()
+    return folded
+
+
+def compact_all(db, min_trades=COMPACT_MIN_TRADES):
+    """
+    Compact every portfolio with a legacy actions map or at least
+    `min_trades` log entries past its checkpoint.
+
+    Returns:
+        dict with counts and elapsed seconds
+    """
+    started = time.perf_counter()
+    docs = db.collection("portfolios").select(["tradeSeq", "checkpointSeq", "actions"]).stream()
+    due = []
+    total = 0
+    for doc in docs:
+        data = doc.to_dict()
+        total += 1
+        if data.get("actions") or data.get("tradeSeq", 0) - data.get("checkpointSeq", 0) >= max(min_trades, 1):
+            due.append(doc.id)
+
+    failed = {}
+    folded = 0
+    for portfolio_id in due:
+        try:
+            folded += compact(db, portfolio_id)
+        except Exception as e:
+            failed[portfolio_id] = str(e)
+    stats = {
+        "portfolios": total,
+        "compacted": len(due) - len(failed),
+        "failed": failed,
+        "trades": folded,
+        "seconds": time.perf_counter() - started,
+    }
+    print(f"[INFO] Compacted {stats['compacted']}/{total} trade logs ({folded} trades)")
+    return stats
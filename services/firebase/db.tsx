@@ -132,7 +132,6 @@ export const createPortfolio = async ({
     cash: data.cash,
     initialCash: data.cash,
     shares: {},
-    actions: {},
     created: formattedDate,
   };
 
@@ -33,7 +33,9 @@ export interface Portfolio {
   created: string;
 
   shares: Record<string, number>;
-  actions: Record<string, Record<string, number>>;
+  // Legacy trade history; trades now go to the portfolios/{id}/trades log
+  actions?: Record<string, Record<string, number>>;
+  tradeSeq?: number;
 
   primaryAssetClass?: AssetClass | 'Mixed';
   dividendYield?: number;